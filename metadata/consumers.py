@@ -1,30 +1,28 @@
 # chat/consumers.py
 import json
 import asyncio
+import hashlib
+import hmac
 import logging
 import requests
 import os
 import re
+import threading
+import uuid
 
 from typing import List, Tuple
+from collections import OrderedDict
 from concurrent.futures import ThreadPoolExecutor
 from channels.generic.websocket import AsyncWebsocketConsumer
 
 from .managers.session_manager import UserSession
+from .managers.scheduler import AdmissionScheduler, SchedulerBusy
 
 from taskweaver.app.app import TaskWeaverApp
 from taskweaver.memory.attachment import AttachmentType
 
 from .event_handler import CustomSessionEventHandler
 
-
-from typing import List, Tuple
-from dataclasses import dataclass
-
-from typing import List, Tuple
-from dataclasses import dataclass
-
-import os
 from django.conf import settings
 from shutil import copyfile
 
@@ -57,15 +55,129 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # This would be a global variable, potentially in the same module as your consumer
-user_sessions = {}
+# Bounded so that missed disconnects cannot make it grow forever; the oldest entries are evicted first
+MAX_USER_SESSIONS = int(os.getenv("MAX_USER_SESSIONS", "1000"))
+user_sessions = OrderedDict()
+# Maps the chat session id to (TaskWeaver session id, owner), so that a reconnecting user gets the conversation back;
+# the owner is a hash of the token the chat was authenticated with
+ai_session_ids = OrderedDict()
 
 app_dir = "metadata/project"
 app = TaskWeaverApp(app_dir=app_dir)  # Initialize your AI app
 
 
-executor = ThreadPoolExecutor()
+# Bounded pool for the blocking TaskWeaver calls (session creation, suspension);
+# chat rounds run as coroutines on the event loop, see handle_ai_response
+executor = ThreadPoolExecutor(max_workers=int(os.getenv("AI_EXECUTOR_WORKERS", "16")))
+
+# Admission control for the AI work, so that a single heavy user or datasource cannot starve the others
+scheduler = AdmissionScheduler(
+    max_concurrent=int(os.getenv("MAX_CONCURRENT_AI_REQUESTS", "16")),
+    max_per_tenant={
+        "user": int(os.getenv("MAX_AI_REQUESTS_PER_USER", "2")),
+        "datasource": int(os.getenv("MAX_AI_REQUESTS_PER_DATASOURCE", "8")),
+    },
+    max_queue=int(os.getenv("MAX_PENDING_AI_REQUESTS", "100")),
+    max_wait=float(os.getenv("MAX_AI_QUEUE_WAIT_SECONDS", "120")),
+)
+# Messages are bucketed by length so that short questions are admitted before long ones
+SHORT_REQUEST_CHARS = 200
+
+
+def estimate_request_cost(message):
+    return len(message or "") // SHORT_REQUEST_CHARS
+
+
+def get_session_owner(auth_token):
+    return hashlib.sha256(auth_token.encode("utf-8")).hexdigest()
+
+
+def get_ai_session():
+    # The chat session id comes from the client, so a new connection always starts with a new session;
+    # the previous one is only resumed once the user is authenticated as its owner
+    return app.get_session()
+
+
+def get_owned_ai_session_id(session_id, owner):
+    entry = ai_session_ids.get(session_id)
+    if entry is None or not hmac.compare_digest(entry[1], owner):
+        return None
+    return entry[0]
+
+
+def resume_ai_session(ai_session_id):
+    # Resume a TaskWeaver session if it is still alive or has a snapshot
+    try:
+        return app.get_session(ai_session_id)
+    except Exception:
+        logger.info(f"AI session {ai_session_id} cannot be resumed, keeping the new one")
+        return None
+
+
+def stop_ai_session(ai_client):
+    app.session_manager.stop_session(ai_client.session_id)
+
+
+def suspend_ai_session(ai_client):
+    # Stops the kernel and removes the session from the TaskWeaver store (snapshotting it if enabled)
+    app.session_manager.suspend_session(ai_client.session_id)
 
 
+def register_user_session(user_session):
+    user_sessions[user_session.session_id] = user_session
+    user_sessions.move_to_end(user_session.session_id)
+
+    while len(user_sessions) > MAX_USER_SESSIONS:
+        _, evicted = user_sessions.popitem(last=False)
+        logger.warning(f"Evicting stale session {evicted.session_id}")
+        executor.submit(suspend_ai_session, evicted.ai_client)
+
+
+def remember_ai_session(session_id, ai_session_id, owner):
+    ai_session_ids[session_id] = (ai_session_id, owner)
+    ai_session_ids.move_to_end(session_id)
+    while len(ai_session_ids) > MAX_USER_SESSIONS:
+        ai_session_ids.popitem(last=False)
+
+
+
+# The version of a datasource is the validator of its metadata, so that TaskWeaver drops the cached answers
+# of a datasource whose metadata has changed; maps the datasource id to (ETag, Last-Modified, version)
+datasource_versions = OrderedDict()
+datasource_versions_lock = threading.Lock()
+
+
+def get_datasource_version(datasource_id):
+    url = f"http://{os.getenv('API_HOST', '192.168.1.47')}:{os.getenv('API_PORT', '8000')}/api/metadata/fetch/{datasource_id}/"
+    with datasource_versions_lock:
+        cached = datasource_versions.get(str(datasource_id))
+
+    # Revalidate the known version with a conditional request, so an unchanged metadata is not downloaded again
+    headers = {}
+    if cached is not None and cached[0]:
+        headers["If-None-Match"] = cached[0]
+    if cached is not None and cached[1]:
+        headers["If-Modified-Since"] = cached[1]
+    try:
+        response = requests.get(url, headers=headers, timeout=(5, 30))
+        if response.status_code == 304 and cached is not None:
+            return cached[2]
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"Failed to get the metadata version of datasource {datasource_id}: {e}")
+        # A version that matches nothing, so no answer is served for a datasource in an unknown state
+        return f"unavailable:{uuid.uuid4().hex}"
+
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    version = etag or last_modified or hashlib.sha256(response.content).hexdigest()
+    with datasource_versions_lock:
+        datasource_versions[str(datasource_id)] = (etag, last_modified, version)
+        datasource_versions.move_to_end(str(datasource_id))
+        while len(datasource_versions) > MAX_USER_SESSIONS:
+            datasource_versions.popitem(last=False)
+    return version
+
 
 def is_link_clickable(url: str):
     if url:
@@ -140,31 +252,40 @@ class ChatAIConsumer(AsyncWebsocketConsumer):
         await self.accept()
 
         # Asynchronously create an AI session to avoid blocking the WebSocket connection
-        ai_client = await asyncio.get_event_loop().run_in_executor(executor, app.get_session)
-        
-        user_sessions[self.session_id] = UserSession(
+        try:
+            async with scheduler.admit(self.get_tenants(), on_queued=self.send_queued):
+                ai_client = await asyncio.get_event_loop().run_in_executor(executor, get_ai_session)
+        except SchedulerBusy:
+            logger.warning(f"Server busy, rejecting connection for session_id={self.session_id}")
+            await self.send_busy()
+            # 1013: try again later
+            await self.close(code=1013)
+            return
+
+        self.user_session = UserSession(
             session_id=self.session_id, 
             auth_token=None,  # Token will be set after authentication
             datasource_id=self.datasource_id, 
             ai_client=ai_client
         )
-
-        self.user_session = user_sessions[self.session_id]
+        register_user_session(self.user_session)
 
         # Create a new AI session and store it in the user_sessions dictionary
         self.event_handler = CustomSessionEventHandler(self.user_session)
         asyncio.create_task(self.process_message_queue())
         
-        user_sessions[self.session_id].ai_client.update_session_var(variables = {"datasource_id": self.datasource_id})
+        self.user_session.ai_client.update_session_var(variables = {"datasource_id": self.datasource_id})
 
         logger.info(f"WebSocket connection accepted and AI session created for session_id={self.session_id}")
 
 
     async def disconnect(self, close_code):
-        # Handle cleanup on disconnect
-        session = user_sessions.pop(self.session_id, None)
-        if session:
-            session.ai_client.stop()  # Ensure session cleanup
+        # Handle cleanup on disconnect, unless another connection has taken over this chat session id since
+        session = getattr(self, "user_session", None)
+        if session is not None and user_sessions.get(self.session_id) is session:
+            user_sessions.pop(self.session_id)
+            # Ensure session cleanup
+            await asyncio.get_event_loop().run_in_executor(executor, suspend_ai_session, session.ai_client)
             logger.info(f"Session {self.session_id} disconnected and cleaned up")
         
     async def receive(self, text_data):
@@ -186,12 +307,29 @@ class ChatAIConsumer(AsyncWebsocketConsumer):
                 await self.close(code=4001)
                 return
             
-            # Update the auth token in the user session
-            user_sessions[session_id].auth_token = auth_token
-            
+            # Update the auth token in the session of this connection
+            user_session = getattr(self, "user_session", None)
+            if user_session is None:
+                await self.send(text_data=json.dumps({"error": "Session not found"}))
+                return
+            user_session.auth_token = auth_token
+            owner = get_session_owner(auth_token)
+
+            # Give the user the conversation of this chat back, but only if it was started by the same user
+            previous_ai_session_id = get_owned_ai_session_id(session_id, owner)
+            if previous_ai_session_id is not None and previous_ai_session_id != user_session.ai_client.session_id:
+                resumed = await asyncio.get_event_loop().run_in_executor(
+                    executor, resume_ai_session, previous_ai_session_id
+                )
+                if resumed is not None:
+                    new_ai_client = user_session.ai_client
+                    user_session.ai_client = resumed
+                    resumed.update_session_var(variables = {"datasource_id": datasource_id})
+                    executor.submit(stop_ai_session, new_ai_client)
+                    logger.info(f"Resumed AI session {previous_ai_session_id} for session_id={session_id}")
 
-            
-            user_sessions[session_id].ai_client.update_session_var(variables = {"auth_token": auth_token})
+            user_session.ai_client.update_session_var(variables = {"auth_token": auth_token})
+            remember_ai_session(session_id, user_session.ai_client.session_id, owner)
 
 
             logger.info(f"User authenticated successfully for session_id={session_id} and ds id {datasource_id}")
@@ -202,10 +340,20 @@ class ChatAIConsumer(AsyncWebsocketConsumer):
             
             # Handle other message types, such as AI chat messages
             message = text_data_json.get("message")
-            session = user_sessions.get(self.session_id)
+            session = getattr(self, "user_session", None)
             if session and session.ai_client:
                 # Use the session's AI client to handle the message and get a response
-                response_round = await self.handle_ai_response(message, session.ai_client)
+                try:
+                    async with scheduler.admit(
+                        self.get_tenants(),
+                        cost=estimate_request_cost(message),
+                        on_queued=self.send_queued,
+                    ):
+                        response_round = await self.handle_ai_response(message, session.ai_client)
+                except SchedulerBusy:
+                    logger.warning(f"Server busy, rejecting message for session_id={self.session_id}")
+                    await self.send_busy()
+                    return
 
                 final_response = self.handle_response_round(session.ai_client, response_round)
                 await self.send(text_data=json.dumps(final_response))
@@ -265,10 +413,33 @@ class ChatAIConsumer(AsyncWebsocketConsumer):
             }
             return final_response
 
+    def get_tenants(self):
+        session = getattr(self, "user_session", None)
+        user = session.auth_token if session is not None and session.auth_token else self.session_id
+        return (("user", user), ("datasource", str(self.datasource_id)))
+
+    async def send_queued(self, position):
+        # Back-pressure: tell the client that the request is waiting for a free worker
+        await self.send(text_data=json.dumps({
+            "type": "queued",
+            "position": position,
+            "message": f"The assistant is busy, your request is queued at position {position}",
+        }))
+
+    async def send_busy(self):
+        await self.send(text_data=json.dumps({
+            "type": "busy",
+            "error": "The assistant is busy, please try again later",
+        }))
+
     async def handle_ai_response(self, message, ai_client):
-        response_round = await asyncio.get_event_loop().run_in_executor(
-            executor, ai_client.send_message, message, self.event_handler
-        )
+        # The answers cached by TaskWeaver are keyed by the datasource version, refresh it before every round
+        version = await asyncio.get_event_loop().run_in_executor(executor, get_datasource_version, self.datasource_id)
+        ai_client.update_session_var(variables = {"datasource_version": version})
+
+        # The round runs on this event loop: the LLM responses are streamed and the code is executed without
+        # holding a thread, and the events are delivered here
+        response_round = await ai_client.send_message_async(message, self.event_handler)
         logger.info(f"Message processed and response sent for session_id={self.session_id}")
         return response_round
 
@@ -0,0 +1,137 @@
+import asyncio
+import heapq
+import itertools
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+class SchedulerBusy(Exception):
+    """Raised when the waiting queue is full, or a request waited too long, and it cannot be admitted."""
+
+
+@dataclass(order=True)
+class Ticket:
+    # lower cost is served first, the sequence number keeps the order fair among equal costs
+    cost: int
+    seq: int
+    tenants: Tuple[Tuple[str, str], ...] = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+
+class AdmissionScheduler:
+    """
+    Admission control in front of the AI workers.
+
+    At most `max_concurrent` requests run at the same time. A tenant is a (kind, id) pair, e.g.
+    ("user", token) or ("datasource", "42"), and `max_per_tenant` limits how many requests of a
+    single tenant of each kind run at the same time. Requests that cannot run yet wait in a
+    bounded queue ordered by their estimated cost, so short requests are not stuck behind heavy ones,
+    and give up after `max_wait` seconds if it is set.
+    All methods must be called from the event loop thread.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int,
+        max_per_tenant: Dict[str, int],
+        max_queue: int,
+        max_wait: Optional[float] = None,
+    ):
+        assert max_concurrent > 0 and max_queue >= 0
+        assert all(limit > 0 for limit in max_per_tenant.values())
+        assert max_wait is None or max_wait > 0
+        self.max_concurrent = max_concurrent
+        self.max_per_tenant = max_per_tenant
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+
+        self._waiting: List[Ticket] = []
+        self._running = 0
+        self._running_per_tenant: Dict[Tuple[str, str], int] = {}
+        self._seq = itertools.count()
+
+    def queue_size(self) -> int:
+        return len(self._waiting)
+
+    def running(self) -> int:
+        return self._running
+
+    def position(self, ticket: Ticket) -> int:
+        """The 1-based position of a waiting ticket in the queue."""
+        return sum(1 for t in self._waiting if t < ticket) + 1
+
+    @asynccontextmanager
+    async def admit(
+        self,
+        tenants: Tuple[Tuple[str, str], ...],
+        cost: int = 0,
+        on_queued: Optional[Callable[[int], Awaitable[None]]] = None,
+    ):
+        """
+        Wait until the request is allowed to run and hold its slot while the context is active.
+        :param tenants: The (kind, id) tenants the request is accounted to.
+        :param cost: The estimated cost of the request, cheaper requests are admitted first.
+        :param on_queued: Called with the queue position if the request has to wait.
+        :raises SchedulerBusy: If the request has to wait and the queue is full, or it waited `max_wait` seconds.
+        """
+        ticket = Ticket(cost, next(self._seq), tenants, asyncio.get_running_loop().create_future())
+        if not self._can_run(ticket):
+            if len(self._waiting) >= self.max_queue:
+                raise SchedulerBusy(f"Too many pending requests ({len(self._waiting)})")
+            heapq.heappush(self._waiting, ticket)
+            try:
+                if on_queued is not None:
+                    await on_queued(self.position(ticket))
+                await asyncio.wait_for(ticket.future, self.max_wait)
+            except BaseException as e:
+                if ticket.future.done() and not ticket.future.cancelled():
+                    # the slot was granted just as we stopped waiting, hand it over to the next one
+                    self._release(ticket)
+                else:
+                    self._waiting.remove(ticket)
+                    heapq.heapify(self._waiting)
+                if isinstance(e, asyncio.TimeoutError):
+                    raise SchedulerBusy(f"Request not admitted within {self.max_wait} seconds") from None
+                raise
+        else:
+            self._acquire(ticket)
+
+        try:
+            yield
+        finally:
+            self._release(ticket)
+
+    def _can_run(self, ticket: Ticket) -> bool:
+        if self._running >= self.max_concurrent:
+            return False
+        return all(
+            self._running_per_tenant.get(t, 0) < self.max_per_tenant.get(t[0], self.max_concurrent)
+            for t in ticket.tenants
+        )
+
+    def _acquire(self, ticket: Ticket) -> None:
+        self._running += 1
+        for t in ticket.tenants:
+            self._running_per_tenant[t] = self._running_per_tenant.get(t, 0) + 1
+
+    def _release(self, ticket: Ticket) -> None:
+        self._running -= 1
+        for t in ticket.tenants:
+            count = self._running_per_tenant[t] - 1
+            if count == 0:
+                del self._running_per_tenant[t]
+            else:
+                self._running_per_tenant[t] = count
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        # admit waiting tickets in priority order, skipping those whose tenants are at their limit
+        for ticket in sorted(self._waiting):
+            if self._running >= self.max_concurrent:
+                break
+            if self._can_run(ticket):
+                self._waiting.remove(ticket)
+                self._acquire(ticket)
+                ticket.future.set_result(None)
+        heapq.heapify(self._waiting)
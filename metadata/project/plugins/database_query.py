@@ -2,43 +2,339 @@ import requests
 from taskweaver.plugin import Plugin, register_plugin
 
 from dotenv import load_dotenv
-import os 
+import hashlib
+import json
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple
 load_dotenv()
 
 # Retrieve environment variables
 API_HOST = os.getenv("API_HOST", "192.168.1.47")
 API_PORT = os.getenv("API_PORT", "8000")
 
+
+_SQL_TOKEN = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|`[^`]*`|--[^\n]*|/\*.*?\*/|\s+|[\w$.]+|.", re.S)
+
+
+def tokenize_sql(query: str) -> List[str]:
+    """Split the SQL into quoted literals/identifiers, comments, whitespace, words and single punctuation characters."""
+    return _SQL_TOKEN.findall(query)
+
+
+def normalize_sql(query: str) -> str:
+    """Collapse the whitespace and drop the comments and the trailing semicolons outside of the quoted literals."""
+    normalized: List[str] = []
+    for token in tokenize_sql(query):
+        if token.startswith("--") or token.startswith("/*") or token.isspace():
+            if len(normalized) > 0 and normalized[-1] != " ":
+                normalized.append(" ")
+        else:
+            # the case is kept, as identifiers are case sensitive in some databases
+            normalized.append(token)
+    return re.sub(r"[;\s]+$", "", "".join(normalized)).strip()
+
+
+def parse_statement(query: str) -> Optional[Tuple[List[str], List[Tuple[int, str]]]]:
+    """
+    Tokenize a normalized statement and find its words at the top level, outside of the parentheses.
+    :return: The tokens and the (token index, lowercase word) pairs at the top level, None if there is more than one statement.
+    """
+    tokens = tokenize_sql(normalize_sql(query))
+    depth = 0
+    top_level: List[Tuple[int, str]] = []
+    for i, token in enumerate(tokens):
+        if token.isspace():
+            continue
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth -= 1
+        elif depth == 0:
+            if token == ";":
+                return None
+            top_level.append((i, token.lower()))
+    return tokens, top_level
+
+
+def is_pageable(query: str) -> bool:
+    """
+    Whether the rows of a query can be fetched page by page with LIMIT/OFFSET: the pages only follow each other
+    if the rows come in the same order for every page, so the query must have a top-level ORDER BY
+    (over a unique key, which cannot be checked here) and no LIMIT/OFFSET/FETCH of its own.
+    """
+    parsed = parse_statement(query)
+    if parsed is None:
+        return False
+    top_words = [w for _, w in parsed[1]]
+    if len(top_words) == 0 or top_words[0] not in ("select", "with"):
+        return False
+    has_order_by = any(w == "order" and top_words[pos + 1 : pos + 2] == ["by"] for pos, w in enumerate(top_words))
+    return has_order_by and not any(w in ("limit", "offset", "fetch") for w in top_words)
+
+
+# the read-only statements start with one of these keywords,
+_READ_ONLY_KEYWORDS = {"select", "with", "show", "describe", "desc", "explain"}
+# and have none of these anywhere outside of the literals, e.g., WITH ... DELETE, SELECT ... INTO,
+# SELECT ... FOR UPDATE or EXPLAIN ANALYZE, which runs the statement
+_WRITE_KEYWORDS = {
+    "insert", "update", "delete", "merge", "upsert", "into", "returning",
+    "create", "alter", "drop", "truncate", "grant", "revoke", "call", "exec", "execute", "copy",
+    "lock", "analyze", "analyse", "nextval", "setval",
+}
+
+
+def is_read_only(query: str) -> bool:
+    """Whether the query is a single statement that does not change the data or the schema."""
+    parsed = parse_statement(query)
+    if parsed is None:
+        return False
+    tokens, top_level = parsed
+    if len(top_level) == 0 or top_level[0][1] not in _READ_ONLY_KEYWORDS:
+        return False
+    # the quoted literals and identifiers are single tokens, so they never match a keyword
+    return not any(token.lower() in _WRITE_KEYWORDS for token in tokens)
+
+
+class _QueryError(Exception):
+    pass
+
+
+class QueryResultCache:
+    """
+    A file cache of the query results keyed by the datasource and the normalized SQL.
+    The records are stored as JSON, which keeps them exactly as returned by the API,
+    and the DataFrames as Parquet (pickle if pyarrow is not installed).
+    Entries expire after `ttl` seconds, and the least recently used ones are removed beyond `max_bytes`.
+    """
+
+    def __init__(self, cache_dir: str, ttl: float, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+    @classmethod
+    def is_cacheable(cls, normalized_query: str) -> bool:
+        # only the statements that do not change the data are cached
+        return is_read_only(normalized_query)
+
+    def _get_path(self, datasource_id: str, normalized_query: str, kind: str) -> str:
+        key = hashlib.sha256(f"{datasource_id}\n{normalized_query}".encode("utf-8")).hexdigest()
+        extension = "json" if kind == "records" else "parquet" if _has_pyarrow() else "pkl"
+        return os.path.join(self.cache_dir, f"{key}.{kind}.{extension}")
+
+    def get(self, datasource_id: str, normalized_query: str, kind: str) -> Tuple[bool, Any]:
+        path = self._get_path(datasource_id, normalized_query, kind)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return False, None
+        if self.ttl > 0 and time.time() - mtime > self.ttl:
+            return False, None
+        try:
+            if path.endswith(".json"):
+                with open(path, "r", encoding="utf-8") as f:
+                    value = json.load(f)
+            else:
+                import pandas as pd
+
+                value = pd.read_parquet(path) if path.endswith(".parquet") else pd.read_pickle(path)
+        except Exception:
+            return False, None
+        # the access time orders the entries for the eviction
+        os.utime(path, (time.time(), mtime))
+        return True, value
+
+    def set(self, datasource_id: str, normalized_query: str, kind: str, value: Any) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._get_path(datasource_id, normalized_query, kind)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            if path.endswith(".json"):
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(value, f)
+            elif path.endswith(".parquet"):
+                value.to_parquet(tmp_path, index=False)
+            else:
+                value.to_pickle(tmp_path)
+            # replaced atomically, as the cache may be shared by the sessions
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self._evict()
+
+    def _evict(self) -> None:
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".tmp"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            entries.append((stat.st_atime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+            total -= size
+
+
+def rewrite_exploratory_query(query: str, limit: int, sample_percent: float = 0) -> Tuple[Optional[str], bool]:
+    """
+    Rewrite a read-only SELECT statement to return at most `limit` rows: the row count of an existing top-level
+    LIMIT (`LIMIT n`, `LIMIT ALL`, `LIMIT offset, n`) or FETCH FIRST clause is lowered, otherwise a LIMIT clause is
+    added at the top level. With `sample_percent`, a query over a single table also samples the table with
+    TABLESAMPLE SYSTEM.
+    :return: The rewritten query, None if it is not a single read-only SELECT statement or its row count
+        is not a number, and whether the table is sampled.
+    """
+    if not is_read_only(query):
+        return None, False
+    parsed = parse_statement(query)
+    assert parsed is not None
+    tokens, top_level = parsed
+    if top_level[0][1] not in ("select", "with"):
+        return None, False
+
+    sampled = False
+    if sample_percent > 0 and top_level[0][1] == "select":
+        sampled = _add_table_sample(tokens, top_level, sample_percent)
+
+    top_words = [w for _, w in top_level]
+
+    def lower_count(pos: int) -> bool:
+        # lower the row count at top_level[pos] if it is a number
+        if not top_words[pos].isdigit():
+            return False
+        j = top_level[pos][0]
+        tokens[j] = str(min(int(tokens[j]), limit))
+        return True
+
+    if "limit" in top_words:
+        pos = top_words.index("limit") + 1
+        following = top_words[pos : pos + 4]
+        if following[:1] == ["all"]:
+            # LIMIT ALL [OFFSET m]
+            tokens[top_level[pos][0]] = str(limit)
+        elif len(following) >= 3 and following[1] == ",":
+            # MySQL LIMIT offset, count
+            if not following[0].isdigit() or not lower_count(pos + 2) or len(following) > 3:
+                return None, sampled
+        elif len(following) == 0 or not lower_count(pos) or following[1:2] not in ([], ["offset"]):
+            # a parameter or an expression, which cannot be lowered
+            return None, sampled
+        return "".join(tokens), sampled
+
+    if "fetch" in top_words:
+        # [OFFSET m ROWS] FETCH FIRST|NEXT [n] ROW|ROWS ONLY|WITH TIES, a LIMIT cannot be added to it
+        pos = top_words.index("fetch") + 1
+        if top_words[pos : pos + 1] not in (["first"], ["next"]) or pos + 1 >= len(top_words):
+            return None, sampled
+        if top_words[pos + 1] in ("row", "rows"):
+            # FETCH FIRST ROW ONLY is a single row
+            return "".join(tokens), sampled
+        if not lower_count(pos + 1):
+            return None, sampled
+        return "".join(tokens), sampled
+
+    if "offset" in top_words:
+        pos = top_words.index("offset") + 1
+        if top_words[pos + 1 : pos + 2] in (["row"], ["rows"]):
+            # the standard OFFSET m ROWS is followed by a FETCH clause, not by a LIMIT
+            return f"{''.join(tokens)} FETCH NEXT {limit} ROWS ONLY", sampled
+    return f"{''.join(tokens)} LIMIT {limit}", sampled
+
+
+def _add_table_sample(tokens: List[str], top_level: List[Tuple[int, str]], sample_percent: float) -> bool:
+    # only "SELECT ... FROM table [WHERE ...|GROUP BY ...|ORDER BY ...|LIMIT ...]", without joins, aliases or subqueries
+    top_words = [w for _, w in top_level]
+    if "from" not in top_words:
+        return False
+    pos = top_words.index("from")
+    if any(w in ("join", ",", "union", "intersect", "except") for w in top_words[pos:]):
+        return False
+    following = [i for i in range(top_level[pos][0] + 1, len(tokens)) if not tokens[i].isspace()]
+    if pos + 1 >= len(top_level) or len(following) == 0 or following[0] != top_level[pos + 1][0]:
+        return False
+    i = top_level[pos + 1][0]
+    if not re.fullmatch(r"[\w$.]+|\"[^\"]+\"|`[^`]+`", tokens[i]):
+        return False
+    if pos + 2 < len(top_level) and top_level[pos + 2][1] not in ("where", "group", "order", "limit"):
+        return False
+    tokens[i] = f"{tokens[i]} TABLESAMPLE SYSTEM ({sample_percent:g})"
+    return True
+
+
+def _has_pyarrow() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+
+        return True
+    except ImportError:
+        return False
+
+
 @register_plugin
 class DatabaseQueryPlugin(Plugin):
-    def __call__(self, query: str):
+    def __call__(self, query: str, stream: bool = False, explore: bool = False):
         """
         Executes a query on a specific datasource using its datasource ID.
 
         :param datasource_id: The ID of the datasource to run the query on.
         :param query: The SQL query to execute.
+        :param stream: Whether to fetch the results page by page into a pandas DataFrame.
+            If the results exceed `max_memory_rows`, they are written to a Parquet file instead and its path is returned.
+        :param explore: Whether to only fetch a limited sample of the results to inspect the data.
         :return: A tuple containing the query results and a description string.
         """
 
         datasource_id = self.ctx.get_session_var("datasource_id")
         if datasource_id is None:
             raise ValueError("No datasource ID found in session.")
-        
-        url = f"http://{API_HOST}:{API_PORT}/api/datasources/query/"
-        
-        data = {
-            "data_source_id": datasource_id,
-            "query": query
-        }
+
+        if explore:
+            return self.explore_query(datasource_id, query)
+        return self.run_query(datasource_id, query, stream)
+
+    def run_query(self, datasource_id: str, query: str, stream: bool = False):
+        normalized_query = normalize_sql(query)
+        cache = self.get_result_cache(str(datasource_id))
+        kind = "df" if stream else "records"
+        if cache is not None and QueryResultCache.is_cacheable(normalized_query):
+            hit, cached_results = cache.get(str(datasource_id), normalized_query, kind)
+            if hit:
+                description = f"Query executed successfully on datasource ID {datasource_id} (cached result)."
+                return cached_results, description
+        else:
+            cache = None
+
+        if stream:
+            try:
+                query_results, description = self.stream_query(datasource_id, query)
+            except requests.exceptions.RequestException as e:
+                description = f"An error occurred while executing the query on datasource ID {datasource_id}. Error: {str(e)}"
+                return None, description
+            # the results spilled to a file are not cached
+            if cache is not None and query_results is not None and not isinstance(query_results, str):
+                cache.set(str(datasource_id), normalized_query, kind, query_results)
+            return query_results, description
 
         try:
-            response = requests.post(url, json=data)
-            response.raise_for_status()
-            result = response.json()
+            result = self.post_query(datasource_id, query)
 
             if result["status"] == "success":
                 query_results = result["data"]
                 description = f"Query executed successfully on datasource ID {datasource_id}."
+                if cache is not None:
+                    cache.set(str(datasource_id), normalized_query, kind, query_results)
             else:
                 query_results = None
                 description = f"Failed to execute query on datasource ID {datasource_id}. Message: {result['message']}"
@@ -46,4 +342,214 @@ class DatabaseQueryPlugin(Plugin):
             query_results = None
             description = f"An error occurred while executing the query on datasource ID {datasource_id}. Error: {str(e)}"
 
-        return query_results, description
\ No newline at end of file
+        return query_results, description
+
+    def explore_query(self, datasource_id: str, query: str):
+        """
+        Run the query rewritten to return at most `explore_limit` rows, together with an estimate of the total number
+        of rows, so that the full result is only fetched when it is needed.
+        """
+        limit = int(self.config.get("explore_limit", 100))
+        sample_percent = float(self.config.get("explore_sample_percent", 0))
+        # one more row is fetched to tell if the result is truncated
+        rewritten_query, sampled = rewrite_exploratory_query(query, limit + 1, sample_percent)
+
+        rows, description = self.run_query(datasource_id, rewritten_query or query)
+        if rows is None:
+            return None, description
+
+        truncated = len(rows) > limit
+        rows = rows[:limit]
+        row_count_estimate = self.estimate_row_count(datasource_id, query) if truncated or sampled else len(rows)
+        results = {
+            "rows": rows,
+            "truncated": truncated,
+            "sampled": sampled,
+            "row_count_estimate": row_count_estimate,
+        }
+
+        description = f"Query executed successfully on datasource ID {datasource_id}, {len(rows)} rows returned"
+        if sampled:
+            description += f" from a {sample_percent:g}% sample of the table"
+        if truncated:
+            description += f", truncated to the exploration limit of {limit} rows"
+        if row_count_estimate is not None and (truncated or sampled):
+            description += f", about {row_count_estimate} rows in the full result"
+        description += "."
+        if truncated or sampled:
+            description += " Run the query with explore=False to fetch the full result."
+        return results, description
+
+    def estimate_row_count(self, datasource_id: str, query: str) -> Optional[int]:
+        """
+        Estimate the number of rows of the query: from the planner estimate of EXPLAIN (FORMAT JSON) by default,
+        or by counting the rows with `row_count_estimate: count`. None if it cannot be estimated.
+        """
+        mode = self.config.get("row_count_estimate", "explain")
+        base_query = normalize_sql(query)
+        try:
+            if mode == "explain":
+                rows, _ = self.run_query(datasource_id, f"EXPLAIN (FORMAT JSON) {base_query}")
+                plan = list(rows[0].values())[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                return int(plan[0]["Plan"]["Plan Rows"])
+            if mode == "count":
+                rows, _ = self.run_query(
+                    datasource_id,
+                    f"SELECT COUNT(*) AS row_count FROM ({base_query}) AS counted_query",
+                )
+                return int(list(rows[0].values())[0])
+        except Exception:
+            pass
+        return None
+
+    def get_result_cache(self, datasource_id: str) -> Optional[QueryResultCache]:
+        """
+        Get the result cache of the datasource: in the session cwd by default,
+        or in `shared_cache_dir` for the read-only datasources listed in `shared_datasources`.
+        """
+        ttl = float(self.config.get("cache_ttl", 600))
+        if ttl == 0:
+            return None
+        max_bytes = int(self.config.get("cache_max_bytes", 512 * 1024 * 1024))
+        shared_cache_dir = self.config.get("shared_cache_dir") or ""
+        shared_datasources = [str(d) for d in self.config.get("shared_datasources") or []]
+        if shared_cache_dir != "" and datasource_id in shared_datasources:
+            return QueryResultCache(shared_cache_dir, ttl, max_bytes)
+        # the kernel runs in the session cwd
+        return QueryResultCache(os.path.join(os.getcwd(), ".query_cache"), ttl, max_bytes)
+
+    def post_query(self, datasource_id: str, query: str) -> Dict[str, Any]:
+        url = f"http://{API_HOST}:{API_PORT}/api/datasources/query/"
+
+        data = {
+            "data_source_id": datasource_id,
+            "query": query
+        }
+
+        session = self.ctx.get_http_session(
+            timeout=(5, float(self.config.get("request_timeout", 300))),
+            retries=int(self.config.get("max_retries", 3)),
+        )
+        response = session.post(url, json=data)
+        response.raise_for_status()
+        return response.json()
+
+    def stream_query(self, datasource_id: str, query: str):
+        """
+        Fetch the results in pages and build a DataFrame page by page. The query is only paged with LIMIT/OFFSET if it
+        orders its rows (see `is_pageable`), otherwise the pages would not follow each other and rows could be repeated
+        or skipped; it is then fetched in a single request.
+        Once more than `max_memory_rows` rows are fetched, the pages are appended to a file in the session cwd
+        (Parquet if pyarrow is installed, CSV otherwise), so the kernel only holds one page at a time.
+        """
+        import pandas as pd
+
+        page_size = int(self.config.get("page_size", 10000))
+        max_memory_rows = int(self.config.get("max_memory_rows", 1000000))
+        # the comments are dropped, as a trailing one would comment out the LIMIT/OFFSET clause
+        base_query = normalize_sql(query)
+        pageable = is_pageable(base_query)
+
+        def fetch_pages():
+            offset = 0
+            while True:
+                page_query = f"{base_query} LIMIT {page_size} OFFSET {offset}" if pageable else base_query
+                result = self.post_query(datasource_id, page_query)
+                if result["status"] != "success":
+                    raise _QueryError(result["message"])
+                records = result["data"]
+                if not pageable:
+                    # the whole result in one response, still converted page by page so that it can be spilled
+                    for start in range(0, len(records), page_size):
+                        yield records[start : start + page_size]
+                    return
+                yield records
+                # a short page is the last one
+                if len(records) < page_size:
+                    return
+                offset += page_size
+
+        frames: List[pd.DataFrame] = []
+        writer: Optional[_SpillWriter] = None
+        num_rows = 0
+        try:
+            for records in fetch_pages():
+                page = pd.DataFrame.from_records(records)
+                num_rows += len(page)
+                if writer is None and num_rows > max_memory_rows:
+                    writer = _SpillWriter(self.ctx, f"query_results_{datasource_id}")
+                    for frame in frames:
+                        writer.write(frame)
+                    frames = []
+                if writer is not None:
+                    writer.write(page)
+                else:
+                    frames.append(page)
+        except _QueryError as e:
+            if writer is not None:
+                writer.close()
+            return None, f"Failed to execute query on datasource ID {datasource_id}. Message: {e}"
+
+        hint = ""
+        if not pageable and num_rows > page_size:
+            hint = " Add an ORDER BY over a unique key to the query to fetch large results page by page."
+
+        if writer is not None:
+            path = writer.close()
+            description = (
+                f"Query executed successfully on datasource ID {datasource_id}. "
+                f"The {num_rows} rows exceed the memory limit and were written to {path}, "
+                f"read it in chunks or by columns.{hint}"
+            )
+            return path, description
+
+        if len(frames) == 0:
+            df = pd.DataFrame()
+        else:
+            df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+        description = f"Query executed successfully on datasource ID {datasource_id}, {num_rows} rows fetched.{hint}"
+        return df, description
+
+
+class _SpillWriter:
+    def __init__(self, ctx: Any, name: str):
+        try:
+            import pyarrow.parquet as pq  # noqa: F401
+
+            self.format = "parquet"
+        except ImportError:
+            self.format = "csv"
+        _, self.path = ctx.create_artifact_path(
+            name=name,
+            file_name=f"{name}.{self.format}",
+            type="file",
+            desc=f"Query results in {self.format} format",
+        )
+        self.parquet_writer = None
+        self.schema = None
+        self.header_written = False
+
+    def write(self, frame: Any) -> None:
+        if len(frame) == 0:
+            return
+        if self.format == "csv":
+            frame.to_csv(self.path, mode="a", header=not self.header_written, index=False)
+            self.header_written = True
+            return
+
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        # the schema is fixed by the first page, the following pages are cast to it
+        table = pa.Table.from_pandas(frame, schema=self.schema, preserve_index=False)
+        if self.parquet_writer is None:
+            self.schema = table.schema
+            self.parquet_writer = pq.ParquetWriter(self.path, self.schema)
+        self.parquet_writer.write_table(table)
+
+    def close(self) -> str:
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+        return self.path
@@ -2,7 +2,12 @@ import requests
 from taskweaver.plugin import Plugin, register_plugin
 
 from dotenv import load_dotenv
-import os 
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
 load_dotenv()
 
 
@@ -10,6 +15,102 @@ load_dotenv()
 API_HOST = os.getenv("API_HOST", "192.168.1.47")
 API_PORT = os.getenv("API_PORT", "8000")
 
+# the number of seconds Redis is skipped after a failure, so an unreachable server does not slow every call
+REDIS_RETRY_INTERVAL = 30
+
+
+class MetadataCache:
+    """
+    Datasource metadata cached in two levels: an LRU in the memory of this process and, if enabled, Redis.
+    The plugins run in the kernel of their session, so the in-memory LRU only serves the calls of one session;
+    the metadata is shared across sessions and processes through Redis.
+    An entry holds the raw response body with its ETag/Last-Modified validators, so an expired entry
+    can be revalidated with a conditional request instead of downloading the metadata again.
+    """
+
+    def __init__(self, size: int, use_redis: bool, redis_expire: int):
+        self.size = size
+        self.redis_expire = redis_expire
+        self.entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.redis = None
+        self.redis_disabled_until = 0.0
+        if use_redis:
+            try:
+                import redis
+
+                self.redis = redis.Redis(
+                    host=os.getenv("REDIS_HOST", "localhost"),
+                    port=int(os.getenv("REDIS_PORT", "6379")),
+                    socket_timeout=1,
+                )
+            except ImportError:
+                pass
+
+    @staticmethod
+    def _redis_key(datasource_id: str) -> str:
+        return f"dq_llm:metadata:{datasource_id}"
+
+    def get(self, datasource_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            entry = self.entries.get(datasource_id)
+            if entry is not None:
+                self.entries.move_to_end(datasource_id)
+                return entry
+
+        if self._redis_available():
+            try:
+                value = self.redis.get(self._redis_key(datasource_id))
+            except Exception:
+                # the cache is best effort, a Redis failure falls back to the API
+                self._disable_redis()
+                value = None
+            if value is not None:
+                entry = json.loads(value)
+                self._put(datasource_id, entry)
+                return entry
+        return None
+
+    def set(self, datasource_id: str, entry: Dict[str, Any]) -> None:
+        self._put(datasource_id, entry)
+        if self._redis_available():
+            try:
+                self.redis.set(self._redis_key(datasource_id), json.dumps(entry), ex=self.redis_expire)
+            except Exception:
+                self._disable_redis()
+
+    def _redis_available(self) -> bool:
+        return self.redis is not None and time.time() >= self.redis_disabled_until
+
+    def _disable_redis(self) -> None:
+        self.redis_disabled_until = time.time() + REDIS_RETRY_INTERVAL
+
+    def _put(self, datasource_id: str, entry: Dict[str, Any]) -> None:
+        with self.lock:
+            self.entries[datasource_id] = entry
+            self.entries.move_to_end(datasource_id)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+
+# one cache per kernel, i.e. per session, see MetadataCache
+_metadata_cache: Optional[MetadataCache] = None
+_metadata_cache_lock = threading.Lock()
+
+
+def get_metadata_cache(config: Dict[str, Any]) -> MetadataCache:
+    global _metadata_cache
+    with _metadata_cache_lock:
+        if _metadata_cache is None:
+            _metadata_cache = MetadataCache(
+                size=int(config.get("cache_size", 64)),
+                use_redis=bool(config.get("use_redis", True)),
+                redis_expire=int(config.get("redis_expire", 86400)),
+            )
+        return _metadata_cache
+
+
 @register_plugin
 class MetadataFetchPlugin(Plugin):
     def __call__(self):
@@ -23,14 +124,12 @@ class MetadataFetchPlugin(Plugin):
         datasource_id = self.ctx.get_session_var("datasource_id")
         if datasource_id is None:
             raise ValueError("No datasource ID found in session.")
-        
+
         # Build the full URL using environment variables
         url = f"http://{API_HOST}:{API_PORT}/api/metadata/fetch/{datasource_id}/"
 
         try:
-            response = requests.get(url)
-            response.raise_for_status()
-            data = response.json()
+            data = json.loads(self.fetch(str(datasource_id), url))
 
             if data["status"] == "success":
                 metadata = data["data"]
@@ -39,16 +138,58 @@ class MetadataFetchPlugin(Plugin):
                 metadata = None
                 description = f"Failed to fetch metadata for datasource ID {datasource_id}. Message: {data['message']}"
 
-        except requests.exceptions.RequestException as e:
+        # ValueError: the body is not JSON, e.g. an HTML error page of a proxy
+        except (requests.exceptions.RequestException, ValueError) as e:
             metadata = None
             description = f"An error occurred while fetching metadata for datasource ID {datasource_id}. Error: {str(e)}"
 
         return metadata, description
-    
+
+    def fetch(self, datasource_id: str, url: str) -> str:
+        """
+        Get the response body of the metadata API, from the cache if it is still fresh.
+        An expired entry is revalidated with its ETag/Last-Modified, and reused if the API answers 304.
+        """
+        cache = get_metadata_cache(self.config)
+        ttl = float(self.config.get("cache_ttl", 300))
+        entry = cache.get(datasource_id)
+        if entry is not None and time.time() - entry["fetched_at"] < ttl:
+            return entry["body"]
+
+        headers = {}
+        if entry is not None and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry is not None and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+        session = self.ctx.get_http_session(
+            timeout=(5, float(self.config.get("request_timeout", 60))),
+            retries=int(self.config.get("max_retries", 3)),
+        )
+        response = session.get(url, headers=headers)
+        if response.status_code == 304 and entry is not None:
+            cache.set(datasource_id, {**entry, "fetched_at": time.time()})
+            return entry["body"]
+
+        response.raise_for_status()
+        body = response.text
+        # only successful responses are cached, a failure is retried by the next call
+        if json.loads(body).get("status") == "success":
+            cache.set(
+                datasource_id,
+                {
+                    "body": body,
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "fetched_at": time.time(),
+                },
+            )
+        return body
+
 
 if __name__ == "__main__":
     from taskweaver.plugin.context import temp_context
 
     with temp_context() as temp_ctx:
         render = MetadataFetchPlugin(name="datasource_info", ctx=temp_ctx, config={})
-        print(render(datasource_id = 34))
\ No newline at end of file
+        print(render(datasource_id = 34))
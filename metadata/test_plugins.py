@@ -0,0 +1,351 @@
+import importlib.util
+import json
+import os
+import time
+import unittest
+from typing import Any, Dict, List, Optional
+
+from taskweaver.plugin.context import temp_context
+
+PLUGIN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "project", "plugins")
+
+
+def load_plugin_module(name: str):
+    # the plugins are not a package, they are loaded by path as the TaskWeaver kernel does
+    spec = importlib.util.spec_from_file_location(f"{name}_under_test", os.path.join(PLUGIN_DIR, f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+database_query = load_plugin_module("database_query")
+metadata_fetch = load_plugin_module("metadata_fetch")
+
+
+class FakeDatabaseQueryPlugin(database_query.DatabaseQueryPlugin):
+    """Answers the queries from a list of rows instead of the datasource API, and records the queries sent."""
+
+    def __init__(self, rows: List[Dict[str, Any]], **kwargs: Any):
+        super().__init__(**kwargs)
+        self.rows = rows
+        self.sent_queries: List[str] = []
+
+    def post_query(self, datasource_id: str, query: str) -> Dict[str, Any]:
+        self.sent_queries.append(query)
+        rows = self.rows
+        if " LIMIT " in query:
+            limit, offset = [int(n) for n in query.rsplit(" LIMIT ", 1)[1].split(" OFFSET ")]
+            rows = rows[offset : offset + limit]
+        return {"status": "success", "data": rows}
+
+
+class StreamQueryTest(unittest.TestCase):
+    rows = [{"id": i, "name": f"row {i}"} for i in range(25)]
+
+    def stream(self, query: str, **config: Any):
+        with temp_context() as ctx:
+            plugin = FakeDatabaseQueryPlugin(
+                self.rows,
+                name="database_query",
+                ctx=ctx,
+                config={"page_size": 10, "cache_ttl": 0, **config},
+            )
+            results, description = plugin.stream_query("1", query)
+            if isinstance(results, str) and results.endswith(".csv"):
+                with open(results) as f:
+                    results = f.read()
+            return plugin.sent_queries, results, description
+
+    def test_is_pageable(self):
+        cases = [
+            ("SELECT * FROM t ORDER BY id", True),
+            ("WITH x AS (SELECT * FROM t) SELECT * FROM x ORDER BY id", True),
+            ("SELECT * FROM t", False),
+            ("SELECT * FROM (SELECT * FROM t ORDER BY id) AS s", False),
+            ("SELECT * FROM t ORDER BY id LIMIT 5", False),
+            ("SELECT * FROM t ORDER BY id OFFSET 5 ROWS", False),
+            ("SELECT * FROM t ORDER BY id; DELETE FROM t", False),
+            ("DELETE FROM t ORDER BY id", False),
+        ]
+        for query, expected in cases:
+            with self.subTest(query=query):
+                self.assertEqual(database_query.is_pageable(query), expected)
+
+    def test_ordered_query_is_paged(self):
+        sent_queries, df, _ = self.stream("SELECT * FROM t ORDER BY id")
+        self.assertEqual(
+            sent_queries,
+            [
+                "SELECT * FROM t ORDER BY id LIMIT 10 OFFSET 0",
+                "SELECT * FROM t ORDER BY id LIMIT 10 OFFSET 10",
+                "SELECT * FROM t ORDER BY id LIMIT 10 OFFSET 20",
+            ],
+        )
+        self.assertEqual(df["id"].tolist(), list(range(25)))
+
+    def test_trailing_comment_does_not_hide_the_paging(self):
+        sent_queries, df, _ = self.stream("SELECT * FROM t\nORDER BY id; -- newest first")
+        self.assertEqual(sent_queries[0], "SELECT * FROM t ORDER BY id LIMIT 10 OFFSET 0")
+        self.assertEqual(len(df), 25)
+
+    def test_unordered_query_is_fetched_at_once(self):
+        sent_queries, df, description = self.stream("SELECT * FROM t -- all of it")
+        self.assertEqual(sent_queries, ["SELECT * FROM t"])
+        self.assertEqual(df["id"].tolist(), list(range(25)))
+        self.assertIn("ORDER BY", description)
+
+    def test_spill_to_file(self):
+        _, content, description = self.stream("SELECT * FROM t ORDER BY id", max_memory_rows=15)
+        self.assertIn("exceed the memory limit", description)
+        if not content.endswith(".parquet"):
+            # CSV, pyarrow is not installed
+            self.assertEqual(content.splitlines()[:2], ["id,name", "0,row 0"])
+            self.assertEqual(len(content.splitlines()), 26)
+
+
+class QueryResultCacheTest(unittest.TestCase):
+    def test_is_cacheable(self):
+        cases = [
+            ("SELECT * FROM t", True),
+            ("select count(*) from t where name = 'delete me'", True),
+            ('SELECT "update", updated_at FROM t', True),
+            ("WITH x AS (SELECT * FROM t) SELECT * FROM x", True),
+            ("SHOW TABLES", True),
+            ("DESCRIBE t", True),
+            ("EXPLAIN SELECT * FROM t", True),
+            ("WITH x AS (SELECT id FROM t) DELETE FROM u WHERE id IN (SELECT id FROM x)", False),
+            ("WITH d AS (DELETE FROM t RETURNING *) SELECT * FROM d", False),
+            ("WITH x AS (SELECT 1) INSERT INTO t SELECT * FROM x", False),
+            ("SELECT * INTO backup FROM t", False),
+            ("SELECT * FROM t FOR UPDATE", False),
+            ("SELECT nextval('seq')", False),
+            ("EXPLAIN ANALYZE DELETE FROM t", False),
+            ("SELECT 1; DROP TABLE t", False),
+            ("UPDATE t SET x = 1", False),
+            ("INSERT INTO t VALUES (1)", False),
+            ("", False),
+        ]
+        for query, expected in cases:
+            with self.subTest(query=query):
+                cacheable = database_query.QueryResultCache.is_cacheable(database_query.normalize_sql(query))
+                self.assertEqual(cacheable, expected)
+
+    def test_ttl_expiry(self):
+        with temp_context() as ctx:
+            cache = database_query.QueryResultCache(os.path.join(ctx._temp_dir, "cache"), ttl=60, max_bytes=1 << 20)
+            self.assertEqual(cache.get("1", "SELECT 1", "records"), (False, None))
+
+            cache.set("1", "SELECT 1", "records", [{"a": 1}])
+            self.assertEqual(cache.get("1", "SELECT 1", "records"), (True, [{"a": 1}]))
+            # the key includes the datasource
+            self.assertEqual(cache.get("2", "SELECT 1", "records"), (False, None))
+
+            # an entry written more than ttl seconds ago is expired
+            path = cache._get_path("1", "SELECT 1", "records")
+            written_at = os.path.getmtime(path) - 61
+            os.utime(path, (written_at, written_at))
+            self.assertEqual(cache.get("1", "SELECT 1", "records"), (False, None))
+
+    def test_write_queries_are_not_cached(self):
+        with temp_context() as ctx:
+            plugin = FakeDatabaseQueryPlugin([{"id": 1}], name="database_query", ctx=ctx, config={})
+            plugin.get_result_cache = lambda datasource_id: database_query.QueryResultCache(
+                os.path.join(ctx._temp_dir, "cache"),
+                ttl=600,
+                max_bytes=1 << 20,
+            )
+            query = "WITH d AS (DELETE FROM t RETURNING *) SELECT * FROM d"
+            plugin.run_query("1", query)
+            plugin.run_query("1", query)
+            plugin.run_query("1", "SELECT * FROM t")
+            _, description = plugin.run_query("1", "SELECT * FROM t")
+            self.assertEqual(plugin.sent_queries, [query, query, "SELECT * FROM t"])
+            self.assertIn("cached result", description)
+
+
+class ExploratoryQueryTest(unittest.TestCase):
+    def test_rewrite_exploratory_query(self):
+        cases = [
+            ("SELECT * FROM t", "SELECT * FROM t LIMIT 101"),
+            ("SELECT * FROM t;", "SELECT * FROM t LIMIT 101"),
+            ("SELECT * FROM t -- all rows", "SELECT * FROM t LIMIT 101"),
+            ("SELECT * FROM t LIMIT 10", "SELECT * FROM t LIMIT 10"),
+            ("SELECT * FROM t LIMIT 500", "SELECT * FROM t LIMIT 101"),
+            ("SELECT * FROM t limit all", "SELECT * FROM t limit 101"),
+            ("SELECT * FROM t LIMIT ALL OFFSET 20", "SELECT * FROM t LIMIT 101 OFFSET 20"),
+            ("SELECT * FROM t LIMIT 500 OFFSET 20", "SELECT * FROM t LIMIT 101 OFFSET 20"),
+            ("SELECT * FROM t OFFSET 20 LIMIT 500", "SELECT * FROM t OFFSET 20 LIMIT 101"),
+            ("SELECT * FROM t LIMIT 5, 500", "SELECT * FROM t LIMIT 5, 101"),
+            ("SELECT * FROM t LIMIT 5,10", "SELECT * FROM t LIMIT 5,10"),
+            ("SELECT * FROM t OFFSET 20", "SELECT * FROM t OFFSET 20 LIMIT 101"),
+            (
+                "SELECT * FROM t ORDER BY id OFFSET 20 ROWS",
+                "SELECT * FROM t ORDER BY id OFFSET 20 ROWS FETCH NEXT 101 ROWS ONLY",
+            ),
+            ("SELECT * FROM t FETCH FIRST 500 ROWS ONLY", "SELECT * FROM t FETCH FIRST 101 ROWS ONLY"),
+            (
+                "SELECT * FROM t ORDER BY id OFFSET 5 ROWS FETCH NEXT 500 ROWS ONLY",
+                "SELECT * FROM t ORDER BY id OFFSET 5 ROWS FETCH NEXT 101 ROWS ONLY",
+            ),
+            ("SELECT * FROM t FETCH FIRST ROW ONLY", "SELECT * FROM t FETCH FIRST ROW ONLY"),
+            (
+                "SELECT * FROM (SELECT * FROM t LIMIT 1000) AS s",
+                "SELECT * FROM (SELECT * FROM t LIMIT 1000) AS s LIMIT 101",
+            ),
+            ("WITH x AS (SELECT * FROM t) SELECT * FROM x", "WITH x AS (SELECT * FROM t) SELECT * FROM x LIMIT 101"),
+            ("SELECT 'limit 5' FROM t", "SELECT 'limit 5' FROM t LIMIT 101"),
+            # the row count is not a number
+            ("SELECT * FROM t LIMIT :n", None),
+            ("SELECT * FROM t LIMIT 10 + 5", None),
+            ("SELECT * FROM t FETCH FIRST :n ROWS ONLY", None),
+            # not a single read-only SELECT
+            ("WITH x AS (SELECT id FROM t) DELETE FROM t WHERE id IN (SELECT id FROM x)", None),
+            ("DELETE FROM t", None),
+            ("SELECT * INTO backup FROM t", None),
+            ("SELECT * FROM t; DROP TABLE t", None),
+            ("SHOW TABLES", None),
+        ]
+        for query, expected in cases:
+            with self.subTest(query=query):
+                self.assertEqual(database_query.rewrite_exploratory_query(query, 101), (expected, False))
+
+    def test_table_sample(self):
+        cases = [
+            ("SELECT * FROM t", "SELECT * FROM t TABLESAMPLE SYSTEM (1) LIMIT 101", True),
+            (
+                "SELECT * FROM t WHERE x > 1 LIMIT 10",
+                "SELECT * FROM t TABLESAMPLE SYSTEM (1) WHERE x > 1 LIMIT 10",
+                True,
+            ),
+            ("SELECT * FROM t JOIN u ON t.id = u.id", "SELECT * FROM t JOIN u ON t.id = u.id LIMIT 101", False),
+            ("SELECT * FROM t AS a", "SELECT * FROM t AS a LIMIT 101", False),
+        ]
+        for query, expected, sampled in cases:
+            with self.subTest(query=query):
+                self.assertEqual(database_query.rewrite_exploratory_query(query, 101, 1), (expected, sampled))
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, body: str = "", headers: Optional[Dict[str, str]] = None):
+        self.status_code = status_code
+        self.text = body
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise metadata_fetch.requests.exceptions.HTTPError(f"{self.status_code} error")
+
+
+class FakeHttpSession:
+    """Answers the metadata requests from a list of responses, and records the headers sent."""
+
+    def __init__(self, responses: List[FakeResponse]):
+        self.responses = responses
+        self.sent_headers: List[Dict[str, str]] = []
+
+    def get(self, url: str, headers: Dict[str, str]) -> FakeResponse:
+        self.sent_headers.append(headers)
+        return self.responses.pop(0)
+
+
+class FailingRedis:
+    def __init__(self):
+        self.calls = 0
+
+    def get(self, key: str):
+        self.calls += 1
+        raise ConnectionError("redis is down")
+
+    def set(self, key: str, value: str, ex: int):
+        self.calls += 1
+        raise ConnectionError("redis is down")
+
+
+class MetadataFetchTest(unittest.TestCase):
+    body = json.dumps({"status": "success", "data": {"tables": ["t"]}})
+
+    def setUp(self):
+        metadata_fetch._metadata_cache = None
+
+    def fetch(self, responses: List[FakeResponse], times: int, **config: Any):
+        http_session = FakeHttpSession(responses)
+        with temp_context() as ctx:
+            ctx.get_http_session = lambda **kwargs: http_session
+            # the kernel's context defaults the session variables to None, the test context has no default
+            ctx.get_session_var = lambda name, default=None: {"datasource_id": "7"}.get(name, default)
+            plugin = metadata_fetch.MetadataFetchPlugin(
+                name="metadata_fetch",
+                ctx=ctx,
+                config={"use_redis": False, **config},
+            )
+            results = [plugin() for _ in range(times)]
+        return http_session.sent_headers, results
+
+    def test_fresh_entry_is_reused(self):
+        sent_headers, results = self.fetch([FakeResponse(200, self.body, {"ETag": '"v1"'})], 2)
+        self.assertEqual(sent_headers, [{}])
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[0][0], {"tables": ["t"]})
+
+    def test_expired_entry_is_revalidated(self):
+        responses = [
+            FakeResponse(200, self.body, {"ETag": '"v1"', "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"}),
+            FakeResponse(304),
+        ]
+        sent_headers, results = self.fetch(responses, 2, cache_ttl=0)
+        self.assertEqual(
+            sent_headers,
+            [{}, {"If-None-Match": '"v1"', "If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT"}],
+        )
+        self.assertEqual(results[1][0], {"tables": ["t"]})
+
+    def test_changed_metadata_replaces_the_entry(self):
+        changed = json.dumps({"status": "success", "data": {"tables": ["t", "u"]}})
+        responses = [
+            FakeResponse(200, self.body, {"ETag": '"v1"'}),
+            FakeResponse(200, changed, {"ETag": '"v2"'}),
+            FakeResponse(304),
+        ]
+        sent_headers, results = self.fetch(responses, 3, cache_ttl=0)
+        self.assertEqual([h.get("If-None-Match") for h in sent_headers], [None, '"v1"', '"v2"'])
+        self.assertEqual(results[2][0], {"tables": ["t", "u"]})
+
+    def test_failure_is_not_cached(self):
+        failure = json.dumps({"status": "error", "message": "not found"})
+        responses = [FakeResponse(200, failure), FakeResponse(200, self.body)]
+        sent_headers, results = self.fetch(responses, 2)
+        self.assertEqual(len(sent_headers), 2)
+        self.assertIsNone(results[0][0])
+        self.assertEqual(results[1][0], {"tables": ["t"]})
+
+    def test_non_json_body(self):
+        responses = [FakeResponse(200, "<html>Bad Gateway</html>"), FakeResponse(200, self.body)]
+        sent_headers, results = self.fetch(responses, 2)
+        self.assertIsNone(results[0][0])
+        self.assertIn("An error occurred", results[0][1])
+        # the body is not cached
+        self.assertEqual(len(sent_headers), 2)
+        self.assertEqual(results[1][0], {"tables": ["t"]})
+
+    def test_lru_eviction(self):
+        cache = metadata_fetch.MetadataCache(size=2, use_redis=False, redis_expire=60)
+        cache.set("1", {"body": "1"})
+        cache.set("2", {"body": "2"})
+        # reading 1 makes 2 the least recently used entry
+        self.assertEqual(cache.get("1"), {"body": "1"})
+        cache.set("3", {"body": "3"})
+        self.assertIsNone(cache.get("2"))
+        self.assertEqual(list(cache.entries), ["1", "3"])
+
+    def test_failing_redis_is_skipped(self):
+        cache = metadata_fetch.MetadataCache(size=2, use_redis=False, redis_expire=60)
+        cache.redis = FailingRedis()
+        self.assertIsNone(cache.get("1"))
+        cache.set("1", {"body": "1"})
+        self.assertIsNone(cache.get("2"))
+        self.assertEqual(cache.redis.calls, 1)
+        self.assertEqual(cache.get("1"), {"body": "1"})
+
+        cache.redis_disabled_until = time.time() - 1
+        self.assertIsNone(cache.get("2"))
+        self.assertEqual(cache.redis.calls, 2)
@@ -0,0 +1,147 @@
+import asyncio
+import unittest
+from typing import Dict, List, Optional
+
+from metadata.managers.scheduler import AdmissionScheduler, SchedulerBusy
+
+
+class AdmissionSchedulerTest(unittest.IsolatedAsyncioTestCase):
+    def create_scheduler(
+        self,
+        max_concurrent: int = 1,
+        max_per_tenant: Optional[Dict[str, int]] = None,
+        max_queue: int = 10,
+        max_wait: Optional[float] = None,
+    ) -> AdmissionScheduler:
+        self.scheduler = AdmissionScheduler(max_concurrent, max_per_tenant or {}, max_queue, max_wait)
+        self.admitted: List[str] = []
+        self.done: Dict[str, asyncio.Event] = {}
+        return self.scheduler
+
+    def start(self, name: str, tenants=(), cost: int = 0) -> asyncio.Task:
+        """Start a request that holds its slot until `finish(name)` is called."""
+        self.done[name] = asyncio.Event()
+
+        async def request():
+            async with self.scheduler.admit(tuple(tenants), cost=cost):
+                self.admitted.append(name)
+                await self.done[name].wait()
+
+        return asyncio.create_task(request())
+
+    async def finish(self, *names: str) -> None:
+        for name in names:
+            self.done[name].set()
+        await self.settle()
+
+    @staticmethod
+    async def settle() -> None:
+        for _ in range(5):
+            await asyncio.sleep(0)
+
+    async def test_cheaper_requests_are_admitted_first(self):
+        self.create_scheduler(max_concurrent=1)
+        self.start("running")
+        await self.settle()
+        self.start("heavy", cost=5)
+        self.start("short", cost=1)
+        self.start("short too", cost=1)
+        await self.settle()
+        self.assertEqual(self.scheduler.queue_size(), 3)
+
+        await self.finish("running")
+        await self.finish("short")
+        await self.finish("short too")
+        self.assertEqual(self.admitted, ["running", "short", "short too", "heavy"])
+
+    async def test_per_tenant_limit(self):
+        self.create_scheduler(max_concurrent=3, max_per_tenant={"user": 1})
+        self.start("a1", tenants=[("user", "a")])
+        self.start("a2", tenants=[("user", "a")])
+        self.start("b1", tenants=[("user", "b")])
+        await self.settle()
+        # the second request of user a waits although a slot is free
+        self.assertEqual(self.admitted, ["a1", "b1"])
+        self.assertEqual(self.scheduler.running(), 2)
+
+        await self.finish("a1")
+        self.assertEqual(self.admitted, ["a1", "b1", "a2"])
+
+    async def test_queued_position(self):
+        scheduler = self.create_scheduler(max_concurrent=1)
+        self.start("running")
+        await self.settle()
+        positions: List[int] = []
+
+        async def on_queued(position: int):
+            positions.append(position)
+
+        async def request(cost: int):
+            async with scheduler.admit((), cost=cost, on_queued=on_queued):
+                pass
+
+        tasks = [asyncio.create_task(request(5)), asyncio.create_task(request(1))]
+        await self.settle()
+        self.assertEqual(positions, [1, 1])
+
+        await self.finish("running")
+        await asyncio.gather(*tasks)
+        self.assertEqual(scheduler.running(), 0)
+
+    async def test_full_queue_is_rejected(self):
+        scheduler = self.create_scheduler(max_concurrent=1, max_queue=1)
+        self.start("running")
+        self.start("queued")
+        await self.settle()
+        with self.assertRaises(SchedulerBusy):
+            async with scheduler.admit(()):
+                pass
+        self.assertEqual(scheduler.queue_size(), 1)
+
+    async def test_queue_timeout(self):
+        scheduler = self.create_scheduler(max_concurrent=1, max_wait=0.01)
+        self.start("running")
+        await self.settle()
+        with self.assertRaises(SchedulerBusy):
+            async with scheduler.admit(()):
+                pass
+        self.assertEqual(scheduler.queue_size(), 0)
+
+        await self.finish("running")
+        self.assertEqual(scheduler.running(), 0)
+
+    async def test_cancel_while_waiting(self):
+        scheduler = self.create_scheduler(max_concurrent=1)
+        self.start("running")
+        waiting = self.start("cancelled")
+        self.start("next")
+        await self.settle()
+
+        waiting.cancel()
+        await self.settle()
+        self.assertTrue(waiting.cancelled())
+        self.assertEqual(scheduler.queue_size(), 1)
+
+        await self.finish("running")
+        self.assertEqual(self.admitted, ["running", "next"])
+
+    async def test_cancel_after_the_slot_is_granted(self):
+        scheduler = self.create_scheduler(max_concurrent=1, max_per_tenant={"user": 1})
+        holder = scheduler.admit((("user", "a"),))
+        await holder.__aenter__()
+        granted = self.start("granted", tenants=[("user", "a")])
+        self.start("next", tenants=[("user", "a")])
+        await self.settle()
+
+        # the release grants the slot to the first waiter, which is cancelled before it gets to run
+        await holder.__aexit__(None, None, None)
+        granted.cancel()
+        await self.settle()
+
+        self.assertTrue(granted.cancelled())
+        self.assertEqual(self.admitted, ["next"])
+        self.assertEqual(scheduler.running(), 1)
+
+        await self.finish("next")
+        self.assertEqual(scheduler.running(), 0)
+        self.assertEqual(scheduler._running_per_tenant, {})
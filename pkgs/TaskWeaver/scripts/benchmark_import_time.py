@@ -0,0 +1,66 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from typing import List, Tuple
+
+parser = argparse.ArgumentParser(
+    description="Measure the cold import time and memory of TaskWeaver in fresh interpreters.",
+)
+parser.add_argument("--module", type=str, default="taskweaver.app.app", help="the module to import")
+parser.add_argument("--repeat", type=int, default=5, help="number of fresh interpreters to start")
+parser.add_argument("--top", type=int, default=0, help="print the N slowest modules reported by -X importtime")
+
+args = parser.parse_args()
+
+package_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# run in the child interpreter: the wall time of the import, the peak RSS and whether the heavy SDKs got loaded
+probe = f"""
+import resource, sys, time
+start = time.perf_counter()
+import {args.module}
+elapsed = time.perf_counter() - start
+loaded = [m for m in ("openai", "numpy", "jupyter_client", "docker") if m in sys.modules]
+print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, ",".join(loaded) or "-")
+"""
+
+
+def run_once() -> Tuple[float, int, str]:
+    output = subprocess.check_output([sys.executable, "-c", probe], cwd=package_dir, text=True)
+    elapsed, maxrss, loaded = output.split()
+    return float(elapsed), int(maxrss), loaded
+
+
+def top_modules() -> List[Tuple[int, str]]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {args.module}"],
+        cwd=package_dir,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        modules.append((int(cumulative), name.rstrip()))
+    return sorted(modules, reverse=True)[: args.top]
+
+
+def main():
+    runs = [run_once() for _ in range(args.repeat)]
+    print(f"import {args.module}")
+    print(f"  wall time  median {statistics.median(r[0] for r in runs) * 1000:8.1f} ms")
+    print(f"  max RSS    median {statistics.median(r[1] for r in runs) / 1024:8.1f} MB")
+    print(f"  heavy modules loaded: {runs[0][2]}")
+    if args.top > 0:
+        print("  slowest modules (cumulative):")
+        for cumulative, name in top_modules():
+            print(f"    {cumulative / 1000:8.1f} ms {name}")
+
+
+if __name__ == "__main__":
+    main()
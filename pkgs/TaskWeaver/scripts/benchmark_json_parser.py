@@ -0,0 +1,102 @@
+import argparse
+import importlib.util
+import json
+import os
+import random
+import subprocess
+import sys
+import timeit
+from types import ModuleType
+from typing import List, Optional
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from taskweaver.utils import json_parser
+
+parser = argparse.ArgumentParser(
+    description="Benchmark the streaming JSON parser on LLM-like responses, "
+    "optionally against a baseline version of the parser.",
+)
+parser.add_argument(
+    "--baseline",
+    type=str,
+    default=None,
+    help="path of a baseline json_parser.py to compare with",
+)
+parser.add_argument(
+    "--baseline_rev",
+    type=str,
+    default=None,
+    help="git revision to read the baseline json_parser.py from, e.g., HEAD~1",
+)
+parser.add_argument("--sizes", type=int, nargs="+", default=[2, 8, 32], help="response sizes in KB")
+parser.add_argument("--chunk_size", type=int, default=4, help="average number of characters per streamed chunk")
+parser.add_argument("--repeat", type=int, default=5)
+
+args = parser.parse_args()
+
+
+def load_baseline() -> Optional[ModuleType]:
+    if args.baseline_rev is not None:
+        repo_path = os.path.relpath(
+            json_parser.__file__,
+            subprocess.check_output(["git", "rev-parse", "--show-toplevel"], text=True).strip(),
+        )
+        source = subprocess.check_output(["git", "show", f"{args.baseline_rev}:{repo_path}"], text=True)
+        module = ModuleType("baseline_json_parser")
+        exec(compile(source, f"{args.baseline_rev}:{repo_path}", "exec"), module.__dict__)
+        return module
+    if args.baseline is not None:
+        spec = importlib.util.spec_from_file_location("baseline_json_parser", args.baseline)
+        assert spec is not None and spec.loader is not None
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+    return None
+
+
+def make_response(size_kb: int) -> str:
+    # a Planner-like response: a few short fields and long, escaped, multi-line contents
+    rnd = random.Random(size_kb)
+    words = ["data", "quality", "column", "null", "rows", "SELECT", "table", '"check"', "ratio", "\\d+", "é"]
+    items = []
+    length = 0
+    while length < size_kb * 1024:
+        content = "\n".join(" ".join(rnd.choice(words) for _ in range(12)) for _ in range(8))
+        items.append({"type": rnd.choice(["thought", "plan", "current_plan_step", "send_to"]), "content": content})
+        length += len(content) + 40
+    return json.dumps({"response": items}, indent=2)
+
+
+def make_chunks(text: str) -> List[str]:
+    rnd = random.Random(len(text))
+    chunks = []
+    i = 0
+    while i < len(text):
+        n = rnd.randint(1, 2 * args.chunk_size - 1)
+        chunks.append(text[i : i + n])
+        i += n
+    return chunks
+
+
+def run(module: ModuleType, chunks: List[str]):
+    return list(module.parse_json_stream(iter(chunks), skip_after_root=True))
+
+
+def main():
+    baseline = load_baseline()
+    for size_kb in args.sizes:
+        text = make_response(size_kb)
+        for name, chunks in [("streamed", make_chunks(text)), ("whole", [text])]:
+            label = f"{size_kb:>4} KB {name:<8}"
+            cur = min(timeit.repeat(lambda: run(json_parser, chunks), number=1, repeat=args.repeat))
+            if baseline is None:
+                print(f"{label} current {cur * 1000:9.1f} ms")
+                continue
+            assert run(baseline, chunks) == run(json_parser, chunks), "the parsers emit different events"
+            base = min(timeit.repeat(lambda: run(baseline, chunks), number=1, repeat=args.repeat))
+            print(f"{label} baseline {base * 1000:9.1f} ms  current {cur * 1000:9.1f} ms  speedup {base / cur:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
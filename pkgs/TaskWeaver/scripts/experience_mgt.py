@@ -1,6 +1,7 @@
 import argparse
 import os
 import sys
+import time
 
 sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
 
@@ -36,9 +37,32 @@ parser.add_argument(
 )
 parser.add_argument("--show", action="store_true")
 
+parser.add_argument("--batch_size", type=int, default=None, help="Number of texts per embedding request.")
+parser.add_argument(
+    "--concurrency",
+    type=int,
+    default=None,
+    help="Maximum number of embedding and summarization requests sent at once.",
+)
+parser.add_argument(
+    "--max_retries", type=int, default=None, help="Retries of a failed embedding or summarization request."
+)
+
 args = parser.parse_args()
 
 
+def get_config_overrides():
+    # only the options given on the command line override the project configuration
+    overrides = {
+        "llm.embedding_batch_size": args.batch_size,
+        "llm.embedding_concurrency": args.concurrency,
+        "llm.embedding_max_retries": args.max_retries,
+        "experience.refresh_concurrency": args.concurrency,
+        "experience.refresh_max_retries": args.max_retries,
+    }
+    return {key: value for key, value in overrides.items() if value is not None}
+
+
 class ExperienceManager:
     def __init__(self):
         app_injector = Injector([LoggingModule])
@@ -47,14 +71,16 @@ class ExperienceManager:
                 args.project_dir,
                 "taskweaver_config.json",
             ),
+            config=get_config_overrides(),
             app_base_path=args.project_dir,
         )
         app_injector.binder.bind(AppConfigSource, to=app_config)
         self.experience_generator = app_injector.create_object(ExperienceGenerator)
 
     def refresh(self):
+        start = time.perf_counter()
         self.experience_generator.refresh()
-        print("Refreshed experience list")
+        print(f"Refreshed experience list in {time.perf_counter() - start:.1f}s")
 
     def delete_experience(self, exp_id: str):
         self.experience_generator.delete_experience(exp_id=exp_id)
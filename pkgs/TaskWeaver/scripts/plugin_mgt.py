@@ -1,6 +1,7 @@
 import argparse
 import os
 import sys
+import time
 
 sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
 
@@ -25,9 +26,28 @@ parser.add_argument(
 parser.add_argument("--refresh", action="store_true", help="Refresh plugin embeddings.")
 parser.add_argument("--show", action="store_true", help="Show plugin information.")
 
+parser.add_argument("--batch_size", type=int, default=None, help="Number of texts per embedding request.")
+parser.add_argument(
+    "--concurrency",
+    type=int,
+    default=None,
+    help="Maximum number of embedding requests sent at once.",
+)
+parser.add_argument("--max_retries", type=int, default=None, help="Retries of a failed embedding request.")
+
 args = parser.parse_args()
 
 
+def get_config_overrides():
+    # only the options given on the command line override the project configuration
+    overrides = {
+        "llm.embedding_batch_size": args.batch_size,
+        "llm.embedding_concurrency": args.concurrency,
+        "llm.embedding_max_retries": args.max_retries,
+    }
+    return {key: value for key, value in overrides.items() if value is not None}
+
+
 class PluginManager:
     def __init__(self):
         app_injector = Injector([LoggingModule, PluginModule])
@@ -36,14 +56,16 @@ class PluginManager:
                 args.project_dir,
                 "taskweaver_config.json",
             ),
+            config=get_config_overrides(),
             app_base_path=args.project_dir,
         )
         app_injector.binder.bind(AppConfigSource, to=app_config)
         self.plugin_selector = app_injector.create_object(PluginSelector)
 
     def refresh(self):
+        start = time.perf_counter()
         self.plugin_selector.refresh()
-        print("Plugin embeddings refreshed.")
+        print(f"Plugin embeddings refreshed in {time.perf_counter() - start:.1f}s.")
 
     def show(self):
         plugin_list = self.plugin_selector.available_plugins
@@ -1,8 +1,11 @@
 from .app import TaskWeaverApp
-from .session_store import InMemorySessionStore, SessionStore
+from .session_pool import SessionPool
+from .session_store import BoundedSessionStore, InMemorySessionStore, SessionStore
 
 __all__ = [
     "TaskWeaverApp",
+    "SessionPool",
     "SessionStore",
     "InMemorySessionStore",
+    "BoundedSessionStore",
 ]
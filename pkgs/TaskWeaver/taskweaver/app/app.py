@@ -4,14 +4,19 @@ from typing import Any, Dict, Optional, Tuple
 from injector import Injector
 
 from taskweaver.app.session_manager import SessionManager, SessionManagerModule
+from taskweaver.ces.common import Manager
 from taskweaver.config.config_mgt import AppConfigSource
-from taskweaver.logging import LoggingModule
-from taskweaver.memory.plugin import PluginModule
+from taskweaver.logging import LoggingModule, TelemetryLogger
+from taskweaver.memory.plugin import PluginModule, PluginRegistry
+from taskweaver.misc.example import ExampleCache
 from taskweaver.module.execution_service import ExecutionServiceModule
-from taskweaver.role.role import RoleModule
+from taskweaver.module.tracing import Tracing
+from taskweaver.role.role import RoleModule, RoleRegistry
 
 # if TYPE_CHECKING:
-from taskweaver.session.session import Session
+from taskweaver.session.answer_cache import AnswerCache
+from taskweaver.session.session import AppSessionConfig, Session
+from taskweaver.workspace.workspace import Workspace
 
 
 class TaskWeaverApp(object):
@@ -48,6 +53,21 @@ class TaskWeaverApp(object):
             [SessionManagerModule, PluginModule, LoggingModule, ExecutionServiceModule, RoleModule],
         )
         self.app_injector.binder.bind(AppConfigSource, to=config_src)
+        # shared by all the sessions of the app: the registries and the examples only parse again the YAML files
+        # changed since they were loaded, and the stateless dependencies of a session are not resolved per session.
+        # they are bound before the session pool starts creating sessions
+        for shared_cls in [
+            RoleRegistry,
+            PluginRegistry,
+            ExampleCache,
+            AnswerCache,
+            AppSessionConfig,
+            Workspace,
+            TelemetryLogger,
+            Tracing,
+        ]:
+            shared_instance = self.app_injector.get(shared_cls)
+            self.app_injector.binder.bind(shared_cls, to=shared_instance)
         self.session_manager: SessionManager = self.app_injector.get(SessionManager)
         self._init_app_modules()
 
@@ -69,6 +89,7 @@ class TaskWeaverApp(object):
         Stop the TaskWeaver app. This function must be called before the app exits.
         """
         self.session_manager.stop_all_sessions()
+        self.app_injector.get(Manager).clean_up()
 
     @staticmethod
     def discover_app_dir(
@@ -1,21 +1,40 @@
 from __future__ import annotations
 
+import os
 from typing import Literal, Optional, overload
 
 from injector import Binder, Injector, Module, inject, provider
 
 from taskweaver.config.module_config import ModuleConfig
+from taskweaver.logging import TelemetryLogger
 
 from ..session import Session
 from ..utils import create_id
-from .session_store import InMemorySessionStore, SessionStore
+from .session_pool import SessionPool
+from .session_store import BoundedSessionStore, InMemorySessionStore, SessionStore
 
 
 class SessionManager:
     @inject
-    def __init__(self, session_store: SessionStore, injector: Injector) -> None:
+    def __init__(
+        self,
+        session_store: SessionStore,
+        injector: Injector,
+        config: SessionManagerConfig,
+        logger: TelemetryLogger,
+    ) -> None:
         self.session_store: SessionStore = session_store
         self.injector: Injector = injector
+        self.config = config
+
+        self.session_pool: Optional[SessionPool] = None
+        if self.config.pool_size > 0:
+            self.session_pool = SessionPool(
+                lambda: self.injector.create_object(Session, {"session_id": create_id()}),
+                self.config.pool_size,
+                logger,
+            )
+            self.session_pool.start()
 
     def get_session(
         self,
@@ -25,6 +44,11 @@ class SessionManager:
         """get session from session store, if session_id is None, create a new session"""
         if session_id is None:
             assert prev_round_id is None
+            if self.session_pool is not None:
+                pooled_session = self.session_pool.acquire()
+                if pooled_session is not None:
+                    self.session_store.set_session(pooled_session.session_id, pooled_session)
+                    return pooled_session
             session_id = create_id()
             return self._get_session_from_store(session_id, True)
 
@@ -49,12 +73,20 @@ class SessionManager:
 
     def stop_session(self, session_id: str) -> None:
         """stop session in session store"""
-        session = self._get_session_from_store(session_id, False)
+        session = self.session_store.get_session(session_id)
         if session is not None:
             session.stop()
             self.session_store.remove_session(session_id)
+        # a stopped session is not restored, so its conversation must not be kept on disk
+        self.session_store.remove_snapshot(session_id)
+
+    def suspend_session(self, session_id: str) -> None:
+        """stop session and remove it from session store, keeping a snapshot if the store supports it"""
+        self.session_store.evict_session(session_id)
 
     def stop_all_sessions(self) -> None:
+        if self.session_pool is not None:
+            self.session_pool.stop()
         session_ids = self.session_store.list_all_session_ids()
         for session_id in session_ids:
             self.stop_session(session_id)
@@ -90,6 +122,18 @@ class SessionManager:
                 )
                 self.session_store.set_session(session_id, new_session)
                 return new_session
+
+            snapshot_path = self.session_store.get_snapshot_path(session_id)
+            if snapshot_path is not None:
+                restored_session = self.injector.create_object(
+                    Session,
+                    {"session_id": session_id},
+                )
+                restored_session.restore_memory(snapshot_path)
+                # the live session is the copy now, it is snapshotted again if it is evicted again
+                self.session_store.remove_snapshot(session_id)
+                self.session_store.set_session(session_id, restored_session)
+                return restored_session
             return None
 
 
@@ -98,9 +142,22 @@ class SessionManagerConfig(ModuleConfig):
         self._set_name("session_manager")
         self.session_store_type = self._get_enum(
             "store_type",
-            ["in_memory"],
+            ["in_memory", "bounded"],
             "in_memory",
         )
+        # settings of the bounded session store
+        self.max_sessions = self._get_int("max_sessions", 100)
+        self.idle_timeout = self._get_int("idle_timeout", 3600)
+        self.snapshot_enabled = self._get_bool("snapshot_enabled", False)
+        self.snapshot_dir = self._get_path(
+            "snapshot_dir",
+            os.path.join(self.src.app_base_path, "workspace", "snapshots"),
+        )
+        # snapshots that are never restored are deleted after this many seconds, or beyond this number
+        self.snapshot_max_age = self._get_int("snapshot_max_age", 7 * 24 * 3600)
+        self.max_snapshots = self._get_int("max_snapshots", 1000)
+        # number of pre-initialized sessions kept warm for new chats, 0 to disable
+        self.pool_size = self._get_int("pool_size", 0)
 
 
 class SessionManagerModule(Module):
@@ -111,4 +168,12 @@ class SessionManagerModule(Module):
     def provide_session_store(self, config: SessionManagerConfig) -> SessionStore:
         if config.session_store_type == "in_memory":
             return InMemorySessionStore()
+        if config.session_store_type == "bounded":
+            return BoundedSessionStore(
+                max_sessions=config.max_sessions,
+                idle_timeout=config.idle_timeout,
+                snapshot_dir=config.snapshot_dir if config.snapshot_enabled else None,
+                snapshot_max_age=config.snapshot_max_age,
+                max_snapshots=config.max_snapshots,
+            )
         raise Exception(f"unknown session store type {config.session_store_type}")
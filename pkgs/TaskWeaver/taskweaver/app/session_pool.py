@@ -0,0 +1,104 @@
+import threading
+from collections import deque
+from typing import Callable, Deque, Optional
+
+from ..logging import TelemetryLogger
+from ..session import Session
+
+
+class SessionPool:
+    """A pool of pre-initialized (warmed up) sessions that is replenished in the background."""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        pool_size: int,
+        logger: Optional[TelemetryLogger] = None,
+    ) -> None:
+        """
+        :param session_factory: The function to create a new session.
+        :param pool_size: The number of warm sessions to keep in the pool.
+        :param logger: The logger.
+        """
+        assert pool_size > 0, "pool_size must be positive"
+        self.session_factory = session_factory
+        self.pool_size = pool_size
+        self.logger = logger
+
+        self._sessions: Deque[Session] = deque()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._worker: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Start the background thread that fills the pool."""
+        with self._cond:
+            if self._worker is not None:
+                return
+            self._stopped = False
+            self._worker = threading.Thread(
+                target=self._replenish,
+                name="taskweaver-session-pool",
+                daemon=True,
+            )
+            self._worker.start()
+
+    def acquire(self) -> Optional[Session]:
+        """
+        Take a warm session from the pool without blocking.
+        :return: The session, or None if the pool is currently empty.
+        """
+        with self._cond:
+            session = self._sessions.popleft() if len(self._sessions) > 0 else None
+            self._cond.notify_all()
+            return session
+
+    def size(self) -> int:
+        with self._cond:
+            return len(self._sessions)
+
+    def stop(self) -> None:
+        """Stop replenishing and stop all sessions that are still idle in the pool."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+            worker = self._worker
+            self._worker = None
+        if worker is not None and worker is not threading.current_thread():
+            worker.join()
+
+        with self._cond:
+            idle_sessions = list(self._sessions)
+            self._sessions.clear()
+        for session in idle_sessions:
+            session.stop()
+
+    def _replenish(self) -> None:
+        while True:
+            with self._cond:
+                while not self._stopped and len(self._sessions) >= self.pool_size:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+
+            # session creation and warm-up are slow, so do not hold the lock here
+            try:
+                session = self.session_factory()
+                session.warm_up()
+            except Exception as e:
+                if self.logger is not None:
+                    self.logger.error(f"Failed to create a warm session for the pool: {e}")
+                with self._cond:
+                    # back off before retrying to avoid a busy loop on persistent errors
+                    self._cond.wait(timeout=5)
+                continue
+
+            with self._cond:
+                if self._stopped:
+                    discarded = session
+                else:
+                    self._sessions.append(session)
+                    discarded = None
+            if discarded is not None:
+                discarded.stop()
+                return
@@ -1,5 +1,9 @@
 import abc
-from typing import Dict, List, Optional
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
 
 from ..session.session import Session
 
@@ -25,6 +29,21 @@ class SessionStore(abc.ABC):
     def list_all_session_ids(self) -> List[str]:
         pass
 
+    def evict_session(self, session_id: str) -> None:
+        """Stop the session and remove it from the store. Stores may keep a snapshot for rehydration."""
+        session = self.get_session(session_id)
+        if session is not None:
+            session.stop()
+            self.remove_session(session_id)
+
+    def get_snapshot_path(self, session_id: str) -> Optional[str]:
+        """Return the path of the snapshot of an evicted session, or None if there is no snapshot."""
+        return None
+
+    def remove_snapshot(self, session_id: str) -> None:
+        """Delete the snapshot of a session, once it is restored or the session is stopped."""
+        pass
+
 
 class InMemorySessionStore(SessionStore):
     def __init__(self) -> None:
@@ -37,10 +56,183 @@ class InMemorySessionStore(SessionStore):
         self.sessions[session_id] = session
 
     def remove_session(self, session_id: str) -> None:
-        self.sessions.pop(session_id)
+        self.sessions.pop(session_id, None)
 
     def has_session(self, session_id: str) -> bool:
         return session_id in self.sessions
 
     def list_all_session_ids(self) -> List[str]:
         return list(self.sessions.keys())
+
+
+class BoundedSessionStore(SessionStore):
+    """
+    An in-memory session store that keeps at most `max_sessions` sessions.
+    Sessions are evicted in LRU order when the store is full, or when they have been idle for
+    more than `idle_timeout` seconds. Evicted sessions are stopped (releasing their kernels) and,
+    if `snapshot_dir` is set, their memory is saved to disk so that they can be rehydrated later.
+    A snapshot is deleted when its session is restored or stopped, and snapshots that are never reclaimed
+    are deleted after `snapshot_max_age` seconds, or when there are more than `max_snapshots` of them.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int,
+        idle_timeout: float = 0,
+        snapshot_dir: Optional[str] = None,
+        snapshot_max_age: float = 0,
+        max_snapshots: int = 0,
+    ) -> None:
+        """
+        :param max_sessions: The maximum number of live sessions.
+        :param idle_timeout: Seconds of inactivity after which a session is evicted, 0 to disable.
+        :param snapshot_dir: The folder to save the snapshots of evicted sessions, None to disable.
+        :param snapshot_max_age: Seconds after which a snapshot is deleted, 0 to disable.
+        :param max_snapshots: The maximum number of snapshots kept, the oldest are deleted first, 0 to disable.
+        """
+        assert max_sessions > 0, "max_sessions must be positive"
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.snapshot_dir = snapshot_dir
+        self.snapshot_max_age = snapshot_max_age
+        self.max_snapshots = max_snapshots
+        if self.snapshot_dir is not None:
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+
+        self.sessions: OrderedDict[str, Session] = OrderedDict()
+        self.last_access: Dict[str, float] = {}
+        self.lock = threading.RLock()
+
+    def get_session(self, session_id: str) -> Optional[Session]:
+        self.reap_idle_sessions()
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is not None:
+                self._touch(session_id)
+            return session
+
+    def set_session(self, session_id: str, session: Session) -> None:
+        with self.lock:
+            self.sessions[session_id] = session
+            self._touch(session_id)
+        self.reap_idle_sessions()
+        self._evict_overflow()
+
+    def remove_session(self, session_id: str) -> None:
+        with self.lock:
+            # the session may have been evicted since it was looked up
+            self.sessions.pop(session_id, None)
+            self.last_access.pop(session_id, None)
+
+    def has_session(self, session_id: str) -> bool:
+        with self.lock:
+            return session_id in self.sessions
+
+    def list_all_session_ids(self) -> List[str]:
+        with self.lock:
+            return list(self.sessions.keys())
+
+    def evict_session(self, session_id: str) -> None:
+        with self.lock:
+            session = self.sessions.pop(session_id, None)
+            self.last_access.pop(session_id, None)
+        if session is None:
+            return
+        if self.snapshot_dir is not None:
+            session.memory.to_yaml(self._get_snapshot_file(session_id))
+            self.prune_snapshots()
+        session.stop()
+
+    def get_snapshot_path(self, session_id: str) -> Optional[str]:
+        if self.snapshot_dir is None:
+            return None
+        snapshot_file = self._get_snapshot_file(session_id)
+        if not os.path.exists(snapshot_file):
+            return None
+        if self.snapshot_max_age > 0 and time.time() - os.path.getmtime(snapshot_file) > self.snapshot_max_age:
+            self._delete_snapshot_file(snapshot_file)
+            return None
+        return snapshot_file
+
+    def remove_snapshot(self, session_id: str) -> None:
+        if self.snapshot_dir is None:
+            return
+        self._delete_snapshot_file(self._get_snapshot_file(session_id))
+
+    def prune_snapshots(self) -> List[str]:
+        """Delete the snapshots older than `snapshot_max_age`, and the oldest ones beyond `max_snapshots`."""
+        if self.snapshot_dir is None or (self.snapshot_max_age <= 0 and self.max_snapshots <= 0):
+            return []
+        snapshots: List[Tuple[float, str]] = []
+        for file_name in os.listdir(self.snapshot_dir):
+            if not file_name.endswith(".yaml"):
+                continue
+            snapshot_file = os.path.join(self.snapshot_dir, file_name)
+            try:
+                snapshots.append((os.path.getmtime(snapshot_file), snapshot_file))
+            except OSError:
+                # deleted concurrently
+                continue
+        snapshots.sort(reverse=True)
+
+        now = time.time()
+        pruned = [
+            snapshot_file
+            for idx, (mtime, snapshot_file) in enumerate(snapshots)
+            if (self.snapshot_max_age > 0 and now - mtime > self.snapshot_max_age)
+            or (self.max_snapshots > 0 and idx >= self.max_snapshots)
+        ]
+        for snapshot_file in pruned:
+            self._delete_snapshot_file(snapshot_file)
+        return pruned
+
+    def reap_idle_sessions(self) -> List[str]:
+        """Evict the sessions that have been idle for longer than `idle_timeout`."""
+        if self.idle_timeout <= 0:
+            return []
+        now = time.time()
+        with self.lock:
+            idle_session_ids = [
+                session_id
+                for session_id, session in self.sessions.items()
+                if not session.in_progress and now - self._last_active(session_id) > self.idle_timeout
+            ]
+        for session_id in idle_session_ids:
+            self.evict_session(session_id)
+        return idle_session_ids
+
+    def _evict_overflow(self) -> None:
+        while True:
+            with self.lock:
+                if len(self.sessions) <= self.max_sessions:
+                    return
+                # the least recently used session that is not processing a request
+                candidates = sorted(
+                    [session_id for session_id, session in self.sessions.items() if not session.in_progress],
+                    key=self._last_active,
+                )
+                if len(candidates) == 0:
+                    return
+            self.evict_session(candidates[0])
+
+    def _touch(self, session_id: str) -> None:
+        self.last_access[session_id] = time.time()
+        self.sessions.move_to_end(session_id)
+
+    def _last_active(self, session_id: str) -> float:
+        # sessions can be used directly without going through the store, so also
+        # take the activity recorded by the session itself into account
+        return max(
+            self.last_access.get(session_id, 0),
+            self.sessions[session_id].last_active_time,
+        )
+
+    def _get_snapshot_file(self, session_id: str) -> str:
+        return os.path.join(self.snapshot_dir, f"{session_id}.yaml")  # type: ignore
+
+    @staticmethod
+    def _delete_snapshot_file(snapshot_file: str) -> None:
+        try:
+            os.remove(snapshot_file)
+        except FileNotFoundError:
+            pass
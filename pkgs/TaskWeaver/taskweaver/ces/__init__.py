@@ -1,15 +1,33 @@
-from typing import Literal
+from typing import TYPE_CHECKING, Any, Literal
 
 from taskweaver.ces.common import Manager
-from taskweaver.ces.environment import Environment, EnvMode
-from taskweaver.ces.manager.sub_proc import SubProcessManager
+
+if TYPE_CHECKING:
+    from taskweaver.ces.environment import Environment, EnvMode
+
+
+def __getattr__(name: str) -> Any:
+    # the environment imports jupyter_client, it is only loaded when a kernel is actually started
+    if name in ("Environment", "EnvMode"):
+        from taskweaver.ces import environment
+
+        return getattr(environment, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def code_execution_service_factory(
     env_dir: str,
     kernel_mode: Literal["local", "container"] = "local",
+    kernel_pool_size: int = 0,
+    kernel_max_uses: int = 10,
+    kernel_memory_limit_mb: int = 0,
 ) -> Manager:
+    from taskweaver.ces.manager.sub_proc import SubProcessManager
+
     return SubProcessManager(
         env_dir=env_dir,
         kernel_mode=kernel_mode,
+        kernel_pool_size=kernel_pool_size,
+        kernel_max_uses=kernel_max_uses,
+        kernel_memory_limit_mb=kernel_memory_limit_mb,
     )
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import asyncio
 import dataclasses
 import secrets
 from abc import ABC, abstractmethod
@@ -68,6 +69,9 @@ class ExecutionResult:
     log: List[Tuple[str, str, str]] = dataclasses.field(default_factory=list)
     artifact: List[ExecutionArtifact] = dataclasses.field(default_factory=list)
 
+    # latency breakdown of the execution in milliseconds
+    timing: Dict[str, float] = dataclasses.field(default_factory=dict)
+
 
 class Client(ABC):
     """
@@ -103,6 +107,10 @@ class Client(ABC):
     def execute_code(self, exec_id: str, code: str) -> ExecutionResult:
         ...
 
+    async def execute_code_async(self, exec_id: str, code: str) -> ExecutionResult:
+        """Execute the code from a coroutine, by default `execute_code` runs in a worker thread of the event loop."""
+        return await asyncio.to_thread(self.execute_code, exec_id, code)
+
 
 class Manager(ABC):
     """
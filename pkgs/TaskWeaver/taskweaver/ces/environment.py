@@ -1,15 +1,21 @@
+import asyncio
 import enum
 import json
 import logging
 import os
 import platform
 import sys
+import threading
 import time
 from ast import literal_eval
+from collections import deque
 from dataclasses import dataclass, field
-from typing import Any, Dict, List, Literal, Optional, Union
+from typing import Any, Deque, Dict, List, Literal, Optional, Set, Union
 
+import zmq
+import zmq.asyncio
 from jupyter_client import BlockingKernelClient
+from jupyter_client.asynchronous import AsyncKernelClient
 from jupyter_client.kernelspec import KernelSpec, KernelSpecManager
 from jupyter_client.manager import KernelManager
 from jupyter_client.multikernelmanager import MultiKernelManager
@@ -53,6 +59,17 @@ class EnvExecution:
     result: Dict[ResultMimeType, str] = field(default_factory=dict)
     error: str = ""
 
+    # latency breakdown in milliseconds
+    timing: Dict[str, float] = field(default_factory=dict)
+
+
+@dataclass
+class PooledKernel:
+    kernel_id: str
+    pool_dir: str
+    connection_file: str
+    use_count: int = 0
+
 
 @dataclass
 class EnvSession:
@@ -69,7 +86,19 @@ class EnvSession:
     execution_dict: Dict[str, EnvExecution] = field(default_factory=dict)
     session_dir: str = ""
     session_var: Dict[str, str] = field(default_factory=dict)
+    # keys of the session variables changed since they were last sent to the kernel
+    session_var_dirty: Set[str] = field(default_factory=set)
     plugins: Dict[str, EnvPlugin] = field(default_factory=dict)
+    # set when the kernel is leased from the kernel pool
+    connection_file: str = ""
+    pooled_kernel: Optional[PooledKernel] = None
+    # long-lived client with open channels, reused across executions
+    client: Optional[BlockingKernelClient] = None
+    client_lock: threading.RLock = field(default_factory=threading.RLock)
+    # client for the executions from a coroutine, bound to the event loop it is created in
+    async_client: Optional[AsyncKernelClient] = None
+    async_client_loop: Optional[asyncio.AbstractEventLoop] = None
+    async_client_lock: Optional[asyncio.Lock] = None
 
 
 class KernelSpecProvider(KernelSpecManager):
@@ -117,12 +146,28 @@ class Environment:
         env_dir: Optional[str] = None,
         env_mode: Optional[EnvMode] = EnvMode.Local,
         port_start_inside_container: Optional[int] = 12345,
+        kernel_pool_size: int = 0,
+        kernel_max_uses: int = 10,
+        kernel_memory_limit_mb: int = 0,
     ) -> None:
+        """
+        :param kernel_pool_size: The number of idle kernels kept ready to be leased to new sessions (local mode only).
+        :param kernel_max_uses: The number of sessions a pooled kernel serves before it is recycled.
+        :param kernel_memory_limit_mb: The peak memory of a pooled kernel above which it is recycled, 0 to disable.
+        """
         self.session_dict: Dict[str, EnvSession] = {}
         self.id = get_id(prefix="env") if env_id is None else env_id
         self.env_dir = env_dir if env_dir is not None else os.getcwd()
         self.mode = env_mode
 
+        self.kernel_pool_size = kernel_pool_size if self.mode == EnvMode.Local else 0
+        self.kernel_max_uses = kernel_max_uses
+        self.kernel_memory_limit_mb = kernel_memory_limit_mb
+        self.idle_kernels: Deque[PooledKernel] = deque()
+        self.kernel_pool_cond = threading.Condition()
+        self.kernel_pool_starting = 0
+        self.kernel_pool_stopped = False
+
         if self.mode == EnvMode.Local:
             self.multi_kernel_manager = TaskWeaverMultiKernelManager(
                 default_kernel_name="taskweaver",
@@ -131,8 +176,9 @@ class Environment:
 
         elif self.mode == EnvMode.Container:
             try:
-                import docker
                 import docker.errors
+
+                import docker
             except ImportError:
                 raise ImportError(
                     "docker package is required for container-based kernel. "
@@ -165,6 +211,13 @@ class Environment:
 
         logger.info(f"Environment {self.id} is created.")
 
+        if self.kernel_pool_size > 0:
+            threading.Thread(
+                target=self._fill_kernel_pool,
+                name="taskweaver-kernel-pool",
+                daemon=True,
+            ).start()
+
     def _get_connection_file(self, session_id: str, kernel_id: str) -> str:
         return os.path.join(
             self._get_session(session_id).session_dir,
@@ -185,39 +238,21 @@ class Environment:
         cwd = cwd if cwd is not None else os.path.join(session.session_dir, "cwd")
         os.makedirs(cwd, exist_ok=True)
 
-        if self.mode == EnvMode.Local:
-            # set python home from current python environment
-            python_home = os.path.sep.join(sys.executable.split(os.path.sep)[:-2])
-            python_path = os.pathsep.join(
-                [
-                    os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "..")),
-                    os.path.join(python_home, "Lib", "site-packages"),
-                ]
-                + sys.path,
-            )
-
-            # inherit current environment variables
-            # TODO: filter out sensitive environment information
-            kernel_env = os.environ.copy()
-            kernel_env.update(
-                {
-                    "TASKWEAVER_ENV_ID": self.id,
-                    "TASKWEAVER_SESSION_ID": session.session_id,
-                    "TASKWEAVER_SESSION_DIR": session.session_dir,
-                    "TASKWEAVER_LOGGING_FILE_PATH": os.path.join(
-                        ces_session_dir,
-                        "kernel_logging.log",
-                    ),
-                    "CONNECTION_FILE": self._get_connection_file(session_id, new_kernel_id),
-                    "PATH": os.environ["PATH"],
-                    "PYTHONPATH": python_path,
-                    "PYTHONHOME": python_home,
-                },
-            )
-            session.kernel_id = self.multi_kernel_manager.start_kernel(
+        pooled_kernel = self._lease_pooled_kernel() if self.kernel_pool_size > 0 else None
+        if pooled_kernel is not None:
+            session.kernel_id = pooled_kernel.kernel_id
+            session.connection_file = pooled_kernel.connection_file
+            session.pooled_kernel = pooled_kernel
+            self._cmd_session_switch(session, cwd)
+            self._cmd_session_init(session)
+            session.kernel_status = "ready"
+        elif self.mode == EnvMode.Local:
+            session.kernel_id = self._start_local_kernel(
                 kernel_id=new_kernel_id,
+                session_id=session.session_id,
+                session_dir=session.session_dir,
+                connection_file=self._get_connection_file(session_id, new_kernel_id),
                 cwd=cwd,
-                env=kernel_env,
             )
 
             self._cmd_session_init(session)
@@ -308,27 +343,88 @@ class Environment:
 
         session.execution_count += 1
         execution_index = session.execution_count
+        timing: Dict[str, float] = {}
+        start_time = time.perf_counter()
         self._execute_control_code_on_kernel(
             session.session_id,
             f"%_taskweaver_exec_pre_check {execution_index} {exec_id}",
         )
-        # update session variables before executing the code
-        if session.session_var:
+        timing["pre_check"] = (time.perf_counter() - start_time) * 1000
+        # send the changed session variables before executing the code
+        if session.session_var_dirty:
+            step_time = time.perf_counter()
             self._update_session_var(session)
+            timing["update_session_var"] = (time.perf_counter() - step_time) * 1000
         # execute the code on the kernel
         exec_result = self._execute_code_on_kernel(
             session.session_id,
             exec_id=exec_id,
             code=code,
         )
+        timing["connect"] = exec_result.timing["connect"]
+        timing["run"] = exec_result.timing["execute"]
+        step_time = time.perf_counter()
         exec_extra_result = self._execute_control_code_on_kernel(
             session.session_id,
             f"%_taskweaver_exec_post_check {execution_index} {exec_id}",
         )
+        timing["post_check"] = (time.perf_counter() - step_time) * 1000
+        timing["total"] = (time.perf_counter() - start_time) * 1000
         session.execution_dict[exec_id] = exec_result
 
         # TODO: handle session id, round id, post id, etc.
-        return self._parse_exec_result(exec_result, exec_extra_result["data"])
+        result = self._parse_exec_result(exec_result, exec_extra_result["data"])
+        result.timing = timing
+        return result
+
+    async def execute_code_async(
+        self,
+        session_id: str,
+        code: str,
+        exec_id: Optional[str] = None,
+    ) -> ExecutionResult:
+        """Same as `execute_code`, but the kernel is waited for on the running event loop instead of a thread."""
+        exec_id = get_id(prefix="exec") if exec_id is None else exec_id
+        session = self._get_session(session_id)
+
+        session.execution_count += 1
+        execution_index = session.execution_count
+        timing: Dict[str, float] = {}
+        start_time = time.perf_counter()
+        await self._execute_control_code_on_kernel_async(
+            session.session_id,
+            f"%_taskweaver_exec_pre_check {execution_index} {exec_id}",
+        )
+        timing["pre_check"] = (time.perf_counter() - start_time) * 1000
+        # send the changed session variables before executing the code
+        if session.session_var_dirty:
+            step_time = time.perf_counter()
+            await self._execute_control_code_on_kernel_async(
+                session.session_id,
+                self._get_session_var_update_code(session),
+            )
+            session.session_var_dirty.clear()
+            timing["update_session_var"] = (time.perf_counter() - step_time) * 1000
+        # execute the code on the kernel
+        exec_result = await self._execute_code_on_kernel_async(
+            session.session_id,
+            exec_id=exec_id,
+            code=code,
+        )
+        timing["connect"] = exec_result.timing["connect"]
+        timing["run"] = exec_result.timing["execute"]
+        step_time = time.perf_counter()
+        exec_extra_result = await self._execute_control_code_on_kernel_async(
+            session.session_id,
+            f"%_taskweaver_exec_post_check {execution_index} {exec_id}",
+        )
+        timing["post_check"] = (time.perf_counter() - step_time) * 1000
+        timing["total"] = (time.perf_counter() - start_time) * 1000
+        session.execution_dict[exec_id] = exec_result
+
+        result = self._parse_exec_result(exec_result, exec_extra_result["data"])
+        result.timing = timing
+        return result
 
     def load_plugin(
         self,
@@ -381,7 +477,10 @@ class Environment:
         session_var: Dict[str, str],
     ) -> None:
         session = self._get_session(session_id)
-        session.session_var.update(session_var)
+        for key, value in session_var.items():
+            if key not in session.session_var or session.session_var[key] != value:
+                session.session_var[key] = value
+                session.session_var_dirty.add(key)
 
     def stop_session(self, session_id: str) -> None:
         session = self._get_session(session_id)
@@ -393,6 +492,12 @@ class Environment:
         if session.kernel_status == "pending":
             session.kernel_status = "stopped"
             return
+        self._close_client(session)
+        self._close_async_client(session)
+        if session.pooled_kernel is not None:
+            self._release_pooled_kernel(session)
+            session.kernel_status = "stopped"
+            return
         try:
             if session.kernel_id != "":
                 if self.mode == EnvMode.Local:
@@ -459,6 +564,29 @@ class Environment:
             store_history=store_history,
             exec_type="control",
         )
+        return self._parse_control_result(exec_result)
+
+    async def _execute_control_code_on_kernel_async(
+        self,
+        session_id: str,
+        code: str,
+        silent: bool = False,
+        store_history: bool = False,
+    ) -> Dict[Literal["is_success", "message", "data"], Union[bool, str, Any]]:
+        exec_result = await self._execute_code_on_kernel_async(
+            session_id,
+            get_id(prefix="exec"),
+            code=code,
+            silent=silent,
+            store_history=store_history,
+            exec_type="control",
+        )
+        return self._parse_control_result(exec_result)
+
+    @staticmethod
+    def _parse_control_result(
+        exec_result: EnvExecution,
+    ) -> Dict[Literal["is_success", "message", "data"], Union[bool, str, Any]]:
         if exec_result.error != "":
             raise Exception(exec_result.error)
         if "text/plain" not in exec_result.result:
@@ -478,18 +606,97 @@ class Environment:
         session_id: str,
     ) -> BlockingKernelClient:
         session = self._get_session(session_id)
-        connection_file = self._get_connection_file(session_id, session.kernel_id)
-        client = BlockingKernelClient(connection_file=connection_file)
+        if session.client is not None:
+            if session.client.channels_running and session.client.is_alive():
+                return session.client
+            logger.warning(f"Kernel client of session {session_id} is not healthy, reconnecting.")
+            self._close_client(session)
+
+        session.client = self._create_client(session)
+        return session.client
+
+    def _close_client(self, session: EnvSession) -> None:
+        if session.client is None:
+            return
+        try:
+            session.client.stop_channels()
+        except Exception as e:
+            logger.error(e)
+        session.client = None
+
+    async def _get_async_client(
+        self,
+        session: EnvSession,
+    ) -> AsyncKernelClient:
+        if session.async_client is not None:
+            if session.async_client.channels_running and await session.async_client.is_alive():
+                return session.async_client
+            logger.warning(f"Async kernel client of session {session.session_id} is not healthy, reconnecting.")
+            self._close_async_client(session)
+
+        client = AsyncKernelClient(
+            connection_file=self._get_client_connection_file(session),
+            context=zmq.asyncio.Context.instance(),
+        )
+        self._configure_client(client, session)
+        await client.wait_for_ready(timeout=30)
+        session.async_client = client
+        return client
+
+    def _get_async_client_lock(self, session: EnvSession) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if session.async_client_loop is not loop:
+            # the client and its lock can only be used in the event loop they are created in
+            self._close_async_client(session)
+            session.async_client_lock = asyncio.Lock()
+            session.async_client_loop = loop
+        return session.async_client_lock
+
+    def _close_async_client(self, session: EnvSession) -> None:
+        if session.async_client is None:
+            return
+        try:
+            session.async_client.stop_channels()
+        except Exception as e:
+            logger.error(e)
+        session.async_client = None
+
+    def _get_client_connection_file(self, session: EnvSession) -> str:
+        return (
+            session.connection_file
+            if session.connection_file != ""
+            else self._get_connection_file(session.session_id, session.kernel_id)
+        )
+
+    def _configure_client(
+        self,
+        client: Union[BlockingKernelClient, AsyncKernelClient],
+        session: EnvSession,
+    ) -> None:
         client.load_connection_file()
         # overwrite the ip and ports if outside container
         if self.mode == EnvMode.Container:
             client.ip = "127.0.0.1"  # TODO: get the host ip
-            ports = self._get_session_ports(session_id)
+            ports = self._get_session_ports(session.session_id)
             client.shell_port = ports["shell_port"]
             client.stdin_port = ports["stdin_port"]
             client.hb_port = ports["hb_port"]
             client.control_port = ports["control_port"]
             client.iopub_port = ports["iopub_port"]
+
+    def _create_client(
+        self,
+        session: EnvSession,
+    ) -> BlockingKernelClient:
+        # share the process-wide zmq context, a per-client context would block on garbage collection
+        # if the client is dropped without stopping its channels
+        client = BlockingKernelClient(
+            connection_file=self._get_client_connection_file(session),
+            context=zmq.Context.instance(),
+        )
+        self._configure_client(client, session)
+        # wait_for_ready starts the channels, which are kept open until the session is stopped
+        client.wait_for_ready(timeout=30)
         return client
 
     def _execute_code_on_kernel(
@@ -502,77 +709,343 @@ class Environment:
         exec_type: ExecType = "user",
     ) -> EnvExecution:
         exec_result = EnvExecution(exec_id=exec_id, code=code, exec_type=exec_type)
-        kc = self._get_client(session_id)
-        kc.wait_for_ready(timeout=30)
-        kc.start_channels()
+        session = self._get_session(session_id)
+        # the channels of a client are not thread-safe, so executions in a session are serialized
+        with session.client_lock:
+            start_time = time.perf_counter()
+            kc = self._get_client(session_id)
+            exec_result.timing["connect"] = (time.perf_counter() - start_time) * 1000
+
+            start_time = time.perf_counter()
+            try:
+                self._run_on_client(kc, exec_result, silent, store_history)
+            except Exception:
+                # the channels may be left with unread messages, so reconnect on the next execution
+                self._close_client(session)
+                raise
+            exec_result.timing["execute"] = (time.perf_counter() - start_time) * 1000
+        return exec_result
+
+    async def _execute_code_on_kernel_async(
+        self,
+        session_id: str,
+        exec_id: str,
+        code: str,
+        silent: bool = False,
+        store_history: bool = True,
+        exec_type: ExecType = "user",
+    ) -> EnvExecution:
+        exec_result = EnvExecution(exec_id=exec_id, code=code, exec_type=exec_type)
+        session = self._get_session(session_id)
+        # the async client has its own channels, the kernel tells the replies of both clients apart by msg_id
+        async with self._get_async_client_lock(session):
+            start_time = time.perf_counter()
+            kc = await self._get_async_client(session)
+            exec_result.timing["connect"] = (time.perf_counter() - start_time) * 1000
+
+            start_time = time.perf_counter()
+            try:
+                await self._run_on_async_client(kc, exec_result, silent, store_history)
+            except (Exception, asyncio.CancelledError):
+                self._close_async_client(session)
+                raise
+            exec_result.timing["execute"] = (time.perf_counter() - start_time) * 1000
+        return exec_result
+
+    async def _run_on_async_client(
+        self,
+        kc: AsyncKernelClient,
+        exec_result: EnvExecution,
+        silent: bool,
+        store_history: bool,
+    ) -> None:
         result_msg_id = kc.execute(
-            code=code,
+            code=exec_result.code,
+            silent=silent,
+            store_history=store_history,
+            allow_stdin=False,
+            stop_on_error=True,
+        )
+        while True:
+            message = await kc.get_iopub_msg(timeout=180)
+            if self._handle_iopub_msg(exec_result, message, result_msg_id):
+                break
+
+        while True:
+            reply = await kc.get_shell_msg(timeout=180)
+            if reply["parent_header"].get("msg_id") == result_msg_id:
+                break
+
+    def _run_on_client(
+        self,
+        kc: BlockingKernelClient,
+        exec_result: EnvExecution,
+        silent: bool,
+        store_history: bool,
+    ) -> None:
+        result_msg_id = kc.execute(
+            code=exec_result.code,
             silent=silent,
             store_history=store_history,
             allow_stdin=False,
             stop_on_error=True,
         )
+        # TODO: interrupt kernel if it takes too long
+        while True:
+            message = kc.get_iopub_msg(timeout=180)
+            if self._handle_iopub_msg(exec_result, message, result_msg_id):
+                break
+
+        # consume the execute reply so that replies do not pile up on the long-lived shell channel
+        while True:
+            reply = kc.get_shell_msg(timeout=180)
+            if reply["parent_header"].get("msg_id") == result_msg_id:
+                break
+
+    @staticmethod
+    def _handle_iopub_msg(
+        exec_result: EnvExecution,
+        message: Dict[str, Any],
+        result_msg_id: str,
+    ) -> bool:
+        """Record an iopub message of the execution, return True when the kernel is idle again."""
+        logger.debug(json.dumps(message, indent=2, default=str))
+
+        if message["parent_header"].get("msg_id") != result_msg_id:
+            # left over from a previous request on the same channels
+            return False
+        msg_type = message["msg_type"]
+        if msg_type == "status":
+            if message["content"]["execution_state"] == "idle":
+                return True
+        elif msg_type == "stream":
+            stream_name = message["content"]["name"]
+            stream_text = message["content"]["text"]
+
+            if stream_name == "stdout":
+                exec_result.stdout.append(stream_text)
+            elif stream_name == "stderr":
+                exec_result.stderr.append(stream_text)
+            else:
+                assert False, f"Unsupported stream name: {stream_name}"
+
+        elif msg_type == "execute_result":
+            execute_result = message["content"]["data"]
+            exec_result.result = execute_result
+        elif msg_type == "error":
+            error_name = message["content"]["ename"]
+            error_value = message["content"]["evalue"]
+            error_traceback_lines = message["content"]["traceback"]
+            if error_traceback_lines is None:
+                error_traceback_lines = [f"{error_name}: {error_value}"]
+            error_traceback = "\n".join(error_traceback_lines)
+            exec_result.error = error_traceback
+        elif msg_type == "execute_input":
+            pass
+        elif msg_type == "display_data":
+            data: Dict[ResultMimeType, Any] = message["content"]["data"]
+            metadata: Dict[str, Any] = message["content"]["metadata"]
+            transient: Dict[str, Any] = message["content"]["transient"]
+            exec_result.displays.append(
+                DisplayData(data=data, metadata=metadata, transient=transient),
+            )
+        elif msg_type == "update_display_data":
+            data: Dict[ResultMimeType, Any] = message["content"]["data"]
+            metadata: Dict[str, Any] = message["content"]["metadata"]
+            transient: Dict[str, Any] = message["content"]["transient"]
+            exec_result.displays.append(
+                DisplayData(data=data, metadata=metadata, transient=transient),
+            )
+        else:
+            pass
+        return False
+
+    def _start_local_kernel(
+        self,
+        kernel_id: str,
+        session_id: str,
+        session_dir: str,
+        connection_file: str,
+        cwd: str,
+    ) -> str:
+        # set python home from current python environment
+        python_home = os.path.sep.join(sys.executable.split(os.path.sep)[:-2])
+        python_path = os.pathsep.join(
+            [
+                os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "..")),
+                os.path.join(python_home, "Lib", "site-packages"),
+            ]
+            + sys.path,
+        )
+
+        # inherit current environment variables
+        # TODO: filter out sensitive environment information
+        kernel_env = os.environ.copy()
+        kernel_env.update(
+            {
+                "TASKWEAVER_ENV_ID": self.id,
+                "TASKWEAVER_SESSION_ID": session_id,
+                "TASKWEAVER_SESSION_DIR": session_dir,
+                "TASKWEAVER_LOGGING_FILE_PATH": os.path.join(
+                    os.path.dirname(connection_file),
+                    "kernel_logging.log",
+                ),
+                "CONNECTION_FILE": connection_file,
+                "PATH": os.environ["PATH"],
+                "PYTHONPATH": python_path,
+                "PYTHONHOME": python_home,
+            },
+        )
+        return self.multi_kernel_manager.start_kernel(
+            kernel_id=kernel_id,
+            cwd=cwd,
+            env=kernel_env,
+        )
+
+    def shutdown_kernel_pool(self) -> None:
+        """Stop refilling the kernel pool and shut down all idle kernels."""
+        with self.kernel_pool_cond:
+            self.kernel_pool_stopped = True
+            idle_kernels = list(self.idle_kernels)
+            self.idle_kernels.clear()
+            self.kernel_pool_cond.notify_all()
+        for kernel in idle_kernels:
+            self._shutdown_local_kernel(kernel.kernel_id)
+
+    def _fill_kernel_pool(self) -> None:
+        while True:
+            with self.kernel_pool_cond:
+                while (
+                    not self.kernel_pool_stopped
+                    and len(self.idle_kernels) + self.kernel_pool_starting >= self.kernel_pool_size
+                ):
+                    self.kernel_pool_cond.wait()
+                if self.kernel_pool_stopped:
+                    return
+                self.kernel_pool_starting += 1
+            kernel = None
+            try:
+                kernel = self._start_pooled_kernel()
+            except Exception as e:
+                logger.error(f"Failed to start a pooled kernel: {e}")
+            with self.kernel_pool_cond:
+                self.kernel_pool_starting -= 1
+                if (
+                    kernel is not None
+                    and not self.kernel_pool_stopped
+                    and len(self.idle_kernels) < self.kernel_pool_size
+                ):
+                    self.idle_kernels.append(kernel)
+                    kernel = None
+                elif kernel is None:
+                    # back off before retrying to avoid a busy loop on persistent errors
+                    self.kernel_pool_cond.wait(timeout=5)
+            if kernel is not None:
+                self._shutdown_local_kernel(kernel.kernel_id)
+
+    def _start_pooled_kernel(self) -> PooledKernel:
+        kernel_id = get_id(prefix="knl")
+        pool_dir = os.path.join(self.env_dir, "kernel_pool", kernel_id)
+        os.makedirs(os.path.join(pool_dir, "ces"), exist_ok=True)
+        os.makedirs(os.path.join(pool_dir, "cwd"), exist_ok=True)
+        kernel = PooledKernel(
+            kernel_id=kernel_id,
+            pool_dir=pool_dir,
+            connection_file=os.path.join(pool_dir, "ces", f"conn-{kernel_id}.json"),
+        )
+        self._start_local_kernel(
+            kernel_id=kernel_id,
+            session_id=self._get_pool_session_id(kernel),
+            session_dir=pool_dir,
+            connection_file=kernel.connection_file,
+            cwd=os.path.join(pool_dir, "cwd"),
+        )
+        # pre-import the libraries so that leasing sessions do not pay for it
+        pool_session = self._get_pool_session(kernel)
         try:
-            # TODO: interrupt kernel if it takes too long
-            while True:
-                message = kc.get_iopub_msg(timeout=180)
-
-                logger.debug(json.dumps(message, indent=2, default=str))
-
-                assert message["parent_header"]["msg_id"] == result_msg_id
-                msg_type = message["msg_type"]
-                if msg_type == "status":
-                    if message["content"]["execution_state"] == "idle":
-                        break
-                elif msg_type == "stream":
-                    stream_name = message["content"]["name"]
-                    stream_text = message["content"]["text"]
-
-                    if stream_name == "stdout":
-                        exec_result.stdout.append(stream_text)
-                    elif stream_name == "stderr":
-                        exec_result.stderr.append(stream_text)
-                    else:
-                        assert False, f"Unsupported stream name: {stream_name}"
-
-                elif msg_type == "execute_result":
-                    execute_result = message["content"]["data"]
-                    exec_result.result = execute_result
-                elif msg_type == "error":
-                    error_name = message["content"]["ename"]
-                    error_value = message["content"]["evalue"]
-                    error_traceback_lines = message["content"]["traceback"]
-                    if error_traceback_lines is None:
-                        error_traceback_lines = [f"{error_name}: {error_value}"]
-                    error_traceback = "\n".join(error_traceback_lines)
-                    exec_result.error = error_traceback
-                elif msg_type == "execute_input":
-                    pass
-                elif msg_type == "display_data":
-                    data: Dict[ResultMimeType, Any] = message["content"]["data"]
-                    metadata: Dict[str, Any] = message["content"]["metadata"]
-                    transient: Dict[str, Any] = message["content"]["transient"]
-                    exec_result.displays.append(
-                        DisplayData(data=data, metadata=metadata, transient=transient),
-                    )
-                elif msg_type == "update_display_data":
-                    data: Dict[ResultMimeType, Any] = message["content"]["data"]
-                    metadata: Dict[str, Any] = message["content"]["metadata"]
-                    transient: Dict[str, Any] = message["content"]["transient"]
-                    exec_result.displays.append(
-                        DisplayData(data=data, metadata=metadata, transient=transient),
-                    )
-                else:
-                    pass
+            self._cmd_session_init(pool_session)
         finally:
-            kc.stop_channels()
-        return exec_result
+            self._remove_pool_session(pool_session)
+        return kernel
+
+    def _lease_pooled_kernel(self) -> Optional[PooledKernel]:
+        with self.kernel_pool_cond:
+            kernel = self.idle_kernels.popleft() if len(self.idle_kernels) > 0 else None
+            self.kernel_pool_cond.notify_all()
+        if kernel is None:
+            logger.info("No idle kernel in the pool, starting a new kernel.")
+        return kernel
+
+    def _release_pooled_kernel(self, session: EnvSession) -> None:
+        kernel = session.pooled_kernel
+        assert kernel is not None
+        session.pooled_kernel = None
+        kernel.use_count += 1
+
+        recycle = kernel.use_count >= self.kernel_max_uses
+        if not recycle:
+            pool_session = self._get_pool_session(kernel)
+            try:
+                result = self._cmd_session_reset(pool_session)
+                max_rss_mb = result["data"]["max_rss_mb"]
+                if self.kernel_memory_limit_mb > 0 and max_rss_mb is not None:
+                    recycle = max_rss_mb > self.kernel_memory_limit_mb
+            except Exception as e:
+                logger.error(f"Failed to reset pooled kernel {kernel.kernel_id}: {e}")
+                recycle = True
+            finally:
+                self._remove_pool_session(pool_session)
+
+        with self.kernel_pool_cond:
+            # a released kernel is dropped if the pool has been refilled in the meantime
+            if not recycle and not self.kernel_pool_stopped and len(self.idle_kernels) < self.kernel_pool_size:
+                self.idle_kernels.append(kernel)
+                self.kernel_pool_cond.notify_all()
+                return
+        self._shutdown_local_kernel(kernel.kernel_id)
+        with self.kernel_pool_cond:
+            self.kernel_pool_cond.notify_all()
+
+    def _shutdown_local_kernel(self, kernel_id: str) -> None:
+        try:
+            kernel = self.multi_kernel_manager.get_kernel(kernel_id)
+            if kernel.is_alive():
+                kernel.shutdown_kernel(now=True)
+            kernel.cleanup_resources()
+            self.multi_kernel_manager.remove_kernel(kernel_id)
+        except Exception as e:
+            logger.error(e)
+
+    def _remove_pool_session(self, pool_session: EnvSession) -> None:
+        self._close_client(pool_session)
+        self.session_dict.pop(pool_session.session_id, None)
+
+    def _get_pool_session_id(self, kernel: PooledKernel) -> str:
+        return f"kernel_pool-{kernel.kernel_id}"
+
+    def _get_pool_session(self, kernel: PooledKernel) -> EnvSession:
+        # a placeholder session that routes control code to an idle pooled kernel
+        pool_session = EnvSession(
+            session_id=self._get_pool_session_id(kernel),
+            kernel_status="ready",
+            kernel_id=kernel.kernel_id,
+            session_dir=kernel.pool_dir,
+            connection_file=kernel.connection_file,
+        )
+        self.session_dict[pool_session.session_id] = pool_session
+        return pool_session
 
     def _update_session_var(self, session: EnvSession) -> None:
         self._execute_control_code_on_kernel(
             session.session_id,
-            f"%%_taskweaver_update_session_var\n{json.dumps(session.session_var)}",
+            self._get_session_var_update_code(session),
         )
+        session.session_var_dirty.clear()
+
+    @staticmethod
+    def _get_session_var_update_code(session: EnvSession) -> str:
+        changed_session_var = {key: session.session_var[key] for key in session.session_var_dirty}
+        return f"%%_taskweaver_update_session_var\n{json.dumps(changed_session_var)}"
 
     def _cmd_session_init(self, session: EnvSession) -> None:
         self._execute_control_code_on_kernel(
@@ -580,6 +1053,24 @@ class Environment:
             f"%_taskweaver_session_init {session.session_id}",
         )
 
+    def _cmd_session_switch(self, session: EnvSession, cwd: str) -> None:
+        session_info = {"session_id": session.session_id, "session_dir": session.session_dir, "cwd": cwd}
+        self._execute_control_code_on_kernel(
+            session.session_id,
+            f"%%_taskweaver_session_switch\n{json.dumps(session_info)}",
+        )
+
+    def _cmd_session_reset(self, pool_session: EnvSession) -> Dict[str, Any]:
+        reset_info = {
+            "session_id": pool_session.session_id,
+            "session_dir": pool_session.session_dir,
+            "cwd": os.path.join(pool_session.session_dir, "cwd"),
+        }
+        return self._execute_control_code_on_kernel(
+            pool_session.session_id,
+            f"%%_taskweaver_session_reset\n{json.dumps(reset_info)}",
+        )
+
     def _cmd_plugin_load(self, session: EnvSession, plugin: EnvPlugin) -> None:
         self._execute_control_code_on_kernel(
             session.session_id,
@@ -16,11 +16,24 @@ def fmt_response(is_success: bool, message: str, data: Any = None):
     }
 
 
+def get_max_rss_mb():
+    try:
+        import resource
+        import sys
+    except ImportError:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return max_rss / (1024 * 1024) if sys.platform == "darwin" else max_rss / 1024
+
+
 @magics_class
 class TaskWeaverContextMagic(Magics):
     def __init__(self, shell: InteractiveShell, executor: Executor, **kwargs: Any):
         super(TaskWeaverContextMagic, self).__init__(shell, **kwargs)
         self.executor = executor
+        # the environment variables of the kernel when it was spawned, restored when a pooled kernel is reset
+        self.initial_environ = dict(os.environ)
 
     @needs_local_scope
     @line_magic
@@ -28,6 +41,27 @@ class TaskWeaverContextMagic(Magics):
         self.executor.load_lib(local_ns)
         return fmt_response(True, "TaskWeaver context initialized.")
 
+    @cell_magic
+    def _taskweaver_session_switch(self, line: str, cell: str):
+        session_info = json.loads(cell)
+        self.executor.switch_session(session_info["session_id"], session_info["session_dir"])
+        os.chdir(session_info["cwd"])
+        return fmt_response(True, f"Switched to session {session_info['session_id']}.")
+
+    @cell_magic
+    def _taskweaver_session_reset(self, line: str, cell: str):
+        reset_info = json.loads(cell)
+        # wipe the user namespace but keep the imported modules in sys.modules, so that
+        # the next session does not pay for importing the libraries again
+        self.shell.reset(new_session=False)
+        # the environment variables set by the previous session must not leak into the next one
+        os.environ.clear()
+        os.environ.update(self.initial_environ)
+        self.executor.reset_session(reset_info["session_id"], reset_info["session_dir"])
+        self.executor.load_lib(self.shell.user_ns)
+        os.chdir(reset_info["cwd"])
+        return fmt_response(True, "Session reset.", {"max_rss_mb": get_max_rss_mb()})
+
     @cell_magic
     def _taskweaver_update_session_var(self, line: str, cell: str):
         json_dict_str = cell
@@ -51,6 +51,9 @@ class SubProcessClient(Client):
     def execute_code(self, exec_id: str, code: str) -> ExecutionResult:
         return self.mgr.env.execute_code(self.session_id, code=code, exec_id=exec_id)
 
+    async def execute_code_async(self, exec_id: str, code: str) -> ExecutionResult:
+        return await self.mgr.env.execute_code_async(self.session_id, code=code, exec_id=exec_id)
+
 
 class SubProcessManager(Manager):
     def __init__(
@@ -58,6 +61,9 @@ class SubProcessManager(Manager):
         env_id: Optional[str] = None,
         env_dir: Optional[str] = None,
         kernel_mode: Optional[Literal["local", "container"]] = "local",
+        kernel_pool_size: int = 0,
+        kernel_max_uses: int = 10,
+        kernel_memory_limit_mb: int = 0,
     ) -> None:
         env_id = env_id or os.getenv("TASKWEAVER_ENV_ID", "local")
         env_dir = env_dir or os.getenv(
@@ -75,6 +81,9 @@ class SubProcessManager(Manager):
             env_id,
             env_dir,
             env_mode=env_mode,
+            kernel_pool_size=kernel_pool_size,
+            kernel_max_uses=kernel_max_uses,
+            kernel_memory_limit_mb=kernel_memory_limit_mb,
         )
 
     def initialize(self) -> None:
@@ -82,8 +91,7 @@ class SubProcessManager(Manager):
         pass
 
     def clean_up(self) -> None:
-        # no need to clean up the manager itself
-        pass
+        self.env.shutdown_kernel_pool()
 
     def get_session_client(
         self,
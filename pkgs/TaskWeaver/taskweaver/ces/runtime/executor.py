@@ -230,5 +230,28 @@ class Executor:
     def log(self, level: LogErrorLevel, message: str):
         self.ctx.log(level, "Engine", message)
 
+    def switch_session(self, session_id: str, session_dir: str):
+        self.session_id = session_id
+        self.session_dir = session_dir
+        self._init_session_dir()
+
+    def reset_session(self, session_id: str, session_dir: str):
+        try:
+            import matplotlib.pyplot as plt
+
+            plt.close("all")
+        except ImportError:
+            pass
+
+        for plugin in self.plugin_registry.values():
+            plugin.unload_impl()
+        self.plugin_registry = {}
+        self.session_var = {}
+        self.cur_execution_count = 0
+        self.cur_execution_id = ""
+        self.switch_session(session_id, session_dir)
+        self.ctx = ExecutorPluginContext(self)
+
     def update_session_var(self, variables: Dict[str, str]):
-        self.session_var = {str(k): str(v) for k, v in variables.items()}
+        # only the changed variables are sent, so merge them into the existing ones
+        self.session_var.update({str(k): str(v) for k, v in variables.items()})
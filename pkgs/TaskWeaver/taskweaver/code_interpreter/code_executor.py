@@ -1,13 +1,14 @@
+import asyncio
 import os
 from pathlib import Path
-from typing import List, Literal
+from typing import List, Literal, Optional
 
 from injector import inject
 
-from taskweaver.ces.common import ExecutionResult, Manager
+from taskweaver.ces.common import Client, ExecutionResult, Manager
 from taskweaver.config.config_mgt import AppConfigSource
 from taskweaver.memory.plugin import PluginRegistry
-from taskweaver.module.tracing import Tracing, get_tracer, tracing_decorator
+from taskweaver.module.tracing import Tracing, get_tracer, tracing_decorator, tracing_decorator_async
 from taskweaver.plugin.context import ArtifactType
 from taskweaver.session import SessionMetadata
 
@@ -53,37 +54,62 @@ class CodeExecutor:
         self.workspace = session_metadata.workspace
         self.execution_cwd = session_metadata.execution_cwd
         self.exec_mgr = exec_mgr
-        self.exec_client = self.exec_mgr.get_session_client(
-            self.session_id,
-            session_dir=self.workspace,
-            cwd=self.execution_cwd,
-        )
+        # the execution client is created on first use
+        self._exec_client: Optional[Client] = None
         self.client_started: bool = False
         self.plugin_registry = plugin_registry
         self.plugin_loaded: bool = False
         self.config = config
         self.tracing = tracing
         self.session_variables = {}
+        # session variables not yet sent to the execution client
+        self.pending_session_variables = {}
+
+    @property
+    def exec_client(self) -> Client:
+        if self._exec_client is None:
+            self._exec_client = self.exec_mgr.get_session_client(
+                self.session_id,
+                session_dir=self.workspace,
+                cwd=self.execution_cwd,
+            )
+        return self._exec_client
 
     @tracing_decorator
     def execute_code(self, exec_id: str, code: str) -> ExecutionResult:
-        if not self.client_started:
-            with get_tracer().start_as_current_span("start"):
-                self.start()
-                self.client_started = True
-
-        if not self.plugin_loaded:
-            with get_tracer().start_as_current_span("load_plugin"):
-                self.load_plugin()
-                self.plugin_loaded = True
-        
-        # update session variables
-        self.exec_client.update_session_var(self.session_variables)
+        self.warm_up()
+        self._send_session_variables()
 
         with get_tracer().start_as_current_span("run_code"):
             self.tracing.set_span_attribute("code", code)
             result = self.exec_client.execute_code(exec_id, code)
+            for step, latency in result.timing.items():
+                self.tracing.set_span_attribute(f"timing.{step}_ms", latency)
+
+        return self._handle_result(result)
+
+    @tracing_decorator_async
+    async def execute_code_async(self, exec_id: str, code: str) -> ExecutionResult:
+        if not self.client_started or not self.plugin_loaded:
+            # starting the kernel and loading the plugins is done once per session, in a worker thread
+            await asyncio.to_thread(self.warm_up)
+        self._send_session_variables()
+
+        with get_tracer().start_as_current_span("run_code"):
+            self.tracing.set_span_attribute("code", code)
+            result = await self.exec_client.execute_code_async(exec_id, code)
+            for step, latency in result.timing.items():
+                self.tracing.set_span_attribute(f"timing.{step}_ms", latency)
+
+        return self._handle_result(result)
+
+    def _send_session_variables(self) -> None:
+        # only send the session variables changed since the last execution
+        if len(self.pending_session_variables) > 0:
+            self.exec_client.update_session_var(self.pending_session_variables)
+            self.pending_session_variables = {}
 
+    def _handle_result(self, result: ExecutionResult) -> ExecutionResult:
         if result.is_success:
             for artifact in result.artifact:
                 if artifact.file_name == "":
@@ -108,8 +134,23 @@ class CodeExecutor:
         self.tracing.set_span_attribute("result", self.format_code_output(result, with_code=False))
 
         return result
-    
+
+    def warm_up(self) -> None:
+        """Start the execution client and load plugins if not done yet."""
+        if not self.client_started:
+            with get_tracer().start_as_current_span("start"):
+                self.start()
+                self.client_started = True
+
+        if not self.plugin_loaded:
+            with get_tracer().start_as_current_span("load_plugin"):
+                self.load_plugin()
+                self.plugin_loaded = True
+
     def update_session_var(self, session_var_dict: dict) -> None:
+        for key, value in session_var_dict.items():
+            if key not in self.session_variables or self.session_variables[key] != value:
+                self.pending_session_variables[key] = value
         self.session_variables.update(session_var_dict)
 
     def _save_file(
@@ -146,7 +187,9 @@ class CodeExecutor:
         self.exec_client.start()
 
     def stop(self):
-        self.exec_client.stop()
+        if self._exec_client is None:
+            return
+        self._exec_client.stop()
 
     def format_code_output(
         self,
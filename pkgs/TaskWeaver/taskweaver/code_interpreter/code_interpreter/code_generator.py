@@ -1,3 +1,4 @@
+import asyncio
 import json
 import os
 from typing import List, Optional
@@ -12,12 +13,13 @@ from taskweaver.memory import Attachment, Conversation, Memory, Post, Round, Rou
 from taskweaver.memory.attachment import AttachmentType
 from taskweaver.memory.experience import Experience, ExperienceGenerator
 from taskweaver.memory.plugin import PluginEntry, PluginRegistry
-from taskweaver.misc.example import load_examples
+from taskweaver.misc.example import ExampleCache, load_examples
 from taskweaver.module.event_emitter import PostEventProxy, SessionEventEmitter
-from taskweaver.module.tracing import Tracing, tracing_decorator
+from taskweaver.module.prompt_cache import PromptCache, concat_prompt
+from taskweaver.module.tracing import Tracing, tracing_decorator, tracing_decorator_async
 from taskweaver.role import PostTranslator, Role
 from taskweaver.role.role import RoleConfig
-from taskweaver.utils import read_yaml
+from taskweaver.utils import read_yaml_cached
 
 
 class CodeGeneratorConfig(RoleConfig):
@@ -72,6 +74,7 @@ class CodeGenerator(Role):
         round_compressor: RoundCompressor,
         post_translator: PostTranslator,
         experience_generator: ExperienceGenerator,
+        example_cache: ExampleCache,
     ):
         super().__init__(config, logger, tracing, event_emitter)
         self.llm_api = llm_api
@@ -79,7 +82,7 @@ class CodeGenerator(Role):
         self.role_name = self.config.role_name
 
         self.post_translator = post_translator
-        self.prompt_data = read_yaml(self.config.prompt_file_path)
+        self.prompt_data = read_yaml_cached(self.config.prompt_file_path)
 
         self.instruction_template = self.prompt_data["content"]
 
@@ -89,6 +92,7 @@ class CodeGenerator(Role):
         self.query_requirements_template = self.prompt_data["requirements"]
 
         self.examples = None
+        self.example_cache = example_cache
         self.code_verification_on: bool = False
         self.allowed_modules: List[str] = []
 
@@ -96,8 +100,15 @@ class CodeGenerator(Role):
             ROLE_NAME=self.role_name,
         )
 
+        # the system prompt with the examples, keyed by the experiences in the system prompt
+        self.prompt_prefix_cache = PromptCache(max_entries=8)
+        # the formatted plugin descriptions, keyed by the selected plugins
+        self.plugin_prompt_cache = PromptCache(max_entries=32)
+        # the number of leading messages of the last prompt that are stable across hops
+        self.prompt_prefix_length = 0
+
         self.round_compressor: RoundCompressor = round_compressor
-        self.compression_template = read_yaml(self.config.compression_prompt_path)["content"]
+        self.compression_template = read_yaml_cached(self.config.compression_prompt_path)["content"]
 
         if self.config.enable_auto_plugin_selection:
             self.plugin_selector = PluginSelector(plugin_registry, self.llm_api)
@@ -107,15 +118,29 @@ class CodeGenerator(Role):
 
         if self.config.use_experience:
             self.experience_generator = experience_generator
-            self.experience_generator.refresh()
-            self.experience_generator.load_experience()
-            self.logger.info(
-                "Experience loaded successfully, "
-                "there are {} experiences".format(len(self.experience_generator.experience_list)),
-            )
+        # the experiences are loaded on first use
+        self.experience_loaded = False
 
         self.logger.info("CodeGenerator initialized successfully")
 
+    def load_experience(self) -> None:
+        """Load the experiences if not done yet, summarizing the new raw experiences with the LLM."""
+        if self.experience_loaded:
+            return
+        self.experience_generator.refresh()
+        self.experience_generator.load_experience()
+        self.logger.info(
+            "Experience loaded successfully, "
+            "there are {} experiences".format(len(self.experience_generator.experience_list)),
+        )
+        self.experience_loaded = True
+
+    def warm_up(self) -> None:
+        if self.examples is None:
+            self.examples = self.load_examples()
+        if self.config.use_experience:
+            self.load_experience()
+
     def configure_verification(
         self,
         code_verification_on: bool,
@@ -164,14 +189,10 @@ class CodeGenerator(Role):
             else ""
         )
 
-        chat_history = [format_chat_message(role="system", message=f"{self.instruction}\n{experiences}")]
-
-        if self.examples is None:
-            self.examples = self.load_examples()
-        for i, example in enumerate(self.examples):
-            chat_history.extend(
-                self.compose_conversation(example.rounds, example.plugins, add_requirements=False),
-            )
+        prompt_prefix = self.prompt_prefix_cache.get_or_compose(
+            experiences,
+            lambda: self.compose_prompt_prefix(experiences),
+        )
 
         summary = None
         if self.config.prompt_compression:
@@ -183,7 +204,8 @@ class CodeGenerator(Role):
                 prompt_template=self.compression_template,
             )
 
-        chat_history.extend(
+        chat_history, self.prompt_prefix_length = concat_prompt(
+            prompt_prefix,
             self.compose_conversation(
                 rounds,
                 add_requirements=True,
@@ -193,6 +215,28 @@ class CodeGenerator(Role):
         )
         return chat_history
 
+    def prepare_next_round(self, memory: Memory) -> None:
+        if self.config.prompt_compression:
+            self.round_compressor.summarize_in_background(
+                memory.get_role_rounds(role=self.alias, include_failure_rounds=False),
+                rounds_formatter=lambda _rounds: str(
+                    self.compose_conversation(_rounds, self.plugin_pool, add_requirements=False),
+                ),
+                prompt_template=self.compression_template,
+            )
+
+    def compose_prompt_prefix(self, experiences: str) -> List[ChatMessageType]:
+        """Compose the static part of the prompt, i.e., the system prompt and the examples."""
+        chat_history = [format_chat_message(role="system", message=f"{self.instruction}\n{experiences}")]
+
+        if self.examples is None:
+            self.examples = self.load_examples()
+        for i, example in enumerate(self.examples):
+            chat_history.extend(
+                self.compose_conversation(example.rounds, example.plugins, add_requirements=False),
+            )
+        return chat_history
+
     def format_attachment(self, attachment: Attachment):
         if attachment.type == AttachmentType.thought:
             return attachment.content.format(ROLE_NAME=self.role_name)
@@ -337,6 +381,45 @@ class CodeGenerator(Role):
     ) -> Post:
         assert post_proxy is not None, "Post proxy is not provided."
 
+        prompt = self._compose_reply_prompt(memory)
+        self.post_translator.raw_text_to_post(
+            llm_output=self.llm_api.chat_completion_stream(
+                prompt,
+                use_smoother=True,
+                llm_alias=self.config.llm_alias,
+            ),
+            post_proxy=post_proxy,
+            early_stop=self._early_stop,
+        )
+
+        return self._end_reply(post_proxy, prompt, prompt_log_path)
+
+    @tracing_decorator_async
+    async def reply_async(
+        self,
+        memory: Memory,
+        post_proxy: Optional[PostEventProxy] = None,
+        prompt_log_path: Optional[str] = None,
+    ) -> Post:
+        assert post_proxy is not None, "Post proxy is not provided."
+
+        if self.config.enable_auto_plugin_selection or self.config.use_experience or self.config.prompt_compression:
+            # the plugin selection, the experience retrieval and the summarization may call the LLM synchronously
+            prompt = await asyncio.to_thread(self._compose_reply_prompt, memory)
+        else:
+            prompt = self._compose_reply_prompt(memory)
+        await self.post_translator.raw_text_to_post_async(
+            llm_output=self.llm_api.chat_completion_stream_async(
+                prompt,
+                llm_alias=self.config.llm_alias,
+            ),
+            post_proxy=post_proxy,
+            early_stop=self._early_stop,
+        )
+
+        return self._end_reply(post_proxy, prompt, prompt_log_path)
+
+    def _compose_reply_prompt(self, memory: Memory) -> List[ChatMessageType]:
         # extract all rounds from memory
         rounds = memory.get_role_rounds(
             role=self.alias,
@@ -354,12 +437,14 @@ class CodeGenerator(Role):
             self.plugin_pool = self.select_plugins_for_prompt(query)
 
         if self.config.use_experience:
+            self.load_experience()
             selected_experiences = self.experience_generator.retrieve_experience(query)
         else:
             selected_experiences = None
 
         prompt = self.compose_prompt(rounds, self.plugin_pool, selected_experiences)
         self.tracing.set_span_attribute("prompt", json.dumps(prompt, indent=2))
+        self.tracing.set_span_attribute("prompt_prefix_length", self.prompt_prefix_length)
         prompt_size = self.tracing.count_tokens(json.dumps(prompt))
         self.tracing.set_span_attribute("prompt_size", prompt_size)
         self.tracing.add_prompt_size(
@@ -368,23 +453,21 @@ class CodeGenerator(Role):
                 "direction": "input",
             },
         )
+        return prompt
 
-        def early_stop(_type: AttachmentType, value: str) -> bool:
-            if _type in [AttachmentType.text, AttachmentType.python, AttachmentType.sample]:
-                return True
-            else:
-                return False
-
-        self.post_translator.raw_text_to_post(
-            llm_output=self.llm_api.chat_completion_stream(
-                prompt,
-                use_smoother=True,
-                llm_alias=self.config.llm_alias,
-            ),
-            post_proxy=post_proxy,
-            early_stop=early_stop,
-        )
+    @staticmethod
+    def _early_stop(_type: AttachmentType, value: str) -> bool:
+        if _type in [AttachmentType.text, AttachmentType.python, AttachmentType.sample]:
+            return True
+        else:
+            return False
 
+    def _end_reply(
+        self,
+        post_proxy: PostEventProxy,
+        prompt: List[ChatMessageType],
+        prompt_log_path: Optional[str],
+    ) -> Post:
         post_proxy.update_send_to("Planner")
         generated_code = ""
         for attachment in post_proxy.post.attachment_list:
@@ -411,8 +494,11 @@ class CodeGenerator(Role):
         plugin_list: List[PluginEntry],
     ) -> str:
         if self.config.load_plugin:
-            return "\n".join(
-                [plugin.format_prompt() for plugin in plugin_list],
+            return self.plugin_prompt_cache.get_or_compose(
+                tuple(plugin.name for plugin in plugin_list),
+                lambda: "\n".join(
+                    [plugin.format_prompt() for plugin in plugin_list],
+                ),
             )
         return ""
 
@@ -423,6 +509,7 @@ class CodeGenerator(Role):
             return load_examples(
                 folder=self.config.example_base_path,
                 role_set={self.alias, "Planner"},
+                example_cache=self.example_cache,
             )
         return []
 
@@ -3,6 +3,7 @@ from typing import Dict, Literal, Optional
 
 from injector import inject
 
+from taskweaver.ces.common import ExecutionResult
 from taskweaver.code_interpreter.code_executor import CodeExecutor
 from taskweaver.code_interpreter.code_interpreter import (
     CodeGenerator,
@@ -15,7 +16,7 @@ from taskweaver.logging import TelemetryLogger
 from taskweaver.memory import Memory, Post
 from taskweaver.memory.attachment import AttachmentType
 from taskweaver.module.event_emitter import PostEventProxy, SessionEventEmitter
-from taskweaver.module.tracing import Tracing, get_tracer, tracing_decorator
+from taskweaver.module.tracing import Tracing, get_tracer, tracing_decorator, tracing_decorator_async
 from taskweaver.role import Role
 from taskweaver.role.role import RoleConfig, RoleEntry
 
@@ -119,7 +120,7 @@ class CodeInterpreter(Role, Interpreter):
 
     def get_intro(self) -> str:
         return self.intro.format(plugin_description=self.plugin_description)
-    
+
     def update_session_variables(self, session_variables: Dict[str, str]):
         self.logger.info(f"Updating session variables: {session_variables}")
         self.executor.update_session_var(session_variables)
@@ -138,6 +139,45 @@ class CodeInterpreter(Role, Interpreter):
             prompt_log_path,
         )
 
+        code = self._verify_code(post_proxy)
+        if code is None:
+            return post_proxy.end()
+
+        exec_result = self.executor.execute_code(
+            exec_id=post_proxy.post.id,
+            code=code,
+        )
+        return self._end_reply(post_proxy, exec_result)
+
+    @tracing_decorator_async
+    async def reply_async(
+        self,
+        memory: Memory,
+        prompt_log_path: Optional[str] = None,
+    ) -> Post:
+        post_proxy = self.event_emitter.create_post_proxy(self.alias)
+        post_proxy.update_status("generating code")
+        await self.generator.reply_async(
+            memory,
+            post_proxy,
+            prompt_log_path,
+        )
+
+        code = self._verify_code(post_proxy)
+        if code is None:
+            return post_proxy.end()
+
+        exec_result = await self.executor.execute_code_async(
+            exec_id=post_proxy.post.id,
+            code=code,
+        )
+        return self._end_reply(post_proxy, exec_result)
+
+    def _verify_code(self, post_proxy: PostEventProxy) -> Optional[str]:
+        """
+        Verify the generated code, and get it if it is to be executed.
+        None is returned if there is nothing to execute, with the post updated to tell why.
+        """
         if post_proxy.post.message is not None and post_proxy.post.message != "":  # type: ignore
             update_verification(
                 post_proxy,
@@ -146,7 +186,7 @@ class CodeInterpreter(Role, Interpreter):
             )
             update_execution(post_proxy, "NONE", "No code is executed.")
 
-            return post_proxy.end()
+            return None
 
         code = next(
             (a for a in post_proxy.post.attachment_list if a.type == AttachmentType.python),
@@ -179,7 +219,7 @@ class CodeInterpreter(Role, Interpreter):
             else:
                 self.retry_count = 0
 
-            return post_proxy.end()
+            return None
 
         self.tracing.set_span_attribute("code", code.content)
         post_proxy.update_status("verifying code")
@@ -229,18 +269,15 @@ class CodeInterpreter(Role, Interpreter):
                 "NONE",
                 "No code is executed due to code verification failure.",
             )
-            return post_proxy.end()
+            return None
         elif len(code_verify_errors) == 0:
             update_verification(post_proxy, "CORRECT", "No error is found.")
 
         post_proxy.update_status("executing code")
         self.logger.info(f"Code to be executed: {code.content}")
+        return code.content
 
-        exec_result = self.executor.execute_code(
-            exec_id=post_proxy.post.id,
-            code=code.content,
-        )
-
+    def _end_reply(self, post_proxy: PostEventProxy, exec_result: ExecutionResult) -> Post:
         code_output = self.executor.format_code_output(
             exec_result,
             with_code=False,
@@ -297,6 +334,13 @@ class CodeInterpreter(Role, Interpreter):
 
         return reply_post
 
+    def warm_up(self) -> None:
+        self.generator.warm_up()
+        self.executor.warm_up()
+
+    def prepare_next_round(self, memory: Memory) -> None:
+        self.generator.prepare_next_round(memory)
+
     def close(self) -> None:
         self.generator.close()
         self.executor.stop()
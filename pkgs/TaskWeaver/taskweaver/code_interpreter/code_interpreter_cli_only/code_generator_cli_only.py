@@ -14,7 +14,7 @@ from taskweaver.module.event_emitter import PostEventProxy, SessionEventEmitter
 from taskweaver.module.tracing import Tracing, tracing_decorator
 from taskweaver.role import Role
 from taskweaver.role.role import RoleConfig
-from taskweaver.utils import read_yaml
+from taskweaver.utils import read_yaml_cached
 
 
 class CodeGeneratorCLIOnlyConfig(RoleConfig):
@@ -56,7 +56,7 @@ class CodeGeneratorCLIOnly(Role):
 
         self.role_name = self.config.role_name
 
-        self.prompt_data = read_yaml(self.config.prompt_file_path)
+        self.prompt_data = read_yaml_cached(self.config.prompt_file_path)
         self.instruction_template = self.prompt_data["content"]
 
         self.os_name = platform.system()
@@ -1,14 +1,15 @@
 import os
-from typing import Dict, List
+from typing import TYPE_CHECKING, Dict, List, Optional
 
-import numpy as np
 from injector import inject
-from sklearn.metrics.pairwise import cosine_similarity
 
 from taskweaver.llm import LLMApi
 from taskweaver.memory.plugin import PluginEntry, PluginRegistry
 from taskweaver.utils import generate_md5_hash, write_yaml
 
+if TYPE_CHECKING:
+    import numpy as np
+
 
 class SelectedPluginPool:
     def __init__(self):
@@ -71,6 +72,8 @@ class PluginSelector:
             self.available_plugins = plugin_registry.get_list()
         self.llm_api = llm_api
         self.plugin_embedding_dict: Dict[str, List[float]] = {}
+        # row i is the L2-normalized embedding of self.available_plugins[i]
+        self.plugin_embedding_matrix: Optional["np.ndarray"] = None
 
         self.exception_message_for_refresh = (
             "Please cd to the `script` directory and "
@@ -82,11 +85,12 @@ class PluginSelector:
             os.makedirs(self.meta_file_dir)
 
     def refresh(self):
+        embedding_model = self.llm_api.embedding_service.config.embedding_model
         plugins_to_embedded = []
         for idx, p in enumerate(self.available_plugins):
             if (
                 len(p.meta_data.embedding) > 0
-                and p.meta_data.embedding_model == self.llm_api.embedding_service.config.embedding_model
+                and p.meta_data.embedding_model == embedding_model
                 and p.meta_data.md5hash == generate_md5_hash(p.spec.name + p.spec.description)
             ):
                 continue
@@ -97,14 +101,15 @@ class PluginSelector:
             print("All plugins are up-to-date.")
             return
 
-        plugin_embeddings = self.llm_api.get_embedding_list([text for idx, text in plugins_to_embedded])
-
-        for i, embedding in enumerate(plugin_embeddings):
-            p = self.available_plugins[plugins_to_embedded[i][0]]
-            p.meta_data.embedding = embedding
-            p.meta_data.embedding_model = self.llm_api.embedding_service.config.embedding_model
-            p.meta_data.md5hash = generate_md5_hash(p.spec.name + p.spec.description)
-            write_yaml(p.meta_data.path, p.meta_data.to_dict())
+        # the meta files of a batch are written as soon as it is embedded, while the other batches are in flight,
+        # so the plugins embedded before a failure do not need to be embedded again
+        for offset, plugin_embeddings in self.llm_api.iter_embedding_list([text for idx, text in plugins_to_embedded]):
+            for i, embedding in enumerate(plugin_embeddings):
+                p = self.available_plugins[plugins_to_embedded[offset + i][0]]
+                p.meta_data.embedding = embedding
+                p.meta_data.embedding_model = embedding_model
+                p.meta_data.md5hash = generate_md5_hash(p.spec.name + p.spec.description)
+                write_yaml(p.meta_data.path, p.meta_data.to_dict())
 
     def load_plugin_embeddings(self):
         for idx, p in enumerate(self.available_plugins):
@@ -127,30 +132,38 @@ class PluginSelector:
 
             self.plugin_embedding_dict[p.name] = p.meta_data.embedding
 
-    def plugin_select(self, user_query: str, top_k: int = 5) -> List[PluginEntry]:
-        user_query_embedding = np.array(self.llm_api.get_embedding(user_query))
+        import numpy as np
 
-        similarities = []
+        self.plugin_embedding_matrix = self._normalize(
+            np.array(
+                [self.plugin_embedding_dict[p.name] for p in self.available_plugins],
+                dtype=np.float32,
+            ).reshape(len(self.available_plugins), -1),
+        )
+
+    @staticmethod
+    def _normalize(embeddings: "np.ndarray") -> "np.ndarray":
+        import numpy as np
 
+        norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+        return np.ascontiguousarray(embeddings / np.maximum(norms, 1e-12), dtype=np.float32)
+
+    def plugin_select(self, user_query: str, top_k: int = 5) -> List[PluginEntry]:
         if top_k >= len(self.available_plugins):
             return self.available_plugins
 
-        for p in self.available_plugins:
-            similarity = cosine_similarity(
-                user_query_embedding.reshape(
-                    1,
-                    -1,
-                ),
-                np.array(self.plugin_embedding_dict[p.name]).reshape(1, -1),
-            )
-            similarities.append((p, similarity))
+        assert self.plugin_embedding_matrix is not None, "Plugin embeddings are not loaded."
+        import numpy as np
+
+        user_query_embedding = self._normalize(
+            np.array(self.llm_api.get_embedding(user_query), dtype=np.float32),
+        )
 
-        plugins_rank = sorted(
-            similarities,
-            key=lambda x: x[1],
-            reverse=True,
-        )[:top_k]
+        # cosine similarity of all plugins at once, then an O(n) partial selection of the top k
+        similarities = self.plugin_embedding_matrix @ user_query_embedding
+        top_indices = np.argpartition(-similarities, top_k - 1)[:top_k]
+        top_indices = top_indices[np.argsort(-similarities[top_indices], kind="stable")]
 
-        selected_plugins = [p for p, sim in plugins_rank]
+        selected_plugins = [self.available_plugins[i] for i in top_indices]
 
         return selected_plugins
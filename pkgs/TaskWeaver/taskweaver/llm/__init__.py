@@ -1,10 +1,11 @@
+import contextlib
+import importlib
 import types
-from typing import Any, Callable, Generator, List, Optional, Type
+from typing import Any, AsyncGenerator, Callable, Dict, Generator, Iterator, List, Optional, Tuple, Type
 
 from injector import Injector, Module, inject, provider
 
 from taskweaver.config.config_mgt import AppConfigSource
-from taskweaver.llm.azure_ml import AzureMLService
 from taskweaver.llm.base import (
     CompletionService,
     EmbeddingService,
@@ -12,31 +13,61 @@ from taskweaver.llm.base import (
     LLMModuleConfig,
     LLMServiceConfig,
 )
-from taskweaver.llm.google_genai import GoogleGenAIService
-from taskweaver.llm.groq import GroqService, GroqServiceConfig
-from taskweaver.llm.mock import MockApiService
-from taskweaver.llm.ollama import OllamaService
-from taskweaver.llm.openai import OpenAIService
+from taskweaver.llm.completion_cache import CompletionCache
+from taskweaver.llm.embedding_cache import EmbeddingCache
 from taskweaver.llm.placeholder import PlaceholderEmbeddingService
-from taskweaver.llm.qwen import QWenService, QWenServiceConfig
-from taskweaver.llm.sentence_transformer import SentenceTransformerService
 from taskweaver.llm.util import ChatMessageType, format_chat_message
-from taskweaver.llm.zhipuai import ZhipuAIService
+from taskweaver.utils import map_concurrently
+
+# the services are imported on first use, so that only the SDKs of the configured API types are loaded
+_lazy_services: Dict[str, str] = {
+    "AzureMLService": "taskweaver.llm.azure_ml",
+    "GoogleGenAIService": "taskweaver.llm.google_genai",
+    "GroqService": "taskweaver.llm.groq",
+    "GroqServiceConfig": "taskweaver.llm.groq",
+    "MockApiService": "taskweaver.llm.mock",
+    "OllamaService": "taskweaver.llm.ollama",
+    "OpenAIService": "taskweaver.llm.openai",
+    "QWenService": "taskweaver.llm.qwen",
+    "QWenServiceConfig": "taskweaver.llm.qwen",
+    "SentenceTransformerService": "taskweaver.llm.sentence_transformer",
+    "ZhipuAIService": "taskweaver.llm.zhipuai",
+}
+
+
+def __getattr__(name: str) -> Any:
+    if name in _lazy_services:
+        return getattr(importlib.import_module(_lazy_services[name]), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def get_service_class(name: str) -> Type[Any]:
+    """Import the service class of the given name, e.g., `OpenAIService`."""
+    return __getattr__(name)
+
 
 llm_completion_config_map = {
-    "openai": OpenAIService,
-    "azure": OpenAIService,
-    "azure_ad": OpenAIService,
-    "azure_ml": AzureMLService,
-    "ollama": OllamaService,
-    "google_genai": GoogleGenAIService,
-    "qwen": QWenService,
-    "zhipuai": ZhipuAIService,
-    "groq": GroqService,
+    "openai": "OpenAIService",
+    "azure": "OpenAIService",
+    "azure_ad": "OpenAIService",
+    "azure_ml": "AzureMLService",
+    "ollama": "OllamaService",
+    "google_genai": "GoogleGenAIService",
+    "qwen": "QWenService",
+    "zhipuai": "ZhipuAIService",
+    "groq": "GroqService",
 }
 
-# TODO
-llm_embedding_config_map = {}
+llm_embedding_config_map = {
+    "openai": "OpenAIService",
+    "azure": "OpenAIService",
+    "azure_ad": "OpenAIService",
+    "ollama": "OllamaService",
+    "google_genai": "GoogleGenAIService",
+    "sentence_transformers": "SentenceTransformerService",
+    "qwen": "QWenService",
+    "zhipuai": "ZhipuAIService",
+}
 
 
 class LLMApi(object):
@@ -51,36 +82,14 @@ class LLMApi(object):
         self.injector = injector
         self.ext_llm_injector = Injector([])
         self.ext_llms = {}  # extra llm models
+        self.ext_llm_cache_namespaces = {}
 
-        if self.config.api_type in ["openai", "azure", "azure_ad"]:
-            self._set_completion_service(OpenAIService)
-        elif self.config.api_type == "ollama":
-            self._set_completion_service(OllamaService)
-        elif self.config.api_type == "azure_ml":
-            self._set_completion_service(AzureMLService)
-        elif self.config.api_type == "google_genai":
-            self._set_completion_service(GoogleGenAIService)
-        elif self.config.api_type == "qwen":
-            self._set_completion_service(QWenService)
-        elif self.config.api_type == "zhipuai":
-            self._set_completion_service(ZhipuAIService)
-        elif self.config.api_type == "groq":
-            self._set_completion_service(GroqService)
-        else:
+        if self.config.api_type not in llm_completion_config_map:
             raise ValueError(f"API type {self.config.api_type} is not supported")
+        self._set_completion_service(get_service_class(llm_completion_config_map[self.config.api_type]))
 
-        if self.config.embedding_api_type in ["openai", "azure", "azure_ad"]:
-            self._set_embedding_service(OpenAIService)
-        elif self.config.embedding_api_type == "ollama":
-            self._set_embedding_service(OllamaService)
-        elif self.config.embedding_api_type == "google_genai":
-            self._set_embedding_service(GoogleGenAIService)
-        elif self.config.embedding_api_type == "sentence_transformers":
-            self._set_embedding_service(SentenceTransformerService)
-        elif self.config.embedding_api_type == "qwen":
-            self._set_embedding_service(QWenService)
-        elif self.config.embedding_api_type == "zhipuai":
-            self._set_embedding_service(ZhipuAIService)
+        if self.config.embedding_api_type in llm_embedding_config_map:
+            self._set_embedding_service(get_service_class(llm_embedding_config_map[self.config.embedding_api_type]))
         elif self.config.embedding_api_type == "azure_ml":
             self.embedding_service = PlaceholderEmbeddingService(
                 "Azure ML does not support embeddings yet. Please configure a different embedding API.",
@@ -98,11 +107,38 @@ class LLMApi(object):
             # add mock proxy layer to the completion and embedding services
             base_completion_service = self.completion_service
             base_embedding_service = self.embedding_service
-            mock = self.injector.get(MockApiService)
+            mock_service_class = get_service_class("MockApiService")
+            mock = self.injector.get(mock_service_class)
             mock.set_base_completion_service(base_completion_service)
             mock.set_base_embedding_service(base_embedding_service)
-            self._set_completion_service(MockApiService)
-            self._set_embedding_service(MockApiService)
+            self._set_completion_service(mock_service_class)
+            self._set_embedding_service(mock_service_class)
+
+        # the mock service has its own record/playback cache
+        self.embedding_cache: Optional[EmbeddingCache] = None
+        if not self.config.use_mock:
+            embedding_cache = self.injector.get(EmbeddingCache)
+            self.injector.binder.bind(EmbeddingCache, to=embedding_cache)
+            if embedding_cache.config.enabled:
+                self.embedding_cache = embedding_cache
+            # the cache is partitioned by the model actually used by the embedding service
+            embedding_model = getattr(
+                getattr(self.embedding_service, "config", None),
+                "embedding_model",
+                self.config.embedding_model,
+            )
+            self.embedding_cache_namespace = f"{self.config.embedding_api_type}:{embedding_model}"
+
+        self.completion_cache: Optional[CompletionCache] = None
+        if not self.config.use_mock:
+            completion_cache = self.injector.get(CompletionCache)
+            self.injector.binder.bind(CompletionCache, to=completion_cache)
+            if completion_cache.config.enabled:
+                self.completion_cache = completion_cache
+        self.completion_cache_namespace = self._get_completion_cache_namespace(
+            self.config.api_type,
+            self.completion_service,
+        )
 
         if ext_llms_config is not None:
             for key, config in ext_llms_config.ext_llm_config_mapping.items():
@@ -110,6 +146,10 @@ class LLMApi(object):
                 assert api_type in llm_completion_config_map, f"API type {api_type}  is not supported"
                 llm_completion_service = self._get_completion_service(config)
                 self.ext_llms[key] = llm_completion_service
+                self.ext_llm_cache_namespaces[key] = self._get_completion_cache_namespace(
+                    api_type,
+                    llm_completion_service,
+                )
 
     def _set_completion_service(self, svc: Type[CompletionService]) -> None:
         self.completion_service: CompletionService = self.injector.get(svc)
@@ -122,12 +162,99 @@ class LLMApi(object):
     def _get_completion_service(self, config) -> CompletionService:
         self.ext_llm_injector.binder.bind(AppConfigSource, to=config)
         api_type = config.get_str("llm.api_type")
-        return self.ext_llm_injector.get(llm_completion_config_map[api_type])
+        return self.ext_llm_injector.get(get_service_class(llm_completion_config_map[api_type]))
 
     def _get_embedding_service(self, svc: Type[EmbeddingService]) -> EmbeddingService:
         # TODO
         pass
 
+    def _get_completion_cache_namespace(self, api_type: str, completion_service: CompletionService) -> str:
+        # the cache is partitioned by the model actually used by the completion service
+        model = getattr(getattr(completion_service, "config", None), "model", self.config.model)
+        return f"{api_type}:{model}"
+
+    def _select_completion_service(self, llm_alias: Optional[str]) -> Tuple[CompletionService, str]:
+        if llm_alias is not None and llm_alias != "":
+            if llm_alias in self.ext_llms:
+                return (
+                    self.ext_llms[llm_alias],
+                    self.ext_llm_cache_namespaces[llm_alias],
+                )
+            else:
+                raise ValueError(
+                    f"Cannot import extra LLM model {llm_alias}, ",
+                )
+        return self.completion_service, self.completion_cache_namespace
+
+    def _get_completion_cache_key(
+        self,
+        namespace: str,
+        messages: List[ChatMessageType],
+        temperature: Optional[float],
+        max_tokens: Optional[int],
+        top_p: Optional[float],
+        stop: Optional[List[str]],
+        **kwargs: Any,
+    ) -> str:
+        assert self.completion_cache is not None
+        return self.completion_cache.get_key(
+            namespace,
+            messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            top_p=top_p,
+            stop=stop,
+            **kwargs,
+        )
+
+    def _cached_chat_completion(
+        self,
+        completion_service: CompletionService,
+        namespace: str,
+        messages: List[ChatMessageType],
+        stream: bool,
+        temperature: Optional[float],
+        max_tokens: Optional[int],
+        top_p: Optional[float],
+        stop: Optional[List[str]],
+        **kwargs: Any,
+    ) -> Generator[ChatMessageType, None, None]:
+        if self.completion_cache is None:
+            yield from completion_service.chat_completion(
+                messages,
+                stream,
+                temperature,
+                max_tokens,
+                top_p,
+                stop,
+                **kwargs,
+            )
+            return
+
+        key = self._get_completion_cache_key(namespace, messages, temperature, max_tokens, top_p, stop, **kwargs)
+        cached = self.completion_cache.get(key)
+        if cached is not None:
+            yield from self.completion_cache.replay(cached)
+            return
+
+        response: ChatMessageType = format_chat_message("assistant", "")
+        for msg_chunk in completion_service.chat_completion(
+            messages,
+            stream,
+            temperature,
+            max_tokens,
+            top_p,
+            stop,
+            **kwargs,
+        ):
+            response["role"] = msg_chunk["role"]
+            response["content"] += msg_chunk["content"]
+            if "name" in msg_chunk:
+                response["name"] = msg_chunk["name"]
+            yield msg_chunk
+        # only complete responses are cached, a stream closed early does not reach here
+        self.completion_cache.set(key, response)
+
     def chat_completion(
         self,
         messages: List[ChatMessageType],
@@ -140,16 +267,10 @@ class LLMApi(object):
         **kwargs: Any,
     ) -> ChatMessageType:
         msg: ChatMessageType = format_chat_message("assistant", "")
-        if llm_alias is not None and llm_alias != "":
-            if llm_alias in self.ext_llms:
-                completion_service = self.ext_llms[llm_alias]
-            else:
-                raise ValueError(
-                    f"Cannot import extra LLM model {llm_alias}, ",
-                )
-        else:
-            completion_service = self.completion_service
-        for msg_chunk in completion_service.chat_completion(
+        completion_service, namespace = self._select_completion_service(llm_alias)
+        for msg_chunk in self._cached_chat_completion(
+            completion_service,
+            namespace,
             messages,
             stream,
             temperature,
@@ -177,16 +298,10 @@ class LLMApi(object):
         **kwargs: Any,
     ) -> Generator[ChatMessageType, None, None]:
         def get_generator() -> Generator[ChatMessageType, None, None]:
-            if llm_alias is not None and llm_alias != "":
-                if llm_alias in self.ext_llms:
-                    completion_service = self.ext_llms[llm_alias]
-                else:
-                    raise ValueError(
-                        f"Cannot import extra LLM model {llm_alias}, ",
-                    )
-            else:
-                completion_service = self.completion_service
-            return completion_service.chat_completion(
+            completion_service, namespace = self._select_completion_service(llm_alias)
+            return self._cached_chat_completion(
+                completion_service,
+                namespace,
                 messages,
                 stream,
                 temperature,
@@ -200,6 +315,54 @@ class LLMApi(object):
             return self._stream_smoother(get_generator)
         return get_generator()
 
+    async def chat_completion_stream_async(
+        self,
+        messages: List[ChatMessageType],
+        stream: bool = True,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        top_p: Optional[float] = None,
+        stop: Optional[List[str]] = None,
+        llm_alias: Optional[str] = None,
+        **kwargs: Any,
+    ) -> AsyncGenerator[ChatMessageType, None]:
+        """
+        The asynchronous counterpart of `chat_completion_stream`, for the callers running on an event loop.
+        The chunks are yielded as they arrive, without the smoother and its thread.
+        """
+        completion_service, namespace = self._select_completion_service(llm_alias)
+        key: Optional[str] = None
+        if self.completion_cache is not None:
+            key = self._get_completion_cache_key(namespace, messages, temperature, max_tokens, top_p, stop, **kwargs)
+            cached = self.completion_cache.get(key)
+            if cached is not None:
+                for msg_chunk in self.completion_cache.replay(cached):
+                    yield msg_chunk
+                return
+
+        response: ChatMessageType = format_chat_message("assistant", "")
+        # close the stream of the service as soon as this one is closed, e.g., when the parsing stops early
+        async with contextlib.aclosing(
+            completion_service.chat_completion_async(
+                messages,
+                stream,
+                temperature,
+                max_tokens,
+                top_p,
+                stop,
+                **kwargs,
+            ),
+        ) as response_stream:
+            async for msg_chunk in response_stream:
+                response["role"] = msg_chunk["role"]
+                response["content"] += msg_chunk["content"]
+                if "name" in msg_chunk:
+                    response["name"] = msg_chunk["name"]
+                yield msg_chunk
+        # only complete responses are cached, a stream closed early does not reach here
+        if self.completion_cache is not None and key is not None:
+            self.completion_cache.set(key, response)
+
     def _stream_smoother(
         self,
         stream_init: Callable[[], Generator[ChatMessageType, None, None]],
@@ -383,7 +546,53 @@ class LLMApi(object):
                     pass
 
     def get_embedding(self, string: str) -> List[float]:
-        return self.embedding_service.get_embeddings([string])[0]
+        return self.get_embedding_list([string])[0]
 
     def get_embedding_list(self, strings: List[str]) -> List[List[float]]:
-        return self.embedding_service.get_embeddings(strings)
+        if self.embedding_cache is None:
+            return self.embedding_service.get_embeddings(strings)
+
+        model = self.embedding_cache_namespace
+        embeddings = self.embedding_cache.get(model, strings)
+
+        # embed each distinct missing string only once
+        missing = list(dict.fromkeys(s for s, e in zip(strings, embeddings) if e is None))
+        if len(missing) > 0:
+            new_embeddings = self.embedding_service.get_embeddings(missing)
+            self.embedding_cache.set(model, missing, new_embeddings)
+            embedding_of = dict(zip(missing, new_embeddings))
+            embeddings = [e if e is not None else embedding_of[s] for s, e in zip(strings, embeddings)]
+
+        return embeddings  # type: ignore
+
+    def iter_embedding_list(self, strings: List[str]) -> Iterator[Tuple[int, List[List[float]]]]:
+        """
+        Embed a large number of strings in batches of `llm.embedding_batch_size`,
+        with at most `llm.embedding_concurrency` requests sent at once.
+        A failed batch is retried up to `llm.embedding_max_retries` times.
+
+        :return: An iterator of (offset of the batch in `strings`, embeddings of the batch),
+            in the order the batches complete; the callers can save the results of a batch as soon as it is yielded.
+            If some batches still fail after the retries, an exception is raised once the other batches are yielded.
+        """
+        batch_size = self.config.embedding_batch_size
+        offsets = list(range(0, len(strings), batch_size))
+        failures: List[Tuple[int, Exception]] = []
+        for idx, embeddings, error in map_concurrently(
+            lambda offset: self.get_embedding_list(strings[offset : offset + batch_size]),
+            offsets,
+            max_workers=self.config.embedding_concurrency,
+            max_retries=self.config.embedding_max_retries,
+        ):
+            if error is not None:
+                failures.append((offsets[idx], error))
+            else:
+                assert embeddings is not None
+                yield offsets[idx], embeddings
+
+        if len(failures) > 0:
+            failed_count = sum(min(batch_size, len(strings) - offset) for offset, _ in failures)
+            raise Exception(
+                f"Failed to embed {failed_count} of {len(strings)} strings "
+                f"in {len(failures)} batches, the last error: {failures[-1][1]}",
+            ) from failures[-1][1]
@@ -1,5 +1,6 @@
 import abc
-from typing import Any, Generator, List, Optional
+import asyncio
+from typing import Any, AsyncGenerator, Generator, List, Optional
 
 from injector import inject
 
@@ -61,6 +62,15 @@ class LLMModuleConfig(ModuleConfig):
 
         self.use_mock: bool = self._get_bool("use_mock", False)
 
+        # bulk embedding, e.g., when refreshing the plugin or experience embeddings
+        self.embedding_batch_size: int = self._get_int("embedding_batch_size", 64)
+        self.embedding_concurrency: int = self._get_int("embedding_concurrency", 4)
+        self.embedding_max_retries: int = self._get_int("embedding_max_retries", 3)
+
+        assert self.embedding_batch_size > 0, "embedding_batch_size must be positive"
+        assert self.embedding_concurrency > 0, "embedding_concurrency must be positive"
+        assert self.embedding_max_retries >= 0, "embedding_max_retries must not be negative"
+
 
 class LLMServiceConfig(ModuleConfig):
     @inject
@@ -106,6 +116,35 @@ class CompletionService(abc.ABC):
 
         raise NotImplementedError
 
+    async def chat_completion_async(
+        self,
+        messages: List[ChatMessageType],
+        stream: bool = True,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        top_p: Optional[float] = None,
+        stop: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> AsyncGenerator[ChatMessageType, None]:
+        """
+        Asynchronous chat completion API, with the same parameters as `chat_completion`.
+
+        By default, the chunks of `chat_completion` are pulled in a worker thread of the event loop;
+        the services with an asynchronous client override it to wait for the response on the event loop.
+
+        :return: asynchronous generator of messages
+        """
+        generator = self.chat_completion(messages, stream, temperature, max_tokens, top_p, stop, **kwargs)
+        end = object()
+        try:
+            while True:
+                msg = await asyncio.to_thread(next, generator, end)
+                if msg is end:
+                    break
+                yield msg
+        finally:
+            generator.close()
+
 
 class EmbeddingService(abc.ABC):
     @abc.abstractmethod
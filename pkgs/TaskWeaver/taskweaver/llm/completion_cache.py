@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from injector import inject
+
+from taskweaver.config.module_config import ModuleConfig
+from taskweaver.llm.util import ChatMessageType, format_chat_message
+
+
+class CompletionCacheConfig(ModuleConfig):
+    def _configure(self) -> None:
+        self._set_name("llm.completion_cache")
+
+        # disabled by default, as a cached response is returned for a repeated prompt even with a non-zero temperature
+        self.enabled = self._get_bool("enabled", False)
+        # the number of responses kept in memory
+        self.size = self._get_int("size", 1024)
+        # the number of seconds a response is valid, 0 for no expiration
+        self.ttl = self._get_int("ttl", 24 * 3600)
+        # whether to also keep the responses in an on-disk store that survives restarts
+        self.persist = self._get_bool("persist", False)
+        # the number of responses kept in the on-disk store
+        self.persist_size = self._get_int("persist_size", 100000)
+        self.path = self._get_path(
+            "path",
+            os.path.join(self.src.app_base_path, "cache", "completion_cache.sqlite"),
+        )
+        # the size of the chunks a cached response is streamed back in
+        self.replay_chunk_size = self._get_int("replay_chunk_size", 32)
+
+        assert self.size > 0, "size must be greater than 0"
+        assert self.replay_chunk_size > 0, "replay_chunk_size must be greater than 0"
+
+
+class CompletionCache:
+    """
+    An exact-match cache of chat completion responses.
+    The key is the hash of the normalized messages together with the model and the sampling parameters.
+    Recently used responses are kept in an in-memory LRU; with `persist` enabled,
+    all responses are also written to a sqlite store shared across processes and restarts.
+    """
+
+    @inject
+    def __init__(self, config: CompletionCacheConfig) -> None:
+        self.config = config
+        self.memory_store: OrderedDict[str, Tuple[float, ChatMessageType]] = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes_since_prune = 0
+
+        self.db: Optional[sqlite3.Connection] = None
+        if self.config.persist:
+            os.makedirs(os.path.dirname(self.config.path), exist_ok=True)
+            self.db = sqlite3.connect(self.config.path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS completions ("
+                "key TEXT PRIMARY KEY, created_at REAL NOT NULL, response BLOB NOT NULL)",
+            )
+            self.db.execute("CREATE INDEX IF NOT EXISTS completions_created_at ON completions (created_at)")
+            self.db.commit()
+
+    @staticmethod
+    def _normalize_messages(messages: List[ChatMessageType]) -> List[Dict[str, str]]:
+        # line endings and trailing whitespace do not change the answer of the model
+        normalized: List[Dict[str, str]] = []
+        for message in messages:
+            content = "\n".join(line.rstrip() for line in message["content"].replace("\r\n", "\n").split("\n"))
+            entry = {"role": message["role"], "content": content.strip()}
+            if message.get("name"):
+                entry["name"] = message["name"]  # type: ignore
+            normalized.append(entry)
+        return normalized
+
+    def get_key(self, model: str, messages: List[ChatMessageType], **params: Any) -> str:
+        """Get the cache key of a request; `params` are the sampling parameters of the request."""
+        request = {
+            "model": model,
+            "messages": self._normalize_messages(messages),
+            "params": {k: v for k, v in params.items() if v is not None},
+        }
+        serialized = json.dumps(
+            request,
+            sort_keys=True,
+            separators=(",", ":"),
+            ensure_ascii=False,
+            default=str,
+        )
+        return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+    def _is_expired(self, created_at: float) -> bool:
+        return self.config.ttl > 0 and time.time() - created_at > self.config.ttl
+
+    def get(self, key: str) -> Optional[ChatMessageType]:
+        """Get the cached response of the key, None if it is not cached or expired."""
+        with self.lock:
+            response: Optional[ChatMessageType] = None
+            if key in self.memory_store:
+                created_at, cached = self.memory_store[key]
+                if self._is_expired(created_at):
+                    del self.memory_store[key]
+                else:
+                    self.memory_store.move_to_end(key)
+                    response = cached
+
+            if response is None and self.db is not None:
+                row = self.db.execute(
+                    "SELECT created_at, response FROM completions WHERE key = ?",
+                    (key,),
+                ).fetchone()
+                if row is not None and not self._is_expired(row[0]):
+                    response = json.loads(bytes(row[1]).decode("utf-8"))
+                    self._put_in_memory(key, row[0], response)  # type: ignore
+
+            if response is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return dict(response)  # type: ignore
+
+    def set(self, key: str, response: ChatMessageType) -> None:
+        created_at = time.time()
+        with self.lock:
+            self._put_in_memory(key, created_at, dict(response))  # type: ignore
+            if self.db is not None:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO completions (key, created_at, response) VALUES (?, ?, ?)",
+                    (
+                        key,
+                        created_at,
+                        json.dumps(response, ensure_ascii=False).encode("utf-8"),
+                    ),
+                )
+                # pruning scans the store, so it is only done every 100 writes
+                self.writes_since_prune += 1
+                if self.writes_since_prune >= 100:
+                    self._prune_db()
+                    self.writes_since_prune = 0
+                self.db.commit()
+
+    def _put_in_memory(self, key: str, created_at: float, response: ChatMessageType) -> None:
+        self.memory_store[key] = (created_at, response)
+        self.memory_store.move_to_end(key)
+        while len(self.memory_store) > self.config.size:
+            self.memory_store.popitem(last=False)
+
+    def _prune_db(self) -> None:
+        assert self.db is not None
+        if self.config.ttl > 0:
+            self.db.execute(
+                "DELETE FROM completions WHERE created_at < ?",
+                (time.time() - self.config.ttl,),
+            )
+        self.db.execute(
+            "DELETE FROM completions WHERE key NOT IN "
+            "(SELECT key FROM completions ORDER BY created_at DESC LIMIT ?)",
+            (self.config.persist_size,),
+        )
+
+    def replay(self, response: ChatMessageType) -> List[ChatMessageType]:
+        """Split a cached response into chunks, so that it can be streamed back like a live response."""
+        content = response["content"]
+        size = self.config.replay_chunk_size
+        return [
+            format_chat_message(
+                response["role"],  # type: ignore
+                content[i : i + size],
+                name=response["name"] if "name" in response else None,
+            )
+            for i in range(0, max(len(content), 1), size)
+        ]
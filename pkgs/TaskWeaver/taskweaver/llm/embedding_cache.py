@@ -0,0 +1,115 @@
+import array
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+from injector import inject
+
+from taskweaver.config.module_config import ModuleConfig
+
+
+class EmbeddingCacheConfig(ModuleConfig):
+    def _configure(self) -> None:
+        self._set_name("llm.embedding_cache")
+
+        self.enabled = self._get_bool("enabled", True)
+        # the number of embeddings kept in memory
+        self.size = self._get_int("size", 4096)
+        # whether to also keep the embeddings in an on-disk store that survives restarts
+        self.persist = self._get_bool("persist", False)
+        self.path = self._get_path(
+            "path",
+            os.path.join(self.src.app_base_path, "cache", "embedding_cache.sqlite"),
+        )
+
+
+class EmbeddingCache:
+    """
+    A cache of embeddings keyed by the embedding model and the hash of the content.
+    Recently used embeddings are kept in an in-memory LRU; with `persist` enabled,
+    all embeddings are also written to a sqlite store shared across processes and restarts.
+    """
+
+    @inject
+    def __init__(self, config: EmbeddingCacheConfig) -> None:
+        self.config = config
+        self.memory_store: OrderedDict[str, List[float]] = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self.db: Optional[sqlite3.Connection] = None
+        if self.config.persist:
+            os.makedirs(os.path.dirname(self.config.path), exist_ok=True)
+            self.db = sqlite3.connect(self.config.path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, key TEXT NOT NULL, vector BLOB NOT NULL, PRIMARY KEY (model, key))",
+            )
+            self.db.commit()
+
+    @staticmethod
+    def _get_key(content: str) -> str:
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def get(self, model: str, contents: Sequence[str]) -> List[Optional[List[float]]]:
+        """Get the cached embeddings of the contents, None for the ones not in the cache."""
+        keys = [self._get_key(c) for c in contents]
+        results: List[Optional[List[float]]] = []
+        missing: Dict[str, List[int]] = {}
+        with self.lock:
+            for i, key in enumerate(keys):
+                memory_key = f"{model}:{key}"
+                if memory_key in self.memory_store:
+                    self.memory_store.move_to_end(memory_key)
+                    results.append(self.memory_store[memory_key])
+                else:
+                    results.append(None)
+                    missing.setdefault(key, []).append(i)
+
+            if self.db is not None and len(missing) > 0:
+                for key, vector in self._get_from_db(model, list(missing.keys())).items():
+                    self._put_in_memory(f"{model}:{key}", vector)
+                    for i in missing[key]:
+                        results[i] = vector
+
+            hits = sum(1 for r in results if r is not None)
+            self.hits += hits
+            self.misses += len(results) - hits
+        return results
+
+    def set(self, model: str, contents: Sequence[str], embeddings: Sequence[List[float]]) -> None:
+        keys = [self._get_key(c) for c in contents]
+        with self.lock:
+            for key, embedding in zip(keys, embeddings):
+                self._put_in_memory(f"{model}:{key}", embedding)
+            if self.db is not None:
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (model, key, vector) VALUES (?, ?, ?)",
+                    [(model, key, array.array("f", embedding).tobytes()) for key, embedding in zip(keys, embeddings)],
+                )
+                self.db.commit()
+
+    def _put_in_memory(self, memory_key: str, embedding: List[float]) -> None:
+        self.memory_store[memory_key] = embedding
+        self.memory_store.move_to_end(memory_key)
+        while len(self.memory_store) > self.config.size:
+            self.memory_store.popitem(last=False)
+
+    def _get_from_db(self, model: str, keys: List[str]) -> Dict[str, List[float]]:
+        assert self.db is not None
+        results: Dict[str, List[float]] = {}
+        # stay below the default limit of sqlite host parameters
+        for start in range(0, len(keys), 500):
+            batch = keys[start : start + 500]
+            rows = self.db.execute(
+                f"SELECT key, vector FROM embeddings WHERE model = ? AND key IN ({','.join('?' * len(batch))})",
+                [model, *batch],
+            ).fetchall()
+            for key, vector in rows:
+                # float32 in native byte order, the same layout as numpy.float32 arrays
+                results[key] = array.array("f", vector).tolist()
+        return results
@@ -1,9 +1,10 @@
+import asyncio
 import os
-from typing import Any, Generator, List, Optional
+from typing import Any, AsyncGenerator, Generator, List, Optional
 
 import openai
 from injector import inject
-from openai import AzureOpenAI, OpenAI
+from openai import AsyncAzureOpenAI, AsyncOpenAI, AzureOpenAI, OpenAI
 
 from taskweaver.llm.util import ChatMessageType, format_chat_message
 
@@ -120,6 +121,9 @@ class OpenAIService(CompletionService, EmbeddingService):
                 api_key=(self.config.api_key if api_type == "azure" else self._get_aad_token()),
             )
         )
+        # created on first use by chat_completion_async, for the event loop it runs on
+        self.async_client: Optional[AsyncOpenAI] = None
+        self.async_client_loop: Optional[asyncio.AbstractEventLoop] = None
 
     def chat_completion(
         self,
@@ -224,6 +228,97 @@ class OpenAIService(CompletionService, EmbeddingService):
             # Handle API error, e.g. retry or log
             raise Exception(f"OpenAI API returned an API Error: {e}")
 
+    async def chat_completion_async(
+        self,
+        messages: List[ChatMessageType],
+        stream: bool = True,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        top_p: Optional[float] = None,
+        stop: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> AsyncGenerator[ChatMessageType, None]:
+        if not stream or "tools" in kwargs:
+            # the roles only stream plain completions from a coroutine, the other requests use the default
+            async for msg in super().chat_completion_async(
+                messages,
+                stream,
+                temperature,
+                max_tokens,
+                top_p,
+                stop,
+                **kwargs,
+            ):
+                yield msg
+            return
+
+        if "response_format" in kwargs:
+            response_format = kwargs["response_format"]
+        elif self.config.response_format == "json_object":
+            response_format = {"type": "json_object"}
+        else:
+            response_format = None
+
+        try:
+            res: Any = await self._get_async_client().chat.completions.create(
+                model=self.config.model,
+                messages=messages,  # type: ignore
+                temperature=temperature if temperature is not None else self.config.temperature,
+                max_tokens=max_tokens if max_tokens is not None else self.config.max_tokens,
+                top_p=top_p if top_p is not None else self.config.top_p,
+                frequency_penalty=self.config.frequency_penalty,
+                presence_penalty=self.config.presence_penalty,
+                stop=stop if stop is not None else self.config.stop_token,
+                stream=True,
+                seed=self.config.seed,
+                response_format=response_format,
+            )
+            role: Any = None
+            async for stream_res in res:
+                if not stream_res.choices:
+                    continue
+                delta = stream_res.choices[0].delta
+                if delta is None:
+                    continue
+
+                role = delta.role if delta.role is not None else role
+                content = delta.content if delta.content is not None else ""
+                yield format_chat_message(role, content)
+
+        except openai.APITimeoutError as e:
+            raise Exception(f"OpenAI API request timed out: {e}")
+        except openai.APIConnectionError as e:
+            raise Exception(f"OpenAI API request failed to connect: {e}")
+        except openai.BadRequestError as e:
+            raise Exception(f"OpenAI API request was invalid: {e}")
+        except openai.AuthenticationError as e:
+            raise Exception(f"OpenAI API request was not authorized: {e}")
+        except openai.PermissionDeniedError as e:
+            raise Exception(f"OpenAI API request was not permitted: {e}")
+        except openai.RateLimitError as e:
+            raise Exception(f"OpenAI API request exceeded rate limit: {e}")
+        except openai.APIError as e:
+            raise Exception(f"OpenAI API returned an API Error: {e}")
+
+    def _get_async_client(self) -> AsyncOpenAI:
+        # the connections of an asynchronous client belong to the event loop they were opened on
+        loop = asyncio.get_running_loop()
+        if self.async_client is None or self.async_client_loop is not loop:
+            self.async_client = (
+                AsyncOpenAI(
+                    base_url=self.config.api_base,
+                    api_key=self.config.api_key,
+                )
+                if self.config.api_type == "openai"
+                else AsyncAzureOpenAI(
+                    api_version=self.config.api_version,
+                    azure_endpoint=self.config.api_base,
+                    api_key=(self.config.api_key if self.config.api_type == "azure" else self._get_aad_token()),
+                )
+            )
+            self.async_client_loop = loop
+        return self.async_client
+
     def get_embeddings(self, strings: List[str]) -> List[List[float]]:
         embedding_results = self.client.embeddings.create(
             input=strings,
@@ -1,5 +1,7 @@
+import functools
 import json
-from typing import Callable, List, Set, Tuple
+import threading
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
 
 from injector import inject
 
@@ -22,6 +24,32 @@ class RoundCompressorConfig(ModuleConfig):
 
         self.llm_alias = self._get_str("llm_alias", default="", required=False)
 
+        # `rounds`: compress when the number of rounds exceeds rounds_to_compress + rounds_to_retain
+        # `token_budget`: compress when the chat history exceeds token_budget tokens
+        self.mode = self._get_enum("mode", ["rounds", "token_budget"], "rounds")
+        self.token_budget = self._get_int("token_budget", 4000)
+        assert self.token_budget > 0, "token_budget must be greater than 0"
+        self.background_summarization = self._get_bool("background_summarization", True)
+        self.tokenizer_model = self._get_str("tokenizer_model", "gpt-4")
+
+
+@functools.lru_cache(maxsize=None)
+def _get_tokenizer(model: str) -> Optional[Any]:
+    try:
+        import tiktoken
+
+        return tiktoken.encoding_for_model(model)
+    except Exception:
+        return None
+
+
+def count_tokens(text: str, model: str = "gpt-4") -> int:
+    """Count the tokens of the text, or estimate it (4 characters per token) if tiktoken is not available."""
+    tokenizer = _get_tokenizer(model)
+    if tokenizer is None:
+        return (len(text) + 3) // 4
+    return len(tokenizer.encode(text))
+
 
 class RoundCompressor:
     @inject
@@ -41,6 +69,14 @@ class RoundCompressor:
         self.logger = logger
         self.tracing = tracing
 
+        # token counts of the formatted rounds, keyed by the round id and its post ids
+        self.round_token_cache: Dict[Tuple[str, Tuple[str, ...]], int] = {}
+        self.summary_lock = threading.Lock()
+        self.summary_thread: Optional[threading.Thread] = None
+        # the rounds being summarized by the background thread, and the overflow queued while it runs
+        self.summarizing_rounds: Set[str] = set()
+        self.pending_summary: Optional[Tuple[List[Round], str, str]] = None
+
     @tracing_decorator
     def compress_rounds(
         self,
@@ -48,6 +84,9 @@ class RoundCompressor:
         rounds_formatter: Callable,
         prompt_template: str = "{PREVIOUS_SUMMARY}, please compress the following rounds",
     ) -> Tuple[str, List[Round]]:
+        if self.config.mode == "token_budget":
+            return self._compress_rounds_by_token_budget(rounds, rounds_formatter, prompt_template)
+
         remaining_rounds = len(rounds)
         for _round in rounds:
             if _round.id in self.processed_rounds:
@@ -73,6 +112,126 @@ class RoundCompressor:
         else:
             return self.previous_summary, rounds[-remaining_rounds:]
 
+    def _compress_rounds_by_token_budget(
+        self,
+        rounds: List[Round],
+        rounds_formatter: Callable,
+        prompt_template: str,
+    ) -> Tuple[str, List[Round]]:
+        summary, remaining, retained = self._split_by_token_budget(rounds, rounds_formatter)
+        if retained == len(remaining):
+            return summary, remaining
+
+        overflow = remaining[:-retained]
+        self.logger.info(f"Chat history exceeds the token budget, {len(overflow)} rounds to be summarized")
+        if not self.config.background_summarization:
+            new_summary = self._summarize(overflow, rounds_formatter, prompt_template)
+            if len(new_summary) == 0:
+                self.logger.warning(f"{len(overflow)} rounds are dropped from the prompt without a summary")
+            return (
+                new_summary if len(new_summary) > 0 else summary,
+                remaining[-retained:],
+            )
+
+        # the summary is normally started at the end of the previous round (see summarize_in_background);
+        # until it is published the overflow rounds stay in the prompt, even if it exceeds the budget
+        self.logger.warning(f"{len(overflow)} rounds over the token budget are kept until their summary is ready")
+        self._queue_summary(overflow, rounds_formatter, prompt_template)
+        return summary, remaining
+
+    def summarize_in_background(
+        self,
+        rounds: List[Round],
+        rounds_formatter: Callable,
+        prompt_template: str = "{PREVIOUS_SUMMARY}, please compress the following rounds",
+    ) -> None:
+        """
+        Start summarizing the rounds that do not fit into the token budget any more.
+        It is called when a round has ended, so that the summary is ready when the next round composes its prompt.
+        """
+        if self.config.mode != "token_budget" or not self.config.background_summarization:
+            return
+        _, remaining, retained = self._split_by_token_budget(rounds, rounds_formatter)
+        if retained < len(remaining):
+            self._queue_summary(remaining[:-retained], rounds_formatter, prompt_template)
+
+    def _split_by_token_budget(
+        self,
+        rounds: List[Round],
+        rounds_formatter: Callable,
+    ) -> Tuple[str, List[Round], int]:
+        """
+        Get the current summary, the rounds not covered by it,
+        and the number of the newest of these rounds that fit into the token budget.
+        """
+        with self.summary_lock:
+            summary = self.previous_summary
+            remaining = [_round for _round in rounds if _round.id not in self.processed_rounds]
+        if len(remaining) == 0:
+            remaining = rounds[-1:]
+
+        # keep the newest rounds that fit into the budget, always including the current round
+        budget = self.config.token_budget - self._count_tokens(summary)
+        retained = 0
+        used_tokens = 0
+        for _round in reversed(remaining):
+            round_tokens = self._count_round_tokens(_round, rounds_formatter)
+            if retained > 0 and used_tokens + round_tokens > budget:
+                break
+            used_tokens += round_tokens
+            retained += 1
+
+        self.tracing.set_span_attribute("history_tokens", used_tokens)
+        return summary, remaining, retained
+
+    def _queue_summary(
+        self,
+        overflow: List[Round],
+        rounds_formatter: Callable,
+        prompt_template: str,
+    ) -> None:
+        while True:
+            with self.summary_lock:
+                summarizing_rounds = self.summarizing_rounds
+                skipped_rounds = self.processed_rounds | summarizing_rounds
+            rounds = [_round for _round in overflow if _round.id not in skipped_rounds]
+            if len(rounds) == 0:
+                return
+            # the rounds are formatted here, as the formatter is not safe to call from another thread
+            chat_history_str = rounds_formatter(rounds)
+
+            with self.summary_lock:
+                if self.summarizing_rounds is not summarizing_rounds:
+                    # the background thread moved on to other rounds while these were formatted
+                    continue
+                # the overflow only grows until it is summarized, so the latest one replaces the queued one
+                self.pending_summary = (rounds, chat_history_str, prompt_template)
+                if self.summary_thread is None or not self.summary_thread.is_alive():
+                    self.summary_thread = threading.Thread(target=self._summarize_in_background, daemon=True)
+                    self.summary_thread.start()
+                return
+
+    def _summarize_in_background(self) -> None:
+        while True:
+            with self.summary_lock:
+                if self.pending_summary is None:
+                    self.summarizing_rounds = set()
+                    self.summary_thread = None
+                    return
+                rounds, chat_history_str, prompt_template = self.pending_summary
+                self.pending_summary = None
+                self.summarizing_rounds = {_round.id for _round in rounds}
+            self._summarize(rounds, lambda _: chat_history_str, prompt_template)
+
+    def _count_tokens(self, text: str) -> int:
+        return count_tokens(text, self.config.tokenizer_model)
+
+    def _count_round_tokens(self, _round: Round, rounds_formatter: Callable) -> int:
+        key = (_round.id, tuple(post.id for post in _round.post_list))
+        if key not in self.round_token_cache:
+            self.round_token_cache[key] = self._count_tokens(str(rounds_formatter([_round])))
+        return self.round_token_cache[key]
+
     @tracing_decorator
     def _summarize(
         self,
@@ -113,7 +272,11 @@ class RoundCompressor:
                 },
             )
 
-            self.processed_rounds.update([_round.id for _round in rounds])
+            # publish the summary together with the rounds it covers, it may be read by another thread
+            with self.summary_lock:
+                self.processed_rounds.update([_round.id for _round in rounds])
+                if len(new_summary) > 0:
+                    self.previous_summary = new_summary
             return new_summary
         except Exception as e:
             self.logger.warning(f"Failed to compress rounds: {e}")
@@ -1,17 +1,18 @@
 import json
 import os
 from dataclasses import dataclass, field
-from typing import Any, Dict, List, Optional, Tuple
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
 
-import numpy as np
 from injector import inject
-from sklearn.metrics.pairwise import cosine_similarity
 
 from taskweaver.config.module_config import ModuleConfig
 from taskweaver.llm import LLMApi, format_chat_message
 from taskweaver.logging import TelemetryLogger
 from taskweaver.module.tracing import Tracing, tracing_decorator
-from taskweaver.utils import read_yaml, write_yaml
+from taskweaver.utils import map_concurrently, read_yaml, read_yaml_cached, write_yaml
+
+if TYPE_CHECKING:
+    from taskweaver.memory.vector_index import VectorIndex
 
 
 @dataclass
@@ -59,8 +60,22 @@ class ExperienceConfig(ModuleConfig):
         )
         self.retrieve_threshold = self._get_float("retrieve_threshold", 0.2)
 
+        self.index_mode = self._get_enum("index_mode", ["exact", "ivf"], "exact")
+        self.index_nprobe = self._get_int("index_nprobe", 4)
+        self.index_path = self._get_path(
+            "index_path",
+            os.path.join(self.experience_dir, "exp_index.npz"),
+        )
+
         self.llm_alias = self._get_str("llm_alias", default="", required=False)
 
+        # the number of experiences summarized at once by `refresh`, and the retries of a failed summarization
+        self.refresh_concurrency = self._get_int("refresh_concurrency", 4)
+        self.refresh_max_retries = self._get_int("refresh_max_retries", 3)
+
+        assert self.refresh_concurrency > 0, "refresh_concurrency must be positive"
+        assert self.refresh_max_retries >= 0, "refresh_max_retries must not be negative"
+
 
 class ExperienceGenerator:
     @inject
@@ -76,9 +91,10 @@ class ExperienceGenerator:
         self.logger = logger
         self.tracing = tracing
 
-        self.default_prompt_template = read_yaml(self.config.default_exp_prompt_path)["content"]
+        self.default_prompt_template = read_yaml_cached(self.config.default_exp_prompt_path)["content"]
 
         self.experience_list: List[Experience] = []
+        self.experience_index: Optional["VectorIndex"] = None
 
         self.exception_message_for_refresh = (
             "Please cd to the `script` directory and "
@@ -174,57 +190,85 @@ class ExperienceGenerator:
             )
             return
 
-        to_be_embedded = []
-        for idx, exp_id in enumerate(exp_ids):
+        embedding_model = self.llm_api.embedding_service.config.embedding_model
+        existing_files = set(exp_files)
+        to_be_summarized: List[str] = []
+        rebuilt: Dict[str, Experience] = {}
+        for exp_id in exp_ids:
             rebuild_flag = False
             exp_file_name = f"exp_{exp_id}.yaml"
-            if exp_file_name not in os.listdir(self.config.experience_dir):
+            if exp_file_name not in existing_files:
                 rebuild_flag = True
             else:
                 exp_file_path = os.path.join(self.config.experience_dir, exp_file_name)
                 experience = read_yaml(exp_file_path)
-                if (
-                    experience["embedding_model"] != self.llm_api.embedding_service.config.embedding_model
-                    or len(experience["embedding"]) == 0
-                ):
+                if experience["embedding_model"] != embedding_model or len(experience["embedding"]) == 0:
                     rebuild_flag = True
 
             if rebuild_flag:
                 if exp_id in raw_exp_ids:
-                    summarized_experience = self.summarize_experience(exp_id, prompt)
-                    experience_obj = Experience(
-                        experience_text=summarized_experience,
-                        exp_id=exp_id,
-                        raw_experience_path=os.path.join(
-                            self.config.experience_dir,
-                            f"raw_exp_{exp_id}.yaml",
-                        ),
-                    )
+                    to_be_summarized.append(exp_id)
                 elif exp_id in handcrafted_exp_ids:
                     handcrafted_exp_file_path = os.path.join(
                         self.config.experience_dir,
                         f"handcrafted_exp_{exp_id}.yaml",
                     )
-                    experience_obj = Experience.from_dict(read_yaml(handcrafted_exp_file_path))
+                    rebuilt[exp_id] = Experience.from_dict(read_yaml(handcrafted_exp_file_path))
                 else:
                     raise ValueError(f"Experience {exp_id} not found in raw or handcrafted experience.")
 
-                to_be_embedded.append(experience_obj)
-
-        if len(to_be_embedded) == 0:
-            return
-        else:
-            exp_embeddings = self.llm_api.get_embedding_list(
-                [exp.experience_text for exp in to_be_embedded],
+        # the summarizations are independent LLM calls, a failed one does not prevent refreshing the others
+        failed_exp_ids: List[str] = []
+        for idx, summarized_experience, error in map_concurrently(
+            lambda exp_id: self.summarize_experience(exp_id, prompt),
+            to_be_summarized,
+            max_workers=self.config.refresh_concurrency,
+            max_retries=self.config.refresh_max_retries,
+        ):
+            exp_id = to_be_summarized[idx]
+            if error is not None:
+                self.logger.warning(f"Failed to summarize the raw experience {exp_id}: {error}")
+                failed_exp_ids.append(exp_id)
+                continue
+            rebuilt[exp_id] = Experience(
+                experience_text=summarized_experience,
+                exp_id=exp_id,
+                raw_experience_path=os.path.join(
+                    self.config.experience_dir,
+                    f"raw_exp_{exp_id}.yaml",
+                ),
             )
-            for i, exp in enumerate(to_be_embedded):
-                exp.embedding = exp_embeddings[i]
-                exp.embedding_model = self.llm_api.embedding_service.config.embedding_model
-                experience_file_path = os.path.join(self.config.experience_dir, f"exp_{exp.exp_id}.yaml")
-                write_yaml(experience_file_path, exp.to_dict())
+
+        to_be_embedded = [rebuilt[exp_id] for exp_id in exp_ids if exp_id in rebuilt]
+        if len(to_be_embedded) > 0:
+            index = self._get_index()
+            try:
+                for offset, exp_embeddings in self.llm_api.iter_embedding_list(
+                    [exp.experience_text for exp in to_be_embedded],
+                ):
+                    batch = to_be_embedded[offset : offset + len(exp_embeddings)]
+                    for exp, embedding in zip(batch, exp_embeddings):
+                        exp.embedding = embedding
+                        exp.embedding_model = embedding_model
+                        experience_file_path = os.path.join(self.config.experience_dir, f"exp_{exp.exp_id}.yaml")
+                        write_yaml(experience_file_path, exp.to_dict())
+                    index.add(
+                        [exp.exp_id for exp in batch],
+                        [exp.embedding for exp in batch],
+                        [self._get_index_metadata(exp) for exp in batch],
+                    )
+            finally:
+                # keep the experiences embedded before a failure
+                self._save_index()
 
             self.logger.info("Experience obj saved.")
 
+        if len(failed_exp_ids) > 0:
+            raise Exception(
+                f"Failed to summarize the raw experiences {failed_exp_ids}, the other experiences are refreshed. "
+                "Please run the refresh again to retry.",
+            )
+
     @tracing_decorator
     def load_experience(
         self,
@@ -246,6 +290,9 @@ class ExperienceGenerator:
             )
             return
 
+        index = self._get_index()
+        index_updated = False
+        embedding_model = self.llm_api.embedding_service.config.embedding_model
         for exp_id in exp_ids:
             exp_file = f"exp_{exp_id}.yaml"
             exp_file_path = os.path.join(self.config.experience_dir, exp_file)
@@ -253,40 +300,98 @@ class ExperienceGenerator:
                 f"Experience {exp_file} not found. " + self.exception_message_for_refresh
             )
 
+            if exp_id in index:
+                metadata = index.metadata[exp_id]
+                if (
+                    metadata.get("mtime") == os.stat(exp_file_path).st_mtime_ns
+                    and metadata.get("embedding_model") == embedding_model
+                ):
+                    # up-to-date in the persisted index, no need to read the yaml file
+                    continue
+
             experience = read_yaml(exp_file_path)
 
             assert len(experience["embedding"]) > 0, (
                 f"Experience {exp_file} has no embedding." + self.exception_message_for_refresh
             )
-            assert experience["embedding_model"] == self.llm_api.embedding_service.config.embedding_model, (
+            assert experience["embedding_model"] == embedding_model, (
                 f"Experience {exp_file} has different embedding model. " + self.exception_message_for_refresh
             )
 
-            self.experience_list.append(Experience(**experience))
+            experience_obj = Experience(**experience)
+            index.add([exp_id], [experience_obj.embedding], [self._get_index_metadata(experience_obj)])
+            index_updated = True
 
-    @tracing_decorator
-    def retrieve_experience(self, user_query: str) -> List[Tuple[Experience, float]]:
-        user_query_embedding = np.array(self.llm_api.get_embedding(user_query))
+        exp_id_set = set(exp_ids)
+        stale_ids = [exp_id for exp_id in index.ids if exp_id not in exp_id_set]
+        if len(stale_ids) > 0:
+            index.delete(stale_ids)
+            index_updated = True
+        if index_updated:
+            self._save_index()
 
-        similarities = []
+        self.experience_list = [self._get_indexed_experience(exp_id) for exp_id in index.ids]
 
-        for experience in self.experience_list:
-            similarity = cosine_similarity(
-                user_query_embedding.reshape(
-                    1,
-                    -1,
-                ),
-                np.array(experience.embedding).reshape(1, -1),
+    def _get_index(self) -> "VectorIndex":
+        if self.experience_index is None:
+            from taskweaver.memory.vector_index import VectorIndex
+
+            self.experience_index = VectorIndex(
+                mode=self.config.index_mode,
+                nprobe=self.config.index_nprobe,
             )
-            similarities.append((experience, similarity))
+            if os.path.exists(self.config.index_path):
+                try:
+                    self.experience_index.load(self.config.index_path)
+                except Exception as e:
+                    self.logger.warning(f"Failed to load the experience index, rebuilding it: {e}")
+                    self.experience_index = VectorIndex(
+                        mode=self.config.index_mode,
+                        nprobe=self.config.index_nprobe,
+                    )
+        return self.experience_index
+
+    def _save_index(self) -> None:
+        assert self.experience_index is not None
+        try:
+            self.experience_index.save(self.config.index_path)
+        except Exception as e:
+            # the index is only a cache of the experience files, so failing to persist it is not fatal
+            self.logger.warning(f"Failed to save the experience index: {e}")
+
+    def _get_index_metadata(self, experience: Experience) -> Dict[str, Any]:
+        exp_file_path = os.path.join(self.config.experience_dir, f"exp_{experience.exp_id}.yaml")
+        return {
+            "experience_text": experience.experience_text,
+            "raw_experience_path": experience.raw_experience_path,
+            "embedding_model": experience.embedding_model,
+            "mtime": os.stat(exp_file_path).st_mtime_ns,
+        }
+
+    def _get_indexed_experience(self, exp_id: str) -> Experience:
+        index = self._get_index()
+        metadata = index.metadata[exp_id]
+        return Experience(
+            exp_id=exp_id,
+            experience_text=metadata["experience_text"],
+            raw_experience_path=metadata["raw_experience_path"],
+            embedding_model=metadata["embedding_model"],
+            # the index keeps the normalized embedding, which has the same cosine similarities
+            embedding=index.get_vector(exp_id).tolist(),
+        )
 
-        experience_rank = sorted(
-            similarities,
-            key=lambda x: x[1],
-            reverse=True,
+    @tracing_decorator
+    def retrieve_experience(self, user_query: str) -> List[Tuple[Experience, float]]:
+        if len(self.experience_list) == 0:
+            return []
+        experience_by_id = {exp.exp_id: exp for exp in self.experience_list}
+
+        results = self._get_index().search(
+            self.llm_api.get_embedding(user_query),
+            threshold=self.config.retrieve_threshold,
         )
 
-        selected_experiences = [(exp, sim) for exp, sim in experience_rank if sim >= self.config.retrieve_threshold]
+        selected_experiences = [(experience_by_id[exp_id], sim) for exp_id, sim in results]
         self.logger.info(f"Retrieved {len(selected_experiences)} experiences.")
         self.logger.info(f"Retrieved experiences: {[exp.exp_id for exp, sim in selected_experiences]}")
         return selected_experiences
@@ -302,6 +407,12 @@ class ExperienceGenerator:
         exp_file_name = f"exp_{exp_id}.yaml"
         self._delete_exp_file(exp_file_name)
 
+        index = self._get_index()
+        if exp_id in index:
+            index.delete([exp_id])
+            self._save_index()
+        self.experience_list = [exp for exp in self.experience_list if exp.exp_id != exp_id]
+
     def delete_raw_experience(self, exp_id: str):
         exp_file_name = f"raw_exp_{exp_id}.yaml"
         self._delete_exp_file(exp_file_name)
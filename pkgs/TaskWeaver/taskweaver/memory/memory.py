@@ -1,11 +1,11 @@
 from __future__ import annotations
 
-import copy
 import os
-from typing import List
+from typing import Dict, List, Tuple
 
 from taskweaver.memory.attachment import AttachmentType
 from taskweaver.memory.conversation import Conversation
+from taskweaver.memory.post import Post
 from taskweaver.memory.round import Round
 from taskweaver.memory.type_vars import RoleName
 from taskweaver.module.prompt_util import PromptUtil
@@ -22,6 +22,11 @@ class Memory:
         self.session_id = session_id
         self.conversation = Conversation.init()
 
+        # role -> round id -> (number of posts scanned, matching posts), maintained incrementally
+        self._role_post_cache: Dict[RoleName, Dict[str, Tuple[int, List[Post]]]] = {}
+        # post id -> (message, message with temporal parts removed, message with delimiters removed)
+        self._post_text_cache: Dict[str, Tuple[str, str, str]] = {}
+
     def create_round(self, user_query: str) -> Round:
         """Create a round with the given query."""
         round = Round.create(user_query=user_query)
@@ -30,39 +35,61 @@ class Memory:
 
     def get_role_rounds(self, role: RoleName, include_failure_rounds: bool = False) -> List[Round]:
         """Get all the rounds of the given role in the memory.
-        TODO: better do cache here to avoid recreating the round list (new object) every time.
+        The posts of each round are scanned once and the delimiter-stripped messages are computed once per post,
+        so only the posts added since the last call are processed.
+        The returned rounds and posts are new objects, but their attachments are shared with the memory.
 
         Args:
             role: the role of the memory.
             include_failure_rounds: whether to include the failure rounds.
         """
+        role_cache = self._role_post_cache.setdefault(role, {})
+        rounds = [round for round in self.conversation.rounds if round.state != "failed" or include_failure_rounds]
+
         rounds_from_role: List[Round] = []
-        for round in self.conversation.rounds:
-            if round.state == "failed" and not include_failure_rounds:
-                continue
-            new_round = Round.create(
-                user_query=round.user_query,
-                id=round.id,
-                state=round.state,
-                board=copy.deepcopy(round.board),
+        for idx, round in enumerate(rounds):
+            scanned, role_posts = role_cache.get(round.id, (0, []))
+            if scanned > len(round.post_list):
+                # the post list was replaced, scan it again
+                scanned, role_posts = 0, []
+            if scanned < len(round.post_list):
+                role_posts = role_posts + [
+                    post for post in round.post_list[scanned:] if post.send_from == role or post.send_to == role
+                ]
+                role_cache[round.id] = (len(round.post_list), role_posts)
+
+            is_last_round = idx == len(rounds) - 1
+            rounds_from_role.append(
+                Round.create(
+                    user_query=round.user_query,
+                    id=round.id,
+                    state=round.state,
+                    board=dict(round.board),
+                    post_list=[self._get_role_post(post, is_last_round) for post in role_posts],
+                ),
             )
-            for post in round.post_list:
-                if post.send_from == role or post.send_to == role:
-                    new_round.add_post(copy.deepcopy(post))
-            rounds_from_role.append(new_round)
-        # Remove the temporal parts from the text of the posts of rounds
-        for round in rounds_from_role[:-1]:
-            for post in round.post_list:
-                post.message = PromptUtil.remove_parts(
-                    post.message,
-                    delimiter=PromptUtil.DELIMITER_TEMPORAL,
-                )
-        # Remove the delimiters from the text of the posts of the last round
-        for post in rounds_from_role[-1].post_list:
-            post.message = PromptUtil.remove_all_delimiters(post.message)
 
         return rounds_from_role
 
+    def _get_role_post(self, post: Post, is_last_round: bool) -> Post:
+        cached = self._post_text_cache.get(post.id)
+        if cached is None or cached[0] != post.message:
+            cached = (
+                post.message,
+                # Remove the temporal parts from the text of the posts of historical rounds
+                PromptUtil.remove_parts(post.message, delimiter=PromptUtil.DELIMITER_TEMPORAL),
+                # Remove the delimiters from the text of the posts of the last round
+                PromptUtil.remove_all_delimiters(post.message),
+            )
+            self._post_text_cache[post.id] = cached
+        return Post(
+            id=post.id,
+            send_from=post.send_from,
+            send_to=post.send_to,
+            message=cached[2] if is_last_round else cached[1],
+            attachment_list=list(post.attachment_list),
+        )
+
     def save_experience(self, exp_dir: str, thin_mode: bool = True) -> None:
         raw_exp_path = os.path.join(exp_dir, f"raw_exp_{self.session_id}.yaml")
         if thin_mode:
@@ -76,9 +103,15 @@ class Memory:
         else:
             write_yaml(raw_exp_path, self.conversation.to_dict())
 
+    def to_yaml(self, path: str) -> None:
+        """Save the memory to a yaml file."""
+        write_yaml(path, self.conversation.to_dict())
+
     def from_yaml(self, session_id: str, path: str) -> Memory:
         """Load the memory from a yaml file."""
         conversation = Conversation.from_yaml(path)
         self.conversation = conversation
         self.session_id = session_id
+        self._role_post_cache.clear()
+        self._post_text_cache.clear()
         return self
@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import json
+import os
+import secrets
+from typing import Any, Dict, List, Literal, Optional, Sequence, Tuple
+
+import numpy as np
+
+IndexMode = Literal["exact", "ivf"]
+
+
+class VectorIndex:
+    """
+    An in-process index for cosine similarity search over a set of embeddings keyed by id.
+
+    The embeddings are kept as one L2-normalized float32 matrix, so an exact search is a single
+    matrix-vector product. In the `ivf` mode, the vectors are also clustered with spherical k-means
+    and a search only scores the members of the `nprobe` clusters closest to the query,
+    which trades a little recall for speed on large indexes.
+    Each id can carry a JSON-serializable metadata dict that is persisted with the index.
+    """
+
+    def __init__(
+        self,
+        mode: IndexMode = "exact",
+        nlist: int = 0,
+        nprobe: int = 4,
+        ivf_min_size: int = 1024,
+    ) -> None:
+        """
+        :param mode: `exact` or `ivf`.
+        :param nlist: The number of clusters in the `ivf` mode, 0 for sqrt(size).
+        :param nprobe: The number of clusters scanned per search in the `ivf` mode.
+        :param ivf_min_size: Below this size, the `ivf` mode falls back to the exact search.
+        """
+        assert mode in ["exact", "ivf"], f"Invalid index mode {mode}"
+        self.mode = mode
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.ivf_min_size = ivf_min_size
+
+        self.ids: List[str] = []
+        self.metadata: Dict[str, Dict[str, Any]] = {}
+        self.matrix: np.ndarray = np.zeros((0, 0), dtype=np.float32)
+        self._row_of: Dict[str, int] = {}
+
+        self.centroids: Optional[np.ndarray] = None
+        self.assignments: np.ndarray = np.zeros(0, dtype=np.int32)
+        self._trained_size = 0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, id: str) -> bool:
+        return id in self._row_of
+
+    @staticmethod
+    def _normalize(embeddings: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+        return np.ascontiguousarray(embeddings / np.maximum(norms, 1e-12), dtype=np.float32)
+
+    def get_vector(self, id: str) -> np.ndarray:
+        """Get the normalized embedding of the given id."""
+        return self.matrix[self._row_of[id]]
+
+    def add(
+        self,
+        ids: Sequence[str],
+        embeddings: Sequence[Sequence[float]],
+        metadata: Optional[Sequence[Dict[str, Any]]] = None,
+    ) -> None:
+        """Add the embeddings to the index, replacing the existing entries with the same ids."""
+        if len(ids) == 0:
+            return
+        self.delete([id for id in ids if id in self._row_of])
+
+        vectors = self._normalize(np.array(embeddings, dtype=np.float32).reshape(len(ids), -1))
+        if len(self.ids) == 0:
+            self.matrix = vectors
+        else:
+            assert vectors.shape[1] == self.matrix.shape[1], "Embedding dimension mismatch"
+            self.matrix = np.ascontiguousarray(np.vstack([self.matrix, vectors]))
+
+        for i, id in enumerate(ids):
+            self._row_of[id] = len(self.ids)
+            self.ids.append(id)
+            self.metadata[id] = dict(metadata[i]) if metadata is not None else {}
+
+        if self.centroids is not None:
+            self.assignments = np.concatenate(
+                [self.assignments, np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)],
+            )
+
+    def delete(self, ids: Sequence[str]) -> None:
+        rows = [self._row_of[id] for id in ids if id in self._row_of]
+        if len(rows) == 0:
+            return
+        self.matrix = np.ascontiguousarray(np.delete(self.matrix, rows, axis=0))
+        if self.centroids is not None:
+            self.assignments = np.delete(self.assignments, rows)
+        removed = set(rows)
+        self.ids = [id for row, id in enumerate(self.ids) if row not in removed]
+        self._row_of = {id: row for row, id in enumerate(self.ids)}
+        for id in ids:
+            self.metadata.pop(id, None)
+
+    def search(
+        self,
+        query: Sequence[float],
+        top_k: Optional[int] = None,
+        threshold: Optional[float] = None,
+    ) -> List[Tuple[str, float]]:
+        """
+        Search the most similar entries to the query.
+        :param query: The query embedding.
+        :param top_k: The maximum number of results, None for all.
+        :param threshold: The minimum cosine similarity of the results.
+        :return: The (id, similarity) pairs ordered by descending similarity.
+        """
+        if len(self.ids) == 0:
+            return []
+        query_vector = self._normalize(np.array(query, dtype=np.float32))
+
+        rows = self._candidate_rows(query_vector)
+        scores = (self.matrix if rows is None else self.matrix[rows]) @ query_vector
+        order = np.arange(len(scores))
+        if threshold is not None:
+            order = order[scores >= threshold]
+        if top_k is not None and top_k < len(order):
+            order = order[np.argpartition(-scores[order], top_k - 1)[:top_k]] if top_k > 0 else order[:0]
+        order = order[np.argsort(-scores[order], kind="stable")]
+
+        return [(self.ids[i if rows is None else rows[i]], float(scores[i])) for i in order]
+
+    def _candidate_rows(self, query_vector: np.ndarray) -> Optional[np.ndarray]:
+        if self.mode != "ivf" or len(self.ids) < self.ivf_min_size:
+            return None
+        if self.centroids is None or len(self.ids) > 2 * self._trained_size:
+            self._train()
+        assert self.centroids is not None
+        nprobe = min(self.nprobe, len(self.centroids))
+        probe = np.argpartition(-(self.centroids @ query_vector), nprobe - 1)[:nprobe]
+        return np.flatnonzero(np.isin(self.assignments, probe))
+
+    def _train(self, iterations: int = 10) -> None:
+        n = len(self.ids)
+        nlist = min(n, self.nlist if self.nlist > 0 else max(1, int(np.sqrt(n))))
+        rng = np.random.default_rng(0)
+        centroids = self.matrix[rng.choice(n, nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = np.argmax(self.matrix @ centroids.T, axis=1).astype(np.int32)
+            for c in range(nlist):
+                members = self.matrix[assignments == c]
+                if len(members) > 0:
+                    centroids[c] = members.sum(axis=0)
+            centroids = self._normalize(centroids)
+        self.centroids = centroids
+        self.assignments = np.argmax(self.matrix @ centroids.T, axis=1).astype(np.int32)
+        self._trained_size = n
+
+    def save(self, path: str) -> None:
+        """Persist the index to a `.npz` file; the file is replaced atomically."""
+        # a unique temporary name, so that concurrent writers do not write into the same file
+        tmp_path = os.path.join(
+            os.path.dirname(os.path.abspath(path)),
+            f".{os.path.basename(path)}.{secrets.token_hex(4)}.tmp",
+        )
+        try:
+            with open(tmp_path, "xb") as f:
+                np.savez(
+                    f,
+                    ids=np.array(self.ids, dtype=str),
+                    matrix=self.matrix,
+                    centroids=self.centroids if self.centroids is not None else np.zeros((0, 0), dtype=np.float32),
+                    assignments=self.assignments,
+                    metadata=np.array(json.dumps(self.metadata)),
+                )
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def load(self, path: str) -> VectorIndex:
+        """Load the entries persisted by `save` into this index."""
+        with np.load(path, allow_pickle=False) as data:
+            self.ids = [str(id) for id in data["ids"]]
+            self.matrix = np.ascontiguousarray(data["matrix"], dtype=np.float32)
+            centroids = data["centroids"]
+            self.centroids = centroids if centroids.size > 0 else None
+            self.assignments = data["assignments"].astype(np.int32)
+            self.metadata = json.loads(str(data["metadata"]))
+        if len(self.ids) == 0:
+            self.matrix = np.zeros((0, 0), dtype=np.float32)
+        self._row_of = {id: row for row, id in enumerate(self.ids)}
+        self._trained_size = len(self.ids) if self.centroids is not None else 0
+        return self
@@ -1,8 +1,9 @@
+import threading
 from abc import ABC, abstractmethod
 from datetime import datetime, timedelta
 from typing import Dict, Generic, List, Optional, Tuple, TypeVar, Union
 
-from taskweaver.utils import glob_files
+from taskweaver.utils import get_file_signature, glob_files
 
 component_type = TypeVar("component_type")
 
@@ -18,6 +19,10 @@ class ComponentRegistry(ABC, Generic[component_type]):
         self._registry_update: datetime = datetime.fromtimestamp(0)
         self._file_glob: Union[str, List[str]] = file_glob
         self._ttl: Optional[timedelta] = ttl
+        # path -> (file signature, loaded component or None if disabled), so that a reload after the TTL
+        # only parses the files that changed since they were last loaded
+        self._file_cache: Dict[str, Tuple[Tuple[int, int], Optional[Tuple[str, component_type]]]] = {}
+        self._lock = threading.Lock()
 
     @abstractmethod
     def _load_component(self, path: str) -> Tuple[str, component_type]:
@@ -43,25 +48,46 @@ class ComponentRegistry(ABC, Generic[component_type]):
             assert self._registry is not None
             return self._registry
 
-        registry: Dict[str, component_type] = {}
-        for path in glob_files(self._file_glob):
-            try:
-                name, component = self._load_component(path)
-            except ComponentDisabledException:
-                continue
-            except Exception as e:
-                if show_error:
-                    print(f"failed to loading component from {path}, skipping: {e}")
-                continue
-            if component is None:
-                if show_error:
-                    print(f"failed to loading component from {path}, skipping")
-                continue
-            registry[name] = component
-
-        self._registry_update = datetime.now()
-        self._registry = registry
-        return registry
+        with self._lock:
+            if not force_reload and self.is_available(freshness):
+                assert self._registry is not None
+                return self._registry
+            if force_reload:
+                self._file_cache.clear()
+
+            registry: Dict[str, component_type] = {}
+            file_cache: Dict[str, Tuple[Tuple[int, int], Optional[Tuple[str, component_type]]]] = {}
+            for path in glob_files(self._file_glob):
+                try:
+                    signature = get_file_signature(path)
+                except OSError:
+                    continue
+                cached = self._file_cache.get(path)
+                if cached is not None and cached[0] == signature:
+                    loaded = cached[1]
+                else:
+                    try:
+                        loaded = self._load_component(path)
+                    except ComponentDisabledException:
+                        loaded = None
+                    except Exception as e:
+                        # failed files are not cached, so they are retried by the next reload
+                        if show_error:
+                            print(f"failed to loading component from {path}, skipping: {e}")
+                        continue
+                    if loaded is not None and loaded[1] is None:
+                        if show_error:
+                            print(f"failed to loading component from {path}, skipping")
+                        continue
+                file_cache[path] = (signature, loaded)
+                if loaded is not None:
+                    name, component = loaded
+                    registry[name] = component
+
+            self._file_cache = file_cache
+            self._registry_update = datetime.now()
+            self._registry = registry
+            return registry
 
     @property
     def registry(self) -> Dict[str, component_type]:
@@ -92,3 +118,4 @@ class ComponentRegistry(ABC, Generic[component_type]):
             return
         self._file_glob = file_glob
         self._registry = None
+        self._file_cache = {}
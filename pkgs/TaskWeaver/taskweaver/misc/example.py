@@ -1,13 +1,47 @@
 import glob
+import threading
 from os import path
-from typing import List, Optional, Set
+from typing import Dict, List, Optional, Set, Tuple
 
 from taskweaver.memory.conversation import Conversation
+from taskweaver.utils import get_file_signature
+
+
+class ExampleCache:
+    """
+    The parsed example conversations, shared by all the sessions of an app.
+    A file is parsed again only when its modification time or size changes,
+    so that loading the examples of a new session does not parse any YAML in steady state.
+    The conversations are shared between the sessions and must not be modified.
+    """
+
+    def __init__(self) -> None:
+        # path -> (file signature, conversation)
+        self.entries: Dict[str, Tuple[Tuple[int, int], Conversation]] = {}
+        self.lock = threading.Lock()
+
+    def load(self, folder: str) -> List[Conversation]:
+        """Load all the examples from a folder, reusing the ones that did not change since they were loaded."""
+        example_file_list: List[str] = glob.glob(path.join(folder, "*.yaml"))
+        conversations: List[Conversation] = []
+        for yaml_path in example_file_list:
+            signature = get_file_signature(yaml_path)
+            with self.lock:
+                cached = self.entries.get(yaml_path)
+            if cached is not None and cached[0] == signature:
+                conversations.append(cached[1])
+                continue
+            conversation = Conversation.from_yaml(yaml_path)
+            with self.lock:
+                self.entries[yaml_path] = (signature, conversation)
+            conversations.append(conversation)
+        return conversations
 
 
 def load_examples(
     folder: str,
     role_set: Optional[Set[str]] = None,
+    example_cache: Optional[ExampleCache] = None,
 ) -> List[Conversation]:
     """
     Load all the examples from a folder.
@@ -15,11 +49,16 @@ def load_examples(
     Args:
         folder: the folder path.
         role_set: the roles should be included in the examples.
+        example_cache: the cache of the parsed examples, the examples are parsed again if not provided.
     """
-    example_file_list: List[str] = glob.glob(path.join(folder, "*.yaml"))
+    if example_cache is not None:
+        conversations = example_cache.load(folder)
+    else:
+        example_file_list: List[str] = glob.glob(path.join(folder, "*.yaml"))
+        conversations = [Conversation.from_yaml(yaml_path) for yaml_path in example_file_list]
+
     example_conv_pool: List[Conversation] = []
-    for yaml_path in example_file_list:
-        conversation = Conversation.from_yaml(yaml_path)
+    for conversation in conversations:
         if conversation.enabled:
             if not role_set:
                 example_conv_pool.append(conversation)
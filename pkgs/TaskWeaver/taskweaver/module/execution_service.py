@@ -19,6 +19,13 @@ class ExecutionServiceConfig(ModuleConfig):
             "kernel_mode",
             "container",
         )
+        # kernel pool, only supported in the `local` mode
+        # a pooled kernel is reset between sessions (namespace, session variables, plugins, os.environ),
+        # but process-level changes such as monkeypatched modules or started threads carry over to the
+        # next sessions, see the "Kernel Pool" section of docs/code_execution.md
+        self.kernel_pool_size = self._get_int("kernel_pool_size", 0)
+        self.kernel_max_uses = self._get_int("kernel_max_uses", 10)
+        self.kernel_memory_limit_mb = self._get_int("kernel_memory_limit_mb", 0)
         if self.kernel_mode == "local":
             print(
                 "TaskWeaver is running in the `local` mode. This implies that "
@@ -39,5 +46,8 @@ class ExecutionServiceModule(Module):
             self.manager = code_execution_service_factory(
                 env_dir=config.env_dir,
                 kernel_mode=config.kernel_mode,
+                kernel_pool_size=config.kernel_pool_size,
+                kernel_max_uses=config.kernel_max_uses,
+                kernel_memory_limit_mb=config.kernel_memory_limit_mb,
             )
         return self.manager
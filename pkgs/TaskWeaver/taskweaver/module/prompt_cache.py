@@ -0,0 +1,44 @@
+from collections import OrderedDict
+from typing import Callable, Hashable, List, Tuple, TypeVar
+
+from taskweaver.llm.util import ChatMessageType
+
+T = TypeVar("T")
+
+
+class PromptCache:
+    """
+    A small LRU cache for the parts of a prompt that do not change between the hops of a round,
+    e.g., the system prompt with the examples, or the formatted plugin descriptions.
+    """
+
+    def __init__(self, max_entries: int = 32) -> None:
+        self.max_entries = max_entries
+        self.entries: OrderedDict[Hashable, object] = OrderedDict()
+
+    def get_or_compose(self, key: Hashable, compose: Callable[[], T]) -> T:
+        """Get the cached value of the key, or compose and cache it."""
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]  # type: ignore
+        value = compose()
+        self.entries[key] = value
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return value
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+
+def concat_prompt(
+    prefix: List[ChatMessageType],
+    suffix: List[ChatMessageType],
+) -> Tuple[List[ChatMessageType], int]:
+    """
+    Concatenate a cached static prefix with the dynamic part of a prompt.
+    The cached prefix is not modified.
+    :return: The prompt and the number of leading messages that are stable across the hops,
+        which providers with prompt caching can reuse.
+    """
+    return prefix + suffix, len(prefix)
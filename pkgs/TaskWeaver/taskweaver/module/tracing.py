@@ -193,6 +193,19 @@ def tracing_decorator(func):
     return wrapper
 
 
+def tracing_decorator_async(func):
+    async def wrapper(self, *args, **kwargs):
+        if _tracer is None:
+            return await func(self, *args, **kwargs)
+
+        span_name = f"{self.__class__.__name__}.{func.__name__}"
+        with _tracer.start_as_current_span(span_name):
+            result = await func(self, *args, **kwargs)
+        return result
+
+    return wrapper
+
+
 def get_tracer():
     if _tracer is None:
         return DummyTracer()
@@ -1,8 +1,9 @@
+import asyncio
 import json
 import os
 import types
 from json import JSONDecodeError
-from typing import Dict, Iterable, List, Optional
+from typing import AsyncGenerator, Dict, Iterable, List, Optional
 
 from injector import inject
 
@@ -12,12 +13,13 @@ from taskweaver.logging import TelemetryLogger
 from taskweaver.memory import Conversation, Memory, Post, Round, RoundCompressor
 from taskweaver.memory.attachment import AttachmentType
 from taskweaver.memory.experience import Experience, ExperienceGenerator
-from taskweaver.misc.example import load_examples
-from taskweaver.module.event_emitter import SessionEventEmitter
-from taskweaver.module.tracing import Tracing, tracing_decorator
+from taskweaver.misc.example import ExampleCache, load_examples
+from taskweaver.module.event_emitter import PostEventProxy, SessionEventEmitter
+from taskweaver.module.prompt_cache import PromptCache, concat_prompt
+from taskweaver.module.tracing import Tracing, tracing_decorator, tracing_decorator_async
 from taskweaver.role import PostTranslator, Role
 from taskweaver.role.role import RoleConfig
-from taskweaver.utils import read_yaml
+from taskweaver.utils import read_yaml_cached
 
 
 class PlannerConfig(RoleConfig):
@@ -67,6 +69,7 @@ class Planner(Role):
         workers: Dict[str, Role],
         round_compressor: Optional[RoundCompressor],
         post_translator: PostTranslator,
+        example_cache: ExampleCache,
         experience_generator: Optional[ExperienceGenerator] = None,
     ):
         super().__init__(config, logger, tracing, event_emitter)
@@ -78,11 +81,12 @@ class Planner(Role):
         self.recipient_alias_set = set([alias for alias, _ in self.workers.items()])
 
         self.planner_post_translator = post_translator
+        self.example_cache = example_cache
 
-        self.prompt_data = read_yaml(self.config.prompt_file_path)
+        self.prompt_data = read_yaml_cached(self.config.prompt_file_path)
 
-        if self.config.use_example:
-            self.examples = self.get_examples()
+        # the examples and the experiences are loaded on first use
+        self.examples: Optional[List[Conversation]] = None
 
         self.instruction_template = self.prompt_data["instruction_template"]
 
@@ -90,23 +94,43 @@ class Planner(Role):
 
         self.instruction = self.compose_sys_prompt()
 
+        # the system prompt with the examples, keyed by the experiences in the system prompt
+        self.prompt_prefix_cache = PromptCache(max_entries=8)
+        # the messages of the finished rounds, which do not change in the following hops
+        self.round_prompt_cache = PromptCache(max_entries=256)
+        # the number of leading messages of the last prompt that are stable across hops
+        self.prompt_prefix_length = 0
+
         self.ask_self_cnt = 0
         self.max_self_ask_num = 3
 
         self.round_compressor = round_compressor
-        self.compression_prompt_template = read_yaml(self.config.compression_prompt_path)["content"]
+        self.compression_prompt_template = read_yaml_cached(self.config.compression_prompt_path)["content"]
 
         if self.config.use_experience:
             self.experience_generator = experience_generator
-            self.experience_generator.refresh()
-            self.experience_generator.load_experience()
-            self.logger.info(
-                "Experience loaded successfully, "
-                "there are {} experiences".format(len(self.experience_generator.experience_list)),
-            )
+        self.experience_loaded = False
 
         self.logger.info("Planner initialized successfully")
 
+    def load_experience(self) -> None:
+        """Load the experiences if not done yet, summarizing the new raw experiences with the LLM."""
+        if self.experience_loaded:
+            return
+        self.experience_generator.refresh()
+        self.experience_generator.load_experience()
+        self.logger.info(
+            "Experience loaded successfully, "
+            "there are {} experiences".format(len(self.experience_generator.experience_list)),
+        )
+        self.experience_loaded = True
+
+    def warm_up(self) -> None:
+        if self.config.use_example and self.examples is None:
+            self.examples = self.get_examples()
+        if self.config.use_experience:
+            self.load_experience()
+
     def compose_sys_prompt(self):
         worker_description = ""
         for alias, role in self.workers.items():
@@ -127,60 +151,83 @@ class Planner(Role):
         conversation: List[ChatMessageType] = []
 
         for rnd_idx, chat_round in enumerate(conv_rounds):
-            conv_init_message = None
-            if rnd_idx == 0:
-                conv_init_message = Planner.conversation_delimiter_message
-                if summary is not None:
-                    self.logger.debug(f"Summary: {summary}")
-                    summary_message = (
-                        f"\nThe context summary of the Planner's previous rounds" f" can refer to:\n{summary}\n\n"
+            is_first_round = rnd_idx == 0
+            round_summary = summary if is_first_round else None
+            if rnd_idx == len(conv_rounds) - 1:
+                # the last round can still change
+                conversation.extend(self._compose_round_for_prompt(chat_round, is_first_round, round_summary))
+                continue
+            conversation.extend(
+                self.round_prompt_cache.get_or_compose(
+                    (chat_round.id, tuple(post.id for post in chat_round.post_list), is_first_round, round_summary),
+                    lambda: self._compose_round_for_prompt(chat_round, is_first_round, round_summary),
+                ),
+            )
+
+        return conversation
+
+    def _compose_round_for_prompt(
+        self,
+        chat_round: Round,
+        is_first_round: bool,
+        summary: Optional[str] = None,
+    ) -> List[ChatMessageType]:
+        conversation: List[ChatMessageType] = []
+
+        conv_init_message = None
+        if is_first_round:
+            conv_init_message = Planner.conversation_delimiter_message
+            if summary is not None:
+                self.logger.debug(f"Summary: {summary}")
+                summary_message = (
+                    f"\nThe context summary of the Planner's previous rounds" f" can refer to:\n{summary}\n\n"
+                )
+                conv_init_message += "\n" + summary_message
+
+        for post in chat_round.post_list:
+            if post.send_from == self.alias:
+                if post.send_to == "User" or post.send_to in self.recipient_alias_set:
+                    planner_message = self.planner_post_translator.post_to_raw_text(
+                        post=post,
                     )
-                    conv_init_message += "\n" + summary_message
-
-            for post in chat_round.post_list:
-                if post.send_from == self.alias:
-                    if post.send_to == "User" or post.send_to in self.recipient_alias_set:
-                        planner_message = self.planner_post_translator.post_to_raw_text(
-                            post=post,
-                        )
-                        conversation.append(
-                            format_chat_message(
-                                role="assistant",
-                                message=planner_message,
-                            ),
-                        )
-                    elif (
-                        post.send_to == self.alias
-                    ):  # self correction for planner response, e.g., format error/field check error
-                        conversation.append(
-                            format_chat_message(
-                                role="assistant",
-                                message=post.get_attachment(
-                                    type=AttachmentType.invalid_response,
-                                )[0],
-                            ),
-                        )  # append the invalid response to chat history
-                        conversation.append(
-                            format_chat_message(
-                                role="user",
-                                message="User: " + post.get_attachment(type=AttachmentType.revise_message)[0],
-                            ),
-                        )  # append the self correction instruction message to chat history
+                    conversation.append(
+                        format_chat_message(
+                            role="assistant",
+                            message=planner_message,
+                        ),
+                    )
+                elif (
+                    post.send_to == self.alias
+                ):  # self correction for planner response, e.g., format error/field check error
+                    conversation.append(
+                        format_chat_message(
+                            role="assistant",
+                            message=post.get_attachment(
+                                type=AttachmentType.invalid_response,
+                            )[0],
+                        ),
+                    )  # append the invalid response to chat history
+                    conversation.append(
+                        format_chat_message(
+                            role="user",
+                            message="User: " + post.get_attachment(type=AttachmentType.revise_message)[0],
+                        ),
+                    )  # append the self correction instruction message to chat history
 
+            else:
+                if conv_init_message is not None:
+                    message = post.send_from + ": " + conv_init_message + "\n" + post.message
+                    conversation.append(
+                        format_chat_message(role="user", message=message),
+                    )
+                    conv_init_message = None
                 else:
-                    if conv_init_message is not None:
-                        message = post.send_from + ": " + conv_init_message + "\n" + post.message
-                        conversation.append(
-                            format_chat_message(role="user", message=message),
-                        )
-                        conv_init_message = None
-                    else:
-                        conversation.append(
-                            format_chat_message(
-                                role="user",
-                                message=post.send_from + ": " + post.message,
-                            ),
-                        )
+                    conversation.append(
+                        format_chat_message(
+                            role="user",
+                            message=post.send_from + ": " + post.message,
+                        ),
+                    )
 
         return conversation
 
@@ -197,14 +244,10 @@ class Planner(Role):
             if self.config.use_experience
             else ""
         )
-        chat_history = [format_chat_message(role="system", message=f"{self.instruction}\n{experiences}")]
-
-        if self.config.use_example and len(self.examples) != 0:
-            for conv_example in self.examples:
-                conv_example_in_prompt = self.compose_conversation_for_prompt(
-                    conv_example.rounds,
-                )
-                chat_history += conv_example_in_prompt
+        prompt_prefix = self.prompt_prefix_cache.get_or_compose(
+            experiences,
+            lambda: self.compose_prompt_prefix(experiences),
+        )
 
         summary = None
         if self.config.prompt_compression and self.round_compressor is not None:
@@ -216,7 +259,8 @@ class Planner(Role):
                 prompt_template=self.compression_prompt_template,
             )
 
-        chat_history.extend(
+        chat_history, self.prompt_prefix_length = concat_prompt(
+            prompt_prefix,
             self.compose_conversation_for_prompt(
                 rounds,
                 summary=summary,
@@ -225,50 +269,41 @@ class Planner(Role):
 
         return chat_history
 
+    def prepare_next_round(self, memory: Memory) -> None:
+        if self.config.prompt_compression and self.round_compressor is not None:
+            self.round_compressor.summarize_in_background(
+                memory.get_role_rounds(role=self.alias),
+                rounds_formatter=lambda _rounds: str(
+                    self.compose_conversation_for_prompt(_rounds),
+                ),
+                prompt_template=self.compression_prompt_template,
+            )
+
+    def compose_prompt_prefix(self, experiences: str) -> List[ChatMessageType]:
+        """Compose the static part of the prompt, i.e., the system prompt and the examples."""
+        chat_history = [format_chat_message(role="system", message=f"{self.instruction}\n{experiences}")]
+
+        if self.config.use_example and self.examples is None:
+            self.examples = self.get_examples()
+        if self.config.use_example and len(self.examples) != 0:
+            for conv_example in self.examples:
+                conv_example_in_prompt = self.compose_conversation_for_prompt(
+                    conv_example.rounds,
+                )
+                chat_history += conv_example_in_prompt
+
+        return chat_history
+
     @tracing_decorator
     def reply(
         self,
         memory: Memory,
         prompt_log_path: Optional[str] = None,
     ) -> Post:
-        rounds = memory.get_role_rounds(role=self.alias)
-        assert len(rounds) != 0, "No chat rounds found for planner"
-
-        user_query = rounds[-1].user_query
-        self.tracing.set_span_attribute("user_query", user_query)
-        self.tracing.set_span_attribute("use_experience", self.config.use_experience)
-
-        if self.config.use_experience:
-            selected_experiences = self.experience_generator.retrieve_experience(user_query)
-        else:
-            selected_experiences = None
-
         post_proxy = self.event_emitter.create_post_proxy(self.alias)
 
         post_proxy.update_status("composing prompt")
-        chat_history = self.compose_prompt(rounds, selected_experiences)
-
-        def check_post_validity(post: Post):
-            missing_elements = []
-            validation_errors = []
-            if post.send_to is None or post.send_to == "Unknown":
-                missing_elements.append("send_to")
-            if post.send_to == self.alias:
-                validation_errors.append("The `send_to` field must not be `Planner` itself")
-            if post.message is None or post.message.strip() == "":
-                missing_elements.append("message")
-
-            attachment_types = [attachment.type for attachment in post.attachment_list]
-            if AttachmentType.init_plan not in attachment_types:
-                missing_elements.append("init_plan")
-            if AttachmentType.plan not in attachment_types:
-                missing_elements.append("plan")
-            if AttachmentType.current_plan_step not in attachment_types:
-                missing_elements.append("current_plan_step")
-
-            if len(missing_elements) > 0:
-                validation_errors.append(f"Missing elements: {', '.join(missing_elements)} in the `response` element")
-            assert len(validation_errors) == 0, ";".join(validation_errors)
+        chat_history = self._compose_reply_prompt(memory)
 
         post_proxy.update_status("calling LLM endpoint")
 
@@ -297,55 +332,158 @@ class Planner(Role):
                         except GeneratorExit:
                             pass
 
-            self.tracing.set_span_attribute("prompt", json.dumps(chat_history, indent=2))
-            prompt_size = self.tracing.count_tokens(json.dumps(chat_history))
-            self.tracing.set_span_attribute("prompt_size", prompt_size)
-            self.tracing.add_prompt_size(
-                size=prompt_size,
-                labels={
-                    "direction": "input",
-                },
-            )
-
+            self._trace_prompt(chat_history)
             self.planner_post_translator.raw_text_to_post(
                 post_proxy=post_proxy,
                 llm_output=stream_filter(llm_stream),
-                validation_func=check_post_validity,
+                validation_func=self._check_post_validity,
             )
+            self._update_board(post_proxy)
+        except (JSONDecodeError, AssertionError) as e:
+            self._handle_invalid_response(post_proxy, llm_output, e)
 
-            plan = post_proxy.post.get_attachment(type=AttachmentType.plan)[0]
-            bulletin_message = (
-                f"I have drawn up a plan: \n{plan}\n\n"
-                f"Please proceed with this step of this plan: {post_proxy.post.message}"
-            )
-            post_proxy.update_attachment(
-                message=bulletin_message,
-                type=AttachmentType.board,
-            )
+        return self._end_reply(post_proxy, chat_history, prompt_log_path)
 
-        except (JSONDecodeError, AssertionError) as e:
-            self.logger.error(f"Failed to parse LLM output due to {str(e)}")
-            self.tracing.set_span_status("ERROR", str(e))
-            self.tracing.set_span_exception(e)
-            post_proxy.error(f"Failed to parse LLM output due to {str(e)}")
-            post_proxy.update_attachment(
-                "".join(llm_output),
-                AttachmentType.invalid_response,
-            )
-            post_proxy.update_attachment(
-                f"Your JSON output has errors. {str(e)}."
-                # "The output format should follow the below format:"
-                # f"{self.prompt_data['planner_response_schema']}"
-                "You must add or missing elements at in one go and send the response again.",
-                AttachmentType.revise_message,
+    @tracing_decorator_async
+    async def reply_async(
+        self,
+        memory: Memory,
+        prompt_log_path: Optional[str] = None,
+    ) -> Post:
+        post_proxy = self.event_emitter.create_post_proxy(self.alias)
+
+        post_proxy.update_status("composing prompt")
+        if self.config.use_experience or (self.config.prompt_compression and self.round_compressor is not None):
+            # the experience retrieval and the summarization may call the LLM synchronously
+            chat_history = await asyncio.to_thread(self._compose_reply_prompt, memory)
+        else:
+            chat_history = self._compose_reply_prompt(memory)
+
+        post_proxy.update_status("calling LLM endpoint")
+
+        llm_stream = self.llm_api.chat_completion_stream_async(
+            chat_history,
+            llm_alias=self.config.llm_alias,
+        )
+
+        llm_output: List[str] = []
+        try:
+
+            async def stream_filter(s: AsyncGenerator[ChatMessageType, None]):
+                is_first_chunk = True
+                try:
+                    async for c in s:
+                        if is_first_chunk:
+                            post_proxy.update_status("receiving LLM response")
+                            is_first_chunk = False
+                        llm_output.append(c["content"])
+                        yield c
+                finally:
+                    await s.aclose()
+
+            self._trace_prompt(chat_history)
+            await self.planner_post_translator.raw_text_to_post_async(
+                post_proxy=post_proxy,
+                llm_output=stream_filter(llm_stream),
+                validation_func=self._check_post_validity,
             )
-            if self.ask_self_cnt > self.max_self_ask_num:  # if ask self too many times, return error message
-                self.ask_self_cnt = 0
-                post_proxy.end(f"Planner failed to generate response because {str(e)}")
-                raise Exception(f"Planner failed to generate response because {str(e)}")
-            else:
-                post_proxy.update_send_to(self.alias)
-                self.ask_self_cnt += 1
+            self._update_board(post_proxy)
+        except (JSONDecodeError, AssertionError) as e:
+            self._handle_invalid_response(post_proxy, llm_output, e)
+
+        return self._end_reply(post_proxy, chat_history, prompt_log_path)
+
+    def _compose_reply_prompt(self, memory: Memory) -> List[ChatMessageType]:
+        rounds = memory.get_role_rounds(role=self.alias)
+        assert len(rounds) != 0, "No chat rounds found for planner"
+
+        user_query = rounds[-1].user_query
+        self.tracing.set_span_attribute("user_query", user_query)
+        self.tracing.set_span_attribute("use_experience", self.config.use_experience)
+
+        if self.config.use_experience:
+            self.load_experience()
+            selected_experiences = self.experience_generator.retrieve_experience(user_query)
+        else:
+            selected_experiences = None
+
+        return self.compose_prompt(rounds, selected_experiences)
+
+    def _trace_prompt(self, chat_history: List[ChatMessageType]) -> None:
+        self.tracing.set_span_attribute("prompt", json.dumps(chat_history, indent=2))
+        self.tracing.set_span_attribute("prompt_prefix_length", self.prompt_prefix_length)
+        prompt_size = self.tracing.count_tokens(json.dumps(chat_history))
+        self.tracing.set_span_attribute("prompt_size", prompt_size)
+        self.tracing.add_prompt_size(
+            size=prompt_size,
+            labels={
+                "direction": "input",
+            },
+        )
+
+    def _check_post_validity(self, post: Post) -> None:
+        missing_elements = []
+        validation_errors = []
+        if post.send_to is None or post.send_to == "Unknown":
+            missing_elements.append("send_to")
+        if post.send_to == self.alias:
+            validation_errors.append("The `send_to` field must not be `Planner` itself")
+        if post.message is None or post.message.strip() == "":
+            missing_elements.append("message")
+
+        attachment_types = [attachment.type for attachment in post.attachment_list]
+        if AttachmentType.init_plan not in attachment_types:
+            missing_elements.append("init_plan")
+        if AttachmentType.plan not in attachment_types:
+            missing_elements.append("plan")
+        if AttachmentType.current_plan_step not in attachment_types:
+            missing_elements.append("current_plan_step")
+
+        if len(missing_elements) > 0:
+            validation_errors.append(f"Missing elements: {', '.join(missing_elements)} in the `response` element")
+        assert len(validation_errors) == 0, ";".join(validation_errors)
+
+    def _update_board(self, post_proxy: PostEventProxy) -> None:
+        plan = post_proxy.post.get_attachment(type=AttachmentType.plan)[0]
+        bulletin_message = (
+            f"I have drawn up a plan: \n{plan}\n\n"
+            f"Please proceed with this step of this plan: {post_proxy.post.message}"
+        )
+        post_proxy.update_attachment(
+            message=bulletin_message,
+            type=AttachmentType.board,
+        )
+
+    def _handle_invalid_response(self, post_proxy: PostEventProxy, llm_output: List[str], e: Exception) -> None:
+        self.logger.error(f"Failed to parse LLM output due to {str(e)}")
+        self.tracing.set_span_status("ERROR", str(e))
+        self.tracing.set_span_exception(e)
+        post_proxy.error(f"Failed to parse LLM output due to {str(e)}")
+        post_proxy.update_attachment(
+            "".join(llm_output),
+            AttachmentType.invalid_response,
+        )
+        post_proxy.update_attachment(
+            f"Your JSON output has errors. {str(e)}."
+            # "The output format should follow the below format:"
+            # f"{self.prompt_data['planner_response_schema']}"
+            "You must add or missing elements at in one go and send the response again.",
+            AttachmentType.revise_message,
+        )
+        if self.ask_self_cnt > self.max_self_ask_num:  # if ask self too many times, return error message
+            self.ask_self_cnt = 0
+            post_proxy.end(f"Planner failed to generate response because {str(e)}")
+            raise Exception(f"Planner failed to generate response because {str(e)}")
+        else:
+            post_proxy.update_send_to(self.alias)
+            self.ask_self_cnt += 1
+
+    def _end_reply(
+        self,
+        post_proxy: PostEventProxy,
+        chat_history: List[ChatMessageType],
+        prompt_log_path: Optional[str],
+    ) -> Post:
         if prompt_log_path is not None:
             self.logger.dump_log_file(chat_history, prompt_log_path)
 
@@ -361,5 +499,6 @@ class Planner(Role):
         example_conv_list = load_examples(
             self.config.example_base_path,
             role_set=set(self.recipient_alias_set) | {self.alias, "User"},
+            example_cache=self.example_cache,
         )
         return example_conv_list
@@ -1,6 +1,9 @@
 import contextlib
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List, Literal, Optional, Tuple
+from typing import TYPE_CHECKING, Any, Dict, List, Literal, Optional, Tuple, Union
+
+if TYPE_CHECKING:
+    import requests
 
 LogErrorLevel = Literal["info", "warning", "error"]
 ArtifactType = Literal["chart", "image", "df", "file", "txt", "svg", "html"]
@@ -104,6 +107,26 @@ class PluginContext(ABC):
     def wrap_text_with_delimiter_temporal(self, text: str) -> str:
         """wrap text with delimiter for temporal data"""
 
+    def get_http_session(
+        self,
+        timeout: Union[float, Tuple[float, float]] = (5, 60),
+        retries: int = 3,
+        backoff_factor: float = 0.5,
+    ) -> "requests.Session":
+        """
+        get an HTTP session shared by the plugins in the execution environment,
+        which keeps the connections alive and applies the timeout and the retries to the requests
+
+        :param timeout: the default (connect, read) timeout in seconds of the requests sent without one
+        :param retries: the maximum number of retries of a request
+        :param backoff_factor: the retries wait backoff_factor * 2 ** (retry - 1) seconds
+
+        :return: the session
+        """
+        from taskweaver.plugin.http import get_http_session
+
+        return get_http_session(timeout=timeout, retries=retries, backoff_factor=backoff_factor)
+
 
 class TestPluginContext(PluginContext):
     """
@@ -0,0 +1,67 @@
+import threading
+from typing import Any, Dict, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+TimeoutType = Union[float, Tuple[float, float]]
+
+
+class _TimeoutHTTPAdapter(HTTPAdapter):
+    """An HTTP adapter that applies a default timeout to the requests sent without one."""
+
+    def __init__(self, timeout: TimeoutType, **kwargs: Any) -> None:
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def send(self, request: requests.PreparedRequest, **kwargs: Any) -> requests.Response:  # type: ignore
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+
+_sessions: Dict[Tuple[Any, ...], requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+
+def get_http_session(
+    timeout: TimeoutType = (5, 60),
+    retries: int = 3,
+    backoff_factor: float = 0.5,
+    pool_size: int = 10,
+) -> requests.Session:
+    """
+    Get an HTTP session shared in the process, which keeps the connections alive between the calls.
+    The sessions are shared by the callers asking for the same settings.
+
+    Connection errors are retried for all methods, as the request has not been sent yet;
+    read errors and 429/5xx responses are only retried for idempotent methods, so a POST is never sent twice.
+
+    :param timeout: The default (connect, read) timeout in seconds of the requests sent without one.
+    :param retries: The maximum number of retries of a request.
+    :param backoff_factor: The retries wait backoff_factor * 2 ** (retry - 1) seconds.
+    :param pool_size: The maximum number of connections kept alive per host.
+    :return: The session.
+    """
+    key = (timeout, retries, backoff_factor, pool_size)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            retry = Retry(
+                total=retries,
+                backoff_factor=backoff_factor,
+                status_forcelist=[429, 500, 502, 503, 504],
+                raise_on_status=False,
+            )
+            adapter = _TimeoutHTTPAdapter(
+                timeout,
+                max_retries=retry,
+                pool_connections=pool_size,
+                pool_maxsize=pool_size,
+            )
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[key] = session
+        return session
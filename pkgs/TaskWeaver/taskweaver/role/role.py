@@ -1,3 +1,4 @@
+import asyncio
 import inspect
 import os.path
 from dataclasses import dataclass
@@ -96,6 +97,21 @@ class Role:
     def reply(self, memory: Memory, **kwargs) -> Post:
         pass
 
+    async def reply_async(self, memory: Memory, **kwargs) -> Post:
+        """
+        Reply from a coroutine. By default, `reply` runs in a worker thread of the event loop;
+        the roles that can wait for the LLM and the code execution on the event loop override it.
+        """
+        return await asyncio.to_thread(self.reply, memory, **kwargs)
+
+    def warm_up(self) -> None:
+        """Prepare expensive resources ahead of the first reply. No-op by default."""
+        pass
+
+    def prepare_next_round(self, memory: Memory) -> None:
+        """Prepare the next round once a round has ended, e.g., summarize the chat history. No-op by default."""
+        pass
+
     def close(self) -> None:
         self.logger.info(f"{self.alias} closed successfully")
 
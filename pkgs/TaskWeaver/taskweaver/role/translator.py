@@ -1,8 +1,9 @@
 import io
 import json
 import types
+from collections import deque
 from json import JSONDecodeError
-from typing import Any, Callable, Dict, Iterable, Iterator, List, Literal, Optional, Tuple, Union
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterable, Iterator, List, Literal, Optional, Tuple, Union
 
 import ijson
 from injector import inject
@@ -48,6 +49,62 @@ class PostTranslator:
         :param early_stop:
         :return: Post
         """
+        for _ in self._update_post_from_stream(llm_output, post_proxy, early_stop, use_v2_parser):
+            pass
+
+        if validation_func is not None:
+            validation_func(post_proxy.post)
+
+    async def raw_text_to_post_async(
+        self,
+        llm_output: AsyncIterator[ChatMessageType],
+        post_proxy: PostEventProxy,
+        early_stop: Optional[Callable[[Union[AttachmentType, Literal["message", "send_to"]], str], bool]] = None,
+        validation_func: Optional[Callable[[Post], None]] = None,
+    ) -> None:
+        """
+        Convert the raw text output of LLM, streamed by an asynchronous iterator, to a Post object.
+        The chunks are parsed on the event loop as they arrive, with the same parser as `raw_text_to_post`.
+        """
+        chunks: Deque[ChatMessageType] = deque()
+        finished = False
+
+        def chunk_stream() -> Iterator[ChatMessageType]:
+            while True:
+                if len(chunks) > 0:
+                    yield chunks.popleft()
+                elif finished:
+                    return
+                else:
+                    yield json_parser.PENDING
+
+        updates = self._update_post_from_stream(chunk_stream(), post_proxy, early_stop, use_v2_parser=True)
+        try:
+            # the parser only asks for more output once it has consumed the chunks received so far
+            for _ in updates:
+                try:
+                    chunks.append(await llm_output.__anext__())
+                except StopAsyncIteration:
+                    finished = True
+        finally:
+            updates.close()
+            if isinstance(llm_output, types.AsyncGeneratorType):
+                await llm_output.aclose()
+
+        if validation_func is not None:
+            validation_func(post_proxy.post)
+
+    def _update_post_from_stream(
+        self,
+        llm_output: Iterable[ChatMessageType],
+        post_proxy: PostEventProxy,
+        early_stop: Optional[Callable[[Union[AttachmentType, Literal["message", "send_to"]], str], bool]],
+        use_v2_parser: bool,
+    ) -> Iterator[Any]:
+        """
+        Update the post with the parsed LLM output.
+        PENDING is yielded whenever the LLM output yields it, i.e., when its next chunk has not arrived yet.
+        """
 
         # llm_output_list = [token for token in llm_output_stream]  # collect all the llm output via iterator
         # llm_output = "".join(llm_output_list)
@@ -55,6 +112,9 @@ class PostTranslator:
             full_llm_content = ""
             try:
                 for c in s:
+                    if c is json_parser.PENDING:
+                        yield c
+                        continue
                     full_llm_content += c["content"]
                     yield c["content"]
             finally:
@@ -82,7 +142,11 @@ class PostTranslator:
         )
         cur_attachment: Optional[Attachment] = None
         try:
-            for type_str, value, is_end in parser_stream:
+            for parsed in parser_stream:
+                if parsed is json_parser.PENDING:
+                    yield parsed
+                    continue
+                type_str, value, is_end = parsed
                 value_buf += value
                 type: Optional[AttachmentType] = None
                 if type_str == "message":
@@ -135,9 +199,6 @@ class PostTranslator:
                 except GeneratorExit:
                     pass
 
-        if validation_func is not None:
-            validation_func(post_proxy.post)
-
     def post_to_raw_text(
         self,
         post: Post,
@@ -271,6 +332,9 @@ class PostTranslator:
 
         try:
             for ev in parser:
+                if ev is json_parser.PENDING:
+                    yield ev
+                    continue
                 if ev.prefix == root_element_prefix:
                     if ev.event == "start_array":
                         list_begin = True
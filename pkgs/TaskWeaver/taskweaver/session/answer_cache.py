@@ -0,0 +1,131 @@
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from injector import inject
+
+from taskweaver.config.module_config import ModuleConfig
+from taskweaver.memory import Post, Round
+from taskweaver.utils import create_id
+
+
+class AnswerCacheConfig(ModuleConfig):
+    def _configure(self) -> None:
+        self._set_name("session.answer_cache")
+
+        self.enabled = self._get_bool("enabled", False)
+        # the minimum cosine similarity between two user queries to reuse the answer
+        self.threshold = self._get_float("threshold", 0.95)
+        # the session variable the answers are partitioned by, a session without it is not cached
+        self.partition_var = self._get_str("partition_var", "datasource_id")
+        # the session variable holding the version of the data behind the partition,
+        # the cached answers of a partition are dropped when its version changes
+        self.version_var = self._get_str("version_var", "datasource_version")
+        # the session variable identifying the user, the answers are not shared between users who may have
+        # different permissions on the same data; a session without it is not cached. Empty to share the answers
+        self.principal_var = self._get_str("principal_var", "auth_token")
+        # the number of answers kept per partition
+        self.size = self._get_int("size", 256)
+        # the number of seconds an answer is valid, 0 for no expiration
+        self.ttl = self._get_int("ttl", 3600)
+
+        assert 0 < self.threshold <= 1, "threshold must be in (0, 1]"
+        assert self.size > 0, "size must be greater than 0"
+
+
+class _Partition:
+    def __init__(self, version: str) -> None:
+        # numpy is only imported once an answer is cached
+        from taskweaver.memory.vector_index import VectorIndex
+
+        self.version = version
+        self.index: VectorIndex = VectorIndex()
+        # entry id -> (created_at, the user query, the reply to the user)
+        self.entries: Dict[str, Tuple[float, str, Dict[str, Any]]] = {}
+
+
+class AnswerCache:
+    """
+    A semantic cache of the answers to the user queries, shared by the sessions of an app.
+    The answers are partitioned by a session variable (e.g., the data source) and by the user,
+    and a query reuses the answer of a previous query in the same partition
+    whose embedding is similar enough.
+    """
+
+    @inject
+    def __init__(self, config: AnswerCacheConfig) -> None:
+        self.config = config
+        # (partition, principal) -> the cached answers
+        self.partitions: Dict[Tuple[str, str], _Partition] = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _get_partition(self, partition: str, principal: str, version: str) -> _Partition:
+        current = self.partitions.get((partition, principal))
+        if current is None or current.version != version:
+            current = _Partition(version)
+            self.partitions[(partition, principal)] = current
+        return current
+
+    def _is_expired(self, created_at: float) -> bool:
+        return self.config.ttl > 0 and time.time() - created_at > self.config.ttl
+
+    def get(
+        self,
+        partition: str,
+        version: str,
+        embedding: List[float],
+        principal: str = "",
+    ) -> Optional[Tuple[str, Post]]:
+        """
+        Get the answer of the most similar cached query.
+        :return: The cached query and a copy of its reply to the user, None if there is no similar query.
+        """
+        with self.lock:
+            current = self._get_partition(partition, principal, version)
+            for entry_id, _ in current.index.search(embedding, threshold=self.config.threshold):
+                created_at, query, reply = current.entries[entry_id]
+                if self._is_expired(created_at):
+                    current.index.delete([entry_id])
+                    del current.entries[entry_id]
+                    continue
+                self.hits += 1
+                return query, Post.from_dict(reply)
+            self.misses += 1
+            return None
+
+    def set(
+        self,
+        partition: str,
+        version: str,
+        embedding: List[float],
+        chat_round: Round,
+        principal: str = "",
+    ) -> None:
+        """Cache the reply of a finished round."""
+        if chat_round.state != "finished" or len(chat_round.post_list) == 0:
+            return
+        reply = chat_round.post_list[-1]
+        if reply.send_to != "User":
+            return
+        with self.lock:
+            current = self._get_partition(partition, principal, version)
+            entry_id = create_id()
+            current.index.add([entry_id], [embedding])
+            current.entries[entry_id] = (time.time(), chat_round.user_query, reply.to_dict())
+            # the entries are kept in insertion order, so the oldest ones are dropped first
+            overflow = list(current.entries.keys())[: max(0, len(current.entries) - self.config.size)]
+            if len(overflow) > 0:
+                current.index.delete(overflow)
+                for overflow_id in overflow:
+                    del current.entries[overflow_id]
+
+    def invalidate(self, partition: Optional[str] = None) -> None:
+        """Drop the cached answers of a partition for all users, or of all partitions if it is not given."""
+        with self.lock:
+            if partition is None:
+                self.partitions.clear()
+            else:
+                for key in [key for key in self.partitions if key[0] == partition]:
+                    del self.partitions[key]
@@ -1,18 +1,25 @@
+import asyncio
+import hashlib
 import os
 import shutil
+import threading
+import time
 from dataclasses import dataclass
-from typing import Any, Dict, List, Literal, Optional
+from typing import Any, Dict, Generator, List, Literal, Optional, Tuple
 
 from injector import Injector, inject
 
 from taskweaver.config.module_config import ModuleConfig
+from taskweaver.llm import LLMApi
 from taskweaver.logging import TelemetryLogger
 from taskweaver.memory import Memory, Post, Round
 from taskweaver.memory.attachment import AttachmentType
-from taskweaver.module.event_emitter import SessionEventEmitter, SessionEventHandler
-from taskweaver.module.tracing import Tracing, tracing_decorator, tracing_decorator_non_class
+from taskweaver.module.event_emitter import SessionEventEmitter, SessionEventHandler, TaskWeaverEvent
+from taskweaver.module.tracing import Tracing, tracing_decorator, tracing_decorator_async
 from taskweaver.planner.planner import Planner
+from taskweaver.role import Role
 from taskweaver.role.role import RoleRegistry
+from taskweaver.session.answer_cache import AnswerCache
 from taskweaver.workspace.workspace import Workspace
 
 
@@ -35,6 +42,24 @@ class AppSessionConfig(ModuleConfig):
         ), f"Only single code_interpreter is allowed, but {self.num_code_interpreters} are provided."
 
 
+class _LoopEventHandler(SessionEventHandler):
+    """
+    Deliver the events of an async round to the handler on the event loop thread,
+    also the events raised in a worker thread, e.g., by a role without async support.
+    """
+
+    def __init__(self, handler: SessionEventHandler, loop: asyncio.AbstractEventLoop) -> None:
+        self.handler = handler
+        self.loop = loop
+        self.loop_thread = threading.get_ident()
+
+    def handle(self, event: TaskWeaverEvent):
+        if threading.get_ident() == self.loop_thread:
+            self.handler.handle(event)
+        else:
+            self.loop.call_soon_threadsafe(self.handler.handle, event)
+
+
 @dataclass
 class SessionMetadata:
     session_id: str
@@ -67,7 +92,7 @@ class Session:
         assert session_id is not None, "session_id must be provided"
         self.logger = logger
         self.tracing = tracing
-        self.session_injector = app_injector.create_child_injector()
+        self.app_injector = app_injector
         self.config = config
 
         self.session_id: str = session_id
@@ -80,45 +105,49 @@ class Session:
             workspace=self.workspace,
             execution_cwd=self.execution_cwd,
         )
-        self.session_injector.binder.bind(SessionMetadata, self.metadata)
-
-        self._init()
 
         self.round_index = 0
         self.memory = Memory(session_id=self.session_id)
 
         self.session_var: Dict[str, str] = {}
 
-        self.event_emitter = self.session_injector.get(SessionEventEmitter)
-        self.session_injector.binder.bind(SessionEventEmitter, self.event_emitter)
+        self.event_emitter = SessionEventEmitter()
 
         self.role_registry = role_registry
-        self.worker_instances = {}
+        role_name_list = role_registry.get_role_name_list()
         for role_name in self.config.roles:
-            if role_name == "planner":
-                continue
-            if role_name not in role_registry.get_role_name_list():
+            if role_name != "planner" and role_name not in role_name_list:
                 raise ValueError(f"Unknown role {role_name}")
-            role_entry = self.role_registry.get(role_name)
-            role_instance = self.session_injector.create_object(role_entry.module, {"role_entry": role_entry})
-            self.worker_instances[role_instance.get_alias()] = role_instance
 
-        if "planner" in self.config.roles:
-            self.planner = self.session_injector.create_object(Planner, {"workers": self.worker_instances})
-            self.session_injector.binder.bind(Planner, self.planner)
+        # the session injector, the roles and the workspace are created on first use,
+        # as many sessions are opened and closed without sending any message
+        self._session_injector: Optional[Injector] = None
+        self._worker_instances: Optional[Dict[str, Role]] = None
+        self._planner: Optional[Planner] = None
+        self._workspace_created = False
+        self._init_lock = threading.RLock()
 
         self.max_internal_chat_round_num = self.config.max_internal_chat_round_num
         self.internal_chat_num = 0
 
-        self.logger.dump_log_file(
-            self,
-            file_path=os.path.join(self.workspace, f"{self.session_id}.json"),
-        )
+        # the answer cache is shared by all sessions of the app, which binds it
+        self.answer_cache: Optional[AnswerCache] = None
+        answer_cache = app_injector.get(AnswerCache)
+        if answer_cache.config.enabled:
+            self.answer_cache = answer_cache
+        self.llm_api: Optional[LLMApi] = None
+
+        # activity tracking used by the session store to decide which sessions can be evicted
+        self.last_active_time = time.time()
+        self.in_progress = False
 
     def _init(self):
         """
         Initialize the session by creating the workspace and execution cwd.
         """
+        if self._workspace_created:
+            return
+
         if not os.path.exists(self.workspace):
             os.makedirs(self.workspace)
 
@@ -128,8 +157,70 @@ class Session:
         if not os.path.exists(self.config.experience_dir):
             os.makedirs(self.config.experience_dir)
 
+        self._workspace_created = True
         self.logger.info(f"Session {self.session_id} is initialized")
 
+    @property
+    def session_injector(self) -> Injector:
+        with self._init_lock:
+            if self._session_injector is None:
+                session_injector = self.app_injector.create_child_injector()
+                session_injector.binder.bind(SessionMetadata, self.metadata)
+                session_injector.binder.bind(SessionEventEmitter, self.event_emitter)
+                self._session_injector = session_injector
+            return self._session_injector
+
+    @property
+    def worker_instances(self) -> Dict[str, Role]:
+        self._init_roles()
+        assert self._worker_instances is not None
+        return self._worker_instances
+
+    @property
+    def planner(self) -> Planner:
+        self._init_roles()
+        assert self._planner is not None, "planner is not in the roles of the session"
+        return self._planner
+
+    def _init_roles(self) -> None:
+        """
+        Create the workspace and the roles of the session, if not done yet.
+        """
+        if self._worker_instances is not None:
+            return
+        with self._init_lock:
+            if self._worker_instances is not None:
+                return
+            self._init()
+
+            worker_instances: Dict[str, Role] = {}
+            for role_name in self.config.roles:
+                if role_name == "planner":
+                    continue
+                role_entry = self.role_registry.get(role_name)
+                role_instance = self.session_injector.create_object(role_entry.module, {"role_entry": role_entry})
+                worker_instances[role_instance.get_alias()] = role_instance
+
+            if "planner" in self.config.roles:
+                self._planner = self.session_injector.create_object(Planner, {"workers": worker_instances})
+                self.session_injector.binder.bind(Planner, self._planner)
+            self._worker_instances = worker_instances
+
+            # the session variables updated before the roles were created
+            if len(self.session_var) > 0 and self.config.num_code_interpreters > 0:
+                self._get_code_interpreter().update_session_variables(dict(self.session_var))  # type: ignore
+
+            self.logger.dump_log_file(
+                self,
+                file_path=os.path.join(self.workspace, f"{self.session_id}.json"),
+            )
+
+    def _get_code_interpreter(self) -> Role:
+        code_interpreter_role_name = [w for w in self.config.roles if w.startswith("code_interpreter")][0]
+        code_interpreter_role_entry = self.role_registry.get(code_interpreter_role_name)
+        assert self._worker_instances is not None
+        return self._worker_instances[code_interpreter_role_entry.alias]
+
     @tracing_decorator
     def update_session_var(
         self,
@@ -140,12 +231,14 @@ class Session:
         :param variables: The variables to update.
         """
         assert self.config.num_code_interpreters > 0, "No code_interpreter role is provided."
-        self.session_var.update(variables)
-        # get the alias of the code_interpreter
-        code_interpreter_role_name = [w for w in self.config.roles if w.startswith("code_interpreter")][0]
-        code_interpreter_role_entry = self.role_registry.get(code_interpreter_role_name)
-        code_interpreter_instance = self.worker_instances[code_interpreter_role_entry.alias]
-        code_interpreter_instance.update_session_variables(variables)
+        with self._init_lock:
+            self.session_var.update(variables)
+            if self._worker_instances is None:
+                # sent to the code_interpreter when the roles are created
+                self.logger.info(f"Update session variables: {variables}")
+                return
+        code_interpreter_instance = self._get_code_interpreter()
+        code_interpreter_instance.update_session_variables(variables)  # type: ignore
         self.logger.info(f"Update session variables: {variables} for {code_interpreter_instance.get_alias()}")
 
     @tracing_decorator
@@ -153,6 +246,42 @@ class Session:
         self,
         message: str,
     ) -> Round:
+        chat_round = self._start_round(message)
+        try:
+            steps = self._route_round(chat_round, message)
+            recipient, post = next(steps)
+            while True:
+                recipient, post = steps.send(self._send_message(chat_round, recipient, post))
+        except StopIteration:
+            pass
+        except Exception as e:
+            self._fail_round(chat_round, e)
+        finally:
+            self._end_round(chat_round)
+            return chat_round
+
+    @tracing_decorator_async
+    async def _send_text_message_async(
+        self,
+        message: str,
+    ) -> Round:
+        chat_round = self._start_round(message)
+        try:
+            # creating the roles reads the plugins and the examples from the disk
+            await asyncio.to_thread(self._init_roles)
+            steps = self._route_round(chat_round, message)
+            recipient, post = next(steps)
+            while True:
+                recipient, post = steps.send(await self._send_message_async(chat_round, recipient, post))
+        except StopIteration:
+            pass
+        except Exception as e:
+            self._fail_round(chat_round, e)
+        finally:
+            self._end_round(chat_round)
+            return chat_round
+
+    def _start_round(self, message: str) -> Round:
         chat_round = self.memory.create_round(user_query=message)
 
         self.tracing.set_span_attribute("round_id", chat_round.id)
@@ -160,110 +289,186 @@ class Session:
         self.tracing.set_span_attribute("message", message)
 
         self.event_emitter.start_round(chat_round.id)
+        return chat_round
 
-        @tracing_decorator_non_class
-        def _send_message(recipient: str, post: Post) -> Post:
-            self.tracing.set_span_attribute("in.from", post.send_from)
-            self.tracing.set_span_attribute("in.recipient", recipient)
-            self.tracing.set_span_attribute("in.message", post.message)
-            self.tracing.set_span_attribute("in.attachments", str(post.attachment_list))
-
-            chat_round.add_post(post)
-
-            if recipient == "Planner":
-                reply_post = self.planner.reply(
-                    self.memory,
-                    prompt_log_path=os.path.join(
-                        self.workspace,
-                        f"planner_prompt_log_{chat_round.id}_{post.id}.json",
-                    ),
-                )
-            elif recipient in self.worker_instances.keys():
-                reply_post = self.worker_instances[recipient].reply(
-                    self.memory,
-                    prompt_log_path=os.path.join(
-                        self.workspace,
-                        f"code_generator_prompt_log_{chat_round.id}_{post.id}.json",
-                    ),
+    def _route_round(
+        self,
+        chat_round: Round,
+        message: str,
+    ) -> Generator[Tuple[str, Post], Post, None]:
+        """
+        Route the posts of a round between the roles.
+        The (recipient, post) pairs to reply to are yielded, and the reply posts are sent back,
+        so the same routing is driven by `_send_text_message` and `_send_text_message_async`.
+        """
+        if "planner" in self.config.roles and len(self.worker_instances) > 0:
+            post = Post.create(message=message, send_from="User", send_to="Planner")
+            while True:
+                post = yield post.send_to, post
+                self.logger.info(
+                    f"{post.send_from} talk to {post.send_to}: {post.message}",
                 )
-            else:
-                raise Exception(f"Unknown recipient {recipient}")
+                self.internal_chat_num += 1
+                if post.send_to == "User":
+                    chat_round.add_post(post)
+                    self.internal_chat_num = 0
+                    break
+                if self.internal_chat_num >= self.max_internal_chat_round_num:
+                    raise Exception(
+                        f"Internal chat round number exceeds the limit of {self.max_internal_chat_round_num}",
+                    )
+        else:
+            assert len(self.worker_instances) == 1, (
+                "Only single worker role (e.g., code_interpreter) is allowed in no-planner mode "
+                "because the user message will be sent to the worker role directly."
+            )
+            worker_name = list(self.worker_instances.keys())[0]
+            post = Post.create(
+                message=message,
+                send_from="Planner",
+                send_to=worker_name,
+            )
+            while True:
+                if post.send_to == "Planner":
+                    reply_post = Post.create(
+                        message=post.message,
+                        send_from="Planner",
+                        send_to="User",
+                    )
+                    chat_round.add_post(reply_post)
+                    break
+                else:
+                    post = yield worker_name, post
 
-            board_attachment = reply_post.get_attachment(AttachmentType.board)
-            if len(board_attachment) > 0:
-                chat_round.write_board(reply_post.send_from, reply_post.get_attachment(AttachmentType.board)[0])
+        self.round_index += 1
+        chat_round.change_round_state("finished")
 
-            return reply_post
+    @tracing_decorator
+    def _send_message(self, chat_round: Round, recipient: str, post: Post) -> Post:
+        role, prompt_log_path = self._get_recipient(chat_round, recipient, post)
+        reply_post = role.reply(self.memory, prompt_log_path=prompt_log_path)
+        self._write_board(chat_round, reply_post)
+        return reply_post
+
+    @tracing_decorator_async
+    async def _send_message_async(self, chat_round: Round, recipient: str, post: Post) -> Post:
+        role, prompt_log_path = self._get_recipient(chat_round, recipient, post)
+        reply_post = await role.reply_async(self.memory, prompt_log_path=prompt_log_path)
+        self._write_board(chat_round, reply_post)
+        return reply_post
+
+    def _get_recipient(self, chat_round: Round, recipient: str, post: Post) -> Tuple[Role, str]:
+        """Add the post to the round, and get the recipient role with the path of its prompt log."""
+        self.tracing.set_span_attribute("in.from", post.send_from)
+        self.tracing.set_span_attribute("in.recipient", recipient)
+        self.tracing.set_span_attribute("in.message", post.message)
+        self.tracing.set_span_attribute("in.attachments", str(post.attachment_list))
+
+        chat_round.add_post(post)
+
+        if recipient == "Planner":
+            return self.planner, os.path.join(
+                self.workspace,
+                f"planner_prompt_log_{chat_round.id}_{post.id}.json",
+            )
+        elif recipient in self.worker_instances.keys():
+            return self.worker_instances[recipient], os.path.join(
+                self.workspace,
+                f"code_generator_prompt_log_{chat_round.id}_{post.id}.json",
+            )
+        else:
+            raise Exception(f"Unknown recipient {recipient}")
 
-        try:
-            if "planner" in self.config.roles and len(self.worker_instances) > 0:
-                post = Post.create(message=message, send_from="User", send_to="Planner")
-                while True:
-                    post = _send_message(post.send_to, post)
-                    self.logger.info(
-                        f"{post.send_from} talk to {post.send_to}: {post.message}",
-                    )
-                    self.internal_chat_num += 1
-                    if post.send_to == "User":
-                        chat_round.add_post(post)
-                        self.internal_chat_num = 0
-                        break
-                    if self.internal_chat_num >= self.max_internal_chat_round_num:
-                        raise Exception(
-                            f"Internal chat round number exceeds the limit of {self.max_internal_chat_round_num}",
-                        )
-            else:
-                assert len(self.worker_instances) == 1, (
-                    "Only single worker role (e.g., code_interpreter) is allowed in no-planner mode "
-                    "because the user message will be sent to the worker role directly."
-                )
-                worker_name = list(self.worker_instances.keys())[0]
-                post = Post.create(
-                    message=message,
-                    send_from="Planner",
-                    send_to=worker_name,
-                )
-                while True:
-                    if post.send_to == "Planner":
-                        reply_post = Post.create(
-                            message=post.message,
-                            send_from="Planner",
-                            send_to="User",
-                        )
-                        chat_round.add_post(reply_post)
-                        break
-                    else:
-                        post = _send_message(worker_name, post)
-
-            self.round_index += 1
-            chat_round.change_round_state("finished")
+    @staticmethod
+    def _write_board(chat_round: Round, reply_post: Post) -> None:
+        board_attachment = reply_post.get_attachment(AttachmentType.board)
+        if len(board_attachment) > 0:
+            chat_round.write_board(reply_post.send_from, board_attachment[0])
 
-        except Exception as e:
-            import traceback
+    def _fail_round(self, chat_round: Round, e: Exception) -> None:
+        import traceback
 
-            stack_trace_str = traceback.format_exc()
-            self.logger.error(stack_trace_str)
-            chat_round.change_round_state("failed")
+        stack_trace_str = traceback.format_exc()
+        self.logger.error(stack_trace_str)
+        chat_round.change_round_state("failed")
 
-            err_message = f"Cannot process your request due to Exception: {str(e)} \n {stack_trace_str}"
+        err_message = f"Cannot process your request due to Exception: {str(e)} \n {stack_trace_str}"
 
-            self.tracing.set_span_status("ERROR", err_message)
-            self.tracing.set_span_exception(e)
-            self.event_emitter.emit_error(err_message)
+        self.tracing.set_span_status("ERROR", err_message)
+        self.tracing.set_span_exception(e)
+        self.event_emitter.emit_error(err_message)
 
-        finally:
-            self.tracing.set_span_attribute("internal_chat_num", self.internal_chat_num)
+    def _end_round(self, chat_round: Round) -> None:
+        self.tracing.set_span_attribute("internal_chat_num", self.internal_chat_num)
 
-            self.internal_chat_num = 0
-            self.logger.dump_log_file(
-                chat_round,
-                file_path=os.path.join(
-                    self.workspace,
-                    f"{self.session_id}_{chat_round.id}.json",
-                ),
-            )
-            self.event_emitter.end_round(chat_round.id)
-            return chat_round
+        self.internal_chat_num = 0
+        self.logger.dump_log_file(
+            chat_round,
+            file_path=os.path.join(
+                self.workspace,
+                f"{self.session_id}_{chat_round.id}.json",
+            ),
+        )
+        self.event_emitter.end_round(chat_round.id)
+        self._prepare_next_round()
+
+    def _prepare_next_round(self) -> None:
+        """Let the roles prepare the next round, e.g., start summarizing the chat history in the background."""
+        roles: List[Role] = list(self.worker_instances.values())
+        if self._planner is not None:
+            roles.append(self._planner)
+        for role in roles:
+            try:
+                role.prepare_next_round(self.memory)
+            except Exception as e:
+                self.logger.warning(f"{role.get_alias()} failed to prepare the next round: {e}")
+
+    def _get_answer_cache_key(self, message: str) -> Optional[Tuple[str, str, List[float], str]]:
+        """
+        Get the (partition, version, embedding, principal) key of the message in the answer cache,
+        None if the answer to the message must not be cached.
+        """
+        if self.answer_cache is None:
+            return None
+        # a follow-up message depends on the previous rounds of the conversation (e.g., "and the second one?"),
+        # so only the first message of a session is answered from, and cached into, the shared cache
+        if len(self.memory.conversation.rounds) > 0:
+            return None
+        partition = self.session_var.get(self.answer_cache.config.partition_var)
+        if partition is None:
+            return None
+        principal = ""
+        if self.answer_cache.config.principal_var != "":
+            principal_value = self.session_var.get(self.answer_cache.config.principal_var)
+            if principal_value is None:
+                return None
+            principal = hashlib.sha256(str(principal_value).encode("utf-8")).hexdigest()
+        version = self.session_var.get(self.answer_cache.config.version_var, "")
+        if self.llm_api is None:
+            self.llm_api = self.session_injector.get(LLMApi)
+        return str(partition), str(version), self.llm_api.get_embedding(message), principal
+
+    @tracing_decorator
+    def _send_cached_message(self, message: str, cached_query: str, reply: Post) -> Round:
+        """Answer the message with the reply to a similar previous query, without running the roles."""
+        chat_round = self.memory.create_round(user_query=message)
+        self.tracing.set_span_attribute("round_id", chat_round.id)
+        self.tracing.set_span_attribute("cached_query", cached_query)
+        self.logger.info(f"Reuse the answer to a similar query: {cached_query}")
+
+        self.event_emitter.start_round(chat_round.id)
+        # only the user query and the reply are kept, the internal posts of the cached round refer to
+        # the execution state of another session
+        chat_round.add_post(Post.create(message=message, send_from="User", send_to=reply.send_from))
+        post_proxy = self.event_emitter.create_post_proxy(reply.send_from)
+        post_proxy.update_send_to(reply.send_to)
+        post_proxy.update_message(reply.message)
+        chat_round.add_post(post_proxy.end())
+
+        self.round_index += 1
+        chat_round.change_round_state("finished")
+        self.event_emitter.end_round(chat_round.id)
+        return chat_round
 
     @tracing_decorator
     def send_message(
@@ -279,11 +484,87 @@ class Session:
         :param files: The files.
         :return: The chat round.
         """
+        self._trace_message(message, files)
+        message_prefix = self._upload_files(files)
+
+        self.in_progress = True
+        self.last_active_time = time.time()
+        try:
+            with self.event_emitter.handle_events_ctx(event_handler):
+                # the answers to messages with files are not cached
+                answer_cache_key = self._get_answer_cache_key(message) if files is None else None
+                cached = self._get_cached_answer(answer_cache_key)
+                if cached is not None:
+                    chat_round = self._send_cached_message(message, *cached)
+                else:
+                    chat_round = self._send_text_message(message_prefix + message)
+                    self._cache_answer(answer_cache_key, chat_round)
+
+                self._trace_round_result(chat_round)
+                return chat_round
+        finally:
+            self.in_progress = False
+            self.last_active_time = time.time()
+
+    @tracing_decorator_async
+    async def send_message_async(
+        self,
+        message: str,
+        event_handler: Optional[SessionEventHandler] = None,
+        files: Optional[List[Dict[Literal["name", "path", "content"], Any]]] = None,
+    ) -> Round:
+        """
+        Send a message without blocking the event loop.
+        The round runs on the calling event loop: the roles stream the LLM responses with the async client
+        of the LLM service and wait for the code execution with an async kernel client, and the events are
+        delivered to the event handler on the event loop thread.
+        The LLM services and roles without async support are called in worker threads of the event loop.
+        :param message: The message.
+        :param event_handler: The event handler.
+        :param files: The files.
+        :return: The chat round.
+        """
+        self._trace_message(message, files)
+        message_prefix = await asyncio.to_thread(self._upload_files, files) if files is not None else ""
+
+        self.in_progress = True
+        self.last_active_time = time.time()
+        try:
+            loop_event_handler = (
+                _LoopEventHandler(event_handler, asyncio.get_running_loop()) if event_handler is not None else None
+            )
+            with self.event_emitter.handle_events_ctx(loop_event_handler):
+                # getting the key embeds the message with the LLM service
+                answer_cache_key = (
+                    await asyncio.to_thread(self._get_answer_cache_key, message)
+                    if files is None and self.answer_cache is not None
+                    else None
+                )
+                cached = self._get_cached_answer(answer_cache_key)
+                if cached is not None:
+                    chat_round = self._send_cached_message(message, *cached)
+                else:
+                    chat_round = await self._send_text_message_async(message_prefix + message)
+                    self._cache_answer(answer_cache_key, chat_round)
+
+                self._trace_round_result(chat_round)
+                return chat_round
+        finally:
+            self.in_progress = False
+            self.last_active_time = time.time()
+
+    def _trace_message(
+        self,
+        message: str,
+        files: Optional[List[Dict[Literal["name", "path", "content"], Any]]],
+    ) -> None:
         # init span with session_id
         self.tracing.set_span_attribute("session_id", self.session_id)
         self.tracing.set_span_attribute("message", message)
         self.tracing.set_span_attribute("files", str(files))
 
+    def _upload_files(self, files: Optional[List[Dict[Literal["name", "path", "content"], Any]]]) -> str:
+        """Upload the files of a message, and get the prefix of the message listing them."""
         message_prefix = ""
         if files is not None:
             file_names: List[str] = []
@@ -294,20 +575,44 @@ class Session:
                 file_names.append(self._upload_file(file_name, file_path, file_content))
             if len(file_names) > 0:
                 message_prefix += f"files added: {', '.join(file_names)}.\n"
+        return message_prefix
 
-        with self.event_emitter.handle_events_ctx(event_handler):
-            chat_round = self._send_text_message(message_prefix + message)
-
-            self.tracing.set_span_attribute("round_id", chat_round.id)
-            if chat_round.state != "finished":
-                self.tracing.set_span_status("ERROR", "Chat round is not finished successfully.")
-            else:
-                self.tracing.set_span_attribute("reply_to_user", chat_round.post_list[-1].message)
+    def _get_cached_answer(
+        self,
+        answer_cache_key: Optional[Tuple[str, str, List[float], str]],
+    ) -> Optional[Tuple[str, Post]]:
+        cached = None
+        if answer_cache_key is not None:
+            partition, version, embedding, principal = answer_cache_key
+            cached = self.answer_cache.get(partition, version, embedding, principal=principal)  # type: ignore
+        self.tracing.set_span_attribute("answer_cache_hit", cached is not None)
+        return cached
+
+    def _cache_answer(
+        self,
+        answer_cache_key: Optional[Tuple[str, str, List[float], str]],
+        chat_round: Round,
+    ) -> None:
+        if answer_cache_key is not None:
+            partition, version, embedding, principal = answer_cache_key
+            self.answer_cache.set(  # type: ignore
+                partition,
+                version,
+                embedding,
+                chat_round,
+                principal=principal,
+            )
 
-            return chat_round
+    def _trace_round_result(self, chat_round: Round) -> None:
+        self.tracing.set_span_attribute("round_id", chat_round.id)
+        if chat_round.state != "finished":
+            self.tracing.set_span_status("ERROR", "Chat round is not finished successfully.")
+        else:
+            self.tracing.set_span_attribute("reply_to_user", chat_round.post_list[-1].message)
 
     @tracing_decorator
     def _upload_file(self, name: str, path: Optional[str] = None, content: Optional[bytes] = None) -> str:
+        self._init()
         target_name = name.split("/")[-1]
         target_path = self._get_full_path(self.execution_cwd, target_name)
         self.tracing.set_span_attribute("target_path", target_path)
@@ -336,6 +641,27 @@ class Session:
             ),
         )
 
+    def restore_memory(self, snapshot_path: str) -> None:
+        """
+        Restore the conversation of a previously evicted session from its snapshot.
+        :param snapshot_path: The path of the memory snapshot.
+        """
+        self.memory.from_yaml(self.session_id, snapshot_path)
+        self.round_index = len(self.memory.conversation.rounds)
+        self.logger.info(f"Session {self.session_id} is restored from {snapshot_path}")
+
+    @tracing_decorator
+    def warm_up(self) -> None:
+        """
+        Warm up the session by preparing the roles ahead of the first message,
+        e.g., starting the kernel and loading plugins for the code interpreter.
+        """
+        for worker in self.worker_instances.values():
+            worker.warm_up()
+        if self._planner is not None:
+            self._planner.warm_up()
+        self.logger.info(f"Session {self.session_id} is warmed up")
+
     @tracing_decorator
     def stop(self) -> None:
         """
@@ -343,7 +669,8 @@ class Session:
         This function must be called before the session exits.
         """
         self.logger.info(f"Session {self.session_id} is stopped")
-        for worker in self.worker_instances.values():
+        # the roles are not created if the session never received a message
+        for worker in (self._worker_instances or {}).values():
             worker.close()
 
     def to_dict(self) -> Dict[str, str]:
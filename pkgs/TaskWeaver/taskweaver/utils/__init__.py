@@ -8,9 +8,14 @@ import json
 import os
 import secrets
 import sys
+import threading
+from copy import deepcopy
 from datetime import datetime
 from hashlib import md5
-from typing import Any, Dict, List, Union
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar, Union
+
+T = TypeVar("T")
+R = TypeVar("R")
 
 
 def create_id(length: int = 4) -> str:
@@ -29,16 +34,96 @@ def read_yaml(path: str) -> Dict[str, Any]:
         raise ValueError(f"Yaml loading failed due to: {e}")
 
 
+def get_file_signature(path: str) -> Tuple[int, int]:
+    """Get the modification time and size of a file, which change whenever the file is rewritten."""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+_yaml_cache: Dict[str, Tuple[Tuple[int, int], Any]] = {}
+_yaml_cache_lock = threading.Lock()
+
+
+def read_yaml_cached(path: str) -> Dict[str, Any]:
+    """
+    Read a YAML file that rarely changes, e.g., a prompt file read by every session.
+    The file is parsed again only when its modification time or size changes;
+    a copy of the content is returned, so the callers are free to modify it.
+    """
+    signature = get_file_signature(path)
+    with _yaml_cache_lock:
+        cached = _yaml_cache.get(path)
+    if cached is None or cached[0] != signature:
+        cached = (signature, read_yaml(path))
+        with _yaml_cache_lock:
+            _yaml_cache[path] = cached
+    return deepcopy(cached[1])
+
+
 def write_yaml(path: str, content: Dict[str, Any]):
+    """
+    Write a YAML file atomically: the content is written to a temporary file in the same folder,
+    which then replaces the file, so a reader never sees a partially written file.
+    """
     import yaml
 
+    # the C dumper, when available, emits the same YAML several times faster
+    dumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+    tmp_path = os.path.join(
+        os.path.dirname(os.path.abspath(path)),
+        f".{os.path.basename(path)}.{secrets.token_hex(4)}.tmp",
+    )
     try:
-        with open(path, "w") as file:
-            yaml.safe_dump(content, file, sort_keys=False)
+        with open(tmp_path, "x") as file:
+            yaml.dump(content, file, Dumper=dumper, sort_keys=False)
+        if os.path.exists(path):
+            # keep the permissions of the file being replaced
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o777)
+        os.replace(tmp_path, path)
     except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
         raise ValueError(f"Yaml writing failed due to: {e}")
 
 
+def map_concurrently(
+    func: Callable[[T], R],
+    items: List[T],
+    max_workers: int = 4,
+    max_retries: int = 0,
+    retry_backoff: float = 1.0,
+) -> Iterator[Tuple[int, Optional[R], Optional[Exception]]]:
+    """
+    Call `func` on each item with at most `max_workers` calls running at once.
+    A failed call is retried up to `max_retries` times, waiting retry_backoff * 2 ** (retry - 1) seconds in between.
+
+    :return: An iterator of (index of the item, result, None) or (index of the item, None, last error),
+        in the order the calls complete. A failure does not stop the other calls.
+    """
+    import time
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    def call(item: T) -> R:
+        for retry in range(max_retries + 1):
+            try:
+                return func(item)
+            except Exception:
+                if retry == max_retries:
+                    raise
+                time.sleep(retry_backoff * 2**retry)
+        raise AssertionError("unreachable")
+
+    if len(items) == 0:
+        return
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items)))) as executor:
+        futures = {executor.submit(call, item): idx for idx, item in enumerate(items)}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
+
+
 def validate_yaml(content: Any, schema: str) -> bool:
     import jsonschema
 
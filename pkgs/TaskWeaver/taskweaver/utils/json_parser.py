@@ -1,4 +1,5 @@
 import itertools
+import re
 import types
 from typing import Any, Iterable, List, Literal, NamedTuple, Optional, Tuple
 
@@ -24,6 +25,11 @@ class StreamJsonParserError(Exception):
     pass
 
 
+# a token stream yields PENDING when its next chunk has not arrived yet, e.g., when it is fed by a coroutine;
+# the parser passes it through to its consumer, which is expected to provide the chunk before resuming the parser
+PENDING: Any = object()
+
+
 class ParserEvent(NamedTuple):
     prefix: str
     event: ParserEventType
@@ -72,6 +78,21 @@ def reduce_events(
     return reduced
 
 
+_WS_RUN = re.compile(r"[ \t\n\r]+")
+# the characters of a string that can be copied as they are, i.e., everything up to the next quote or escape
+_STR_RUN = re.compile(r'[^"\\]+')
+_ESCAPES = {
+    "n": "\n",
+    "/": "/",
+    "\\": "\\",
+    "r": "\r",
+    "t": "\t",
+    "b": "\b",
+    "f": "\f",
+    '"': '"',
+}
+
+
 def is_ws(ch: str):
     return ch == " " or ch == "\t" or ch == "\n" or ch == "\r"
 
@@ -82,20 +103,48 @@ def parse_json_stream(
     ijson_prefix: bool = False,
     skip_after_root: bool = False,
 ) -> Iterable[ParserEvent]:
+    """
+    Parse a JSON document arriving in chunks, yielding the events of each chunk as soon as it arrives.
+    Consecutive events of the same type in a chunk are merged, so a string arrives as one event per chunk.
+
+    The buffer is scanned with an index, runs of plain string characters and whitespaces are consumed at once,
+    and the prefix of each level is computed when the level is entered, so the parsing is linear
+    in the length of the document regardless of how it is chunked.
+
+    :param token_stream: The chunks of the JSON document.
+    :param skip_ws: Whether to drop the whitespace events, which are then not created at all.
+    :param ijson_prefix: Whether to use the ijson prefix format (e.g., `response.item.type`)
+        instead of the default one (e.g., `.response[0].type`).
+    :param skip_after_root: Whether to emit anything after the root element as skip events instead of failing.
+    :return: The parser events, and PENDING whenever the token stream yields PENDING.
+    """
     buf: str = ""
+    pos: int = 0
     is_end: bool = False
     prefix_stack: List[Tuple[bool, str]] = []
+    # prefix_str_stack[i] is the prefix string of prefix_stack[:i]
+    prefix_str_stack: List[str] = [""]
     state_stack: List[Tuple[ParserStateType, Any]] = [("root", (False, False))]
     ev_queue: List[ParserEvent] = []
 
-    def add_event(ev: ParserEventType, value: Any, value_str: str, is_end: bool):
+    def push_prefix(is_arr: bool, val: str):
+        parent = prefix_str_stack[-1]
         if ijson_prefix:
-            prefix = ".".join("item" if is_arr else val for is_arr, val in prefix_stack)
+            part = "item" if is_arr else val
+            prefix = part if len(prefix_stack) == 0 else f"{parent}.{part}"
         else:
-            prefix = "".join(f"[{val}]" if is_arr else f".{val}" for is_arr, val in prefix_stack)
+            prefix = f"{parent}[{val}]" if is_arr else f"{parent}.{val}"
+        prefix_stack.append((is_arr, val))
+        prefix_str_stack.append(prefix)
+
+    def pop_prefix():
+        prefix_stack.pop()
+        prefix_str_stack.pop()
+
+    def add_event(ev: ParserEventType, value: Any, value_str: str, is_end: bool):
         ev_queue.append(
             ParserEvent(
-                prefix,
+                prefix_str_stack[-1],
                 ev,
                 value,
                 value_str,
@@ -104,6 +153,7 @@ def parse_json_stream(
         )
 
     def parse_ws(ch: str) -> bool:
+        nonlocal pos
         is_in_ws = state_stack[-1][0] == "ws" if len(state_stack) > 0 else False
 
         if not is_ws(ch):
@@ -111,15 +161,20 @@ def parse_json_stream(
                 add_event("ws", None, "", True)
                 state_stack.pop()
             return False
+        # consume the whole run of whitespaces in the buffer
+        run_begin = pos - 1
+        pos = _WS_RUN.match(buf, run_begin).end()  # type: ignore
+        if skip_ws:
+            return True
         if not is_in_ws:
             state_stack.append(("ws", None))
-        add_event("ws", None, ch, False)
+        add_event("ws", None, buf[run_begin:pos], False)
         return True
 
     def parse_str_begin(ch: str, is_obj_key: bool = False) -> bool:
         if ch == '"':
             add_event("map_key" if is_obj_key else "string", "", "", False)
-            state_stack.append(("string", (False, "", "", is_obj_key)))
+            state_stack.append(("string", (False, "", [], is_obj_key)))
             return True
         return False
 
@@ -167,7 +222,7 @@ def parse_json_stream(
         if parse_ws(ch):
             return True
         if value_to_end:
-            prefix_stack.pop()
+            pop_prefix()
             state_stack.pop()
             if ch == ",":
                 return True
@@ -191,7 +246,7 @@ def parse_json_stream(
         if parse_ws(ch):
             return True
         if value_begins:
-            prefix_stack.pop()
+            pop_prefix()
             if ch == ",":
                 state_stack[-1] = ("array", (idx + 1, False, True))
                 return True
@@ -205,14 +260,16 @@ def parse_json_stream(
                 state_stack.pop()
                 return True
             state_stack[-1] = ("array", (idx, True, False))
-            prefix_stack.append((True, str(idx)))
+            push_prefix(True, str(idx))
             if parse_value_begin(ch):
                 return True
             raise StreamJsonParserError(f"invalid value for index {idx}: {ch}")
         return False
 
-    def parse_str_value(ch: str, cur_state_ext: Tuple[bool, str, str, bool]) -> bool:
-        in_escape, escape_buf, value_buf, is_obj_key = cur_state_ext
+    def parse_str_value(ch: str, cur_state_ext: Tuple[bool, str, List[str], bool]) -> bool:
+        nonlocal pos
+        # value_parts is shared by all the states of the same string, and joined when the string ends
+        in_escape, escape_buf, value_parts, is_obj_key = cur_state_ext
         ev: ParserEventType = "map_key" if is_obj_key else "string"
         if in_escape and escape_buf.startswith("u"):
             if ch in "0123456789abcdefABCDEF":
@@ -221,55 +278,44 @@ def parse_json_stream(
                 raise StreamJsonParserError(f"invalid unicode escape sequence: \\{escape_buf}{ch}")
             if len(escape_buf) == 5:
                 new_ch = chr(int(escape_buf[1:], 16))
-                value_buf += new_ch
+                value_parts.append(new_ch)
                 add_event(ev, None, new_ch, False)
-                state_stack[-1] = ("string", (False, "", value_buf, is_obj_key))
+                state_stack[-1] = ("string", (False, "", value_parts, is_obj_key))
             else:
-                state_stack[-1] = ("string", (True, escape_buf, value_buf, is_obj_key))
+                state_stack[-1] = ("string", (True, escape_buf, value_parts, is_obj_key))
             return True
         if in_escape:
             assert escape_buf == ""
             if ch == "u":
-                state_stack[-1] = ("string", (True, ch, value_buf, is_obj_key))
+                state_stack[-1] = ("string", (True, ch, value_parts, is_obj_key))
                 return True
-            new_ch = ""
-            if ch == "n":
-                new_ch = "\n"
-            elif ch == "/":
-                new_ch = "/"
-            elif ch == "\\":
-                new_ch = "\\"
-            elif ch == "r":
-                new_ch = "\r"
-            elif ch == "r":
-                new_ch = "\r"
-            elif ch == "t":
-                new_ch = "\t"
-            elif ch == "b":
-                new_ch = "\b"
-            elif ch == "f":
-                new_ch = "\f"
-            elif ch == '"':
-                new_ch = '"'
-            else:
+            new_ch = _ESCAPES.get(ch)
+            if new_ch is None:
                 raise StreamJsonParserError(f"invalid escape sequence: \\{ch}")
-            value_buf += new_ch
+            value_parts.append(new_ch)
             add_event(ev, None, new_ch, False)
-            state_stack[-1] = ("string", (False, "", value_buf, is_obj_key))
+            state_stack[-1] = ("string", (False, "", value_parts, is_obj_key))
             return True
         if ch == '"':
-            add_event(ev, value_buf, "", True)
+            value = "".join(value_parts)
+            add_event(ev, value, "", True)
             state_stack.pop()
             if is_obj_key:
-                prefix_stack.append((False, value_buf))
-                state_stack.append(("object_value", (value_buf, False, False)))
+                push_prefix(False, value)
+                state_stack.append(("object_value", (value, False, False)))
             return True
         if ch == "\\":
-            state_stack[-1] = ("string", (True, "", value_buf, is_obj_key))
+            state_stack[-1] = ("string", (True, "", value_parts, is_obj_key))
+            return True
+        if ch == "":
+            add_event(ev, None, "", False)
             return True
-        value_buf += ch
-        add_event(ev, None, ch, False)
-        state_stack[-1] = ("string", (False, "", value_buf, is_obj_key))
+        # consume the whole run of plain characters in the buffer
+        run_begin = pos - 1
+        pos = _STR_RUN.match(buf, run_begin).end()  # type: ignore
+        run = buf[run_begin:pos]
+        value_parts.append(run)
+        add_event(ev, None, run, False)
         return True
 
     def parse_literal_value(
@@ -306,10 +352,14 @@ def parse_json_stream(
         return False
 
     def parse_root(ch: str, cur_state_ext: Tuple[bool, bool]):
+        nonlocal pos
         has_root_elem, has_skip_cnt = cur_state_ext
 
         if has_skip_cnt and skip_after_root:
-            add_event("skip", None, ch, ch == "")
+            # everything after the root element is skipped, so consume the rest of the buffer
+            run_begin = pos - len(ch)
+            pos = len(buf)
+            add_event("skip", None, buf[run_begin:pos], ch == "")
             return True
 
         if parse_ws(ch):
@@ -329,30 +379,38 @@ def parse_json_stream(
             return parse_value_begin(ch)
 
     def process_ev_queue():
-        result = ev_queue.copy()
-        result = reduce_events(result, skip_ws=skip_ws)
+        result = reduce_events(ev_queue, skip_ws=skip_ws)
         ev_queue.clear()
         return result
 
     def parse_buf():
-        nonlocal buf, is_end
+        nonlocal pos
+        buf_len = len(buf)
         while True:
-            if len(buf) == 0 and not is_end:
+            if pos >= buf_len and not is_end:
                 break
             cur_state, cur_state_ext = state_stack[-1]
-            ch = "" if buf == "" else buf[0]
-            buf = buf if buf == "" else buf[1:]
+            if pos < buf_len:
+                ch = buf[pos]
+                pos += 1
+            else:
+                ch = ""
             r = False
-            if cur_state == "root":
-                r = parse_root(ch, cur_state_ext)
-            elif cur_state == "object":
-                r = parse_obj_begin(ch)
-            elif cur_state == "string":
+            if cur_state == "string":
                 assert cur_state_ext is not None
                 r = parse_str_value(ch, cur_state_ext)
             elif cur_state == "object_value":
                 assert cur_state_ext is not None
                 r = parse_obj_value(ch, cur_state_ext)
+            elif cur_state == "ws":
+                r = parse_ws(ch)
+                if not r:
+                    # ws also need to peek next token to determine the end
+                    # restore token to buffer when finishes
+                    pos -= len(ch)
+                    continue
+            elif cur_state == "object":
+                r = parse_obj_begin(ch)
             elif cur_state == "array":
                 assert cur_state_ext is not None
                 r = parse_array_begin(ch, cur_state_ext)
@@ -365,17 +423,10 @@ def parse_json_stream(
                 if not r:
                     # number needs to peek next token to determine if it's finished
                     # restore token to buffer when finishes
-                    buf = ch + buf
-                    r = True
-                    continue
-            elif cur_state == "ws":
-                r = parse_ws(ch)
-                if not r:
-                    # ws also need to peek next token to determine the end
-                    # restore token to buffer when finishes
-                    buf = ch + buf
-                    r = True
+                    pos -= len(ch)
                     continue
+            elif cur_state == "root":
+                r = parse_root(ch, cur_state_ext)
             else:
                 raise StreamJsonParserError(f"not implemented handling for {cur_state}: {ch}")
             if not r and not is_end:
@@ -387,10 +438,15 @@ def parse_json_stream(
 
     try:
         for chunk in itertools.chain(token_stream, [None]):
+            if chunk is PENDING:
+                yield PENDING
+                continue
             if chunk is None:
                 is_end = True
             else:
-                buf += chunk
+                # the consumed part of the buffer is dropped only once per chunk
+                buf = buf[pos:] + chunk
+                pos = 0
             parse_buf()
             yield from process_ev_queue()
 
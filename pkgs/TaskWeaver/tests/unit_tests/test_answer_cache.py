@@ -0,0 +1,148 @@
+import os
+
+from injector import Injector
+
+from taskweaver.config.config_mgt import AppConfigSource
+from taskweaver.logging import LoggingModule
+from taskweaver.memory import Post, Round
+from taskweaver.memory.plugin import PluginModule
+from taskweaver.module.execution_service import ExecutionServiceModule
+from taskweaver.role.role import RoleModule
+from taskweaver.session.answer_cache import AnswerCache
+from taskweaver.session.session import Session
+
+
+def create_round(query: str, answer: str) -> Round:
+    chat_round = Round.create(user_query=query)
+    chat_round.add_post(Post.create(message=query, send_from="User", send_to="Planner"))
+    chat_round.add_post(Post.create(message="run it", send_from="Planner", send_to="CodeInterpreter"))
+    chat_round.add_post(Post.create(message=answer, send_from="Planner", send_to="User"))
+    chat_round.change_round_state("finished")
+    return chat_round
+
+
+def test_answer_cache():
+    app_injector = Injector()
+    app_config = AppConfigSource(
+        config={
+            "session.answer_cache.enabled": True,
+            "session.answer_cache.threshold": 0.9,
+            "session.answer_cache.size": 2,
+        },
+    )
+    app_injector.binder.bind(AppConfigSource, to=app_config)
+    cache = app_injector.get(AnswerCache)
+
+    cache.set("1", "v1", [1.0, 0.0, 0.0], create_round("what tables are there", "t1, t2"))
+    assert cache.get("1", "v1", [0.0, 1.0, 0.0]) is None
+
+    query, reply = cache.get("1", "v1", [0.99, 0.1, 0.0])  # type: ignore
+    assert query == "what tables are there"
+    assert (reply.message, reply.send_from, reply.send_to) == ("t1, t2", "Planner", "User")
+
+    # the answers are partitioned by the data source
+    assert cache.get("2", "v1", [1.0, 0.0, 0.0]) is None
+
+    # a new version of the data source drops its answers
+    assert cache.get("1", "v2", [1.0, 0.0, 0.0]) is None
+    assert cache.get("1", "v1", [1.0, 0.0, 0.0]) is None
+
+    # unfinished rounds are not cached, and the oldest answers are evicted first
+    failed_round = create_round("row count of x", "42")
+    failed_round.change_round_state("failed")
+    cache.set("1", "v1", [0.0, 1.0, 0.0], failed_round)
+    assert cache.get("1", "v1", [0.0, 1.0, 0.0]) is None
+    cache.set("1", "v1", [1.0, 0.0, 0.0], create_round("q1", "a1"))
+    cache.set("1", "v1", [0.0, 1.0, 0.0], create_round("q2", "a2"))
+    cache.set("1", "v1", [0.0, 0.0, 1.0], create_round("q3", "a3"))
+    assert cache.get("1", "v1", [1.0, 0.0, 0.0]) is None
+    assert cache.get("1", "v1", [0.0, 0.0, 1.0])[0] == "q3"  # type: ignore
+
+    cache.invalidate("1")
+    assert cache.get("1", "v1", [0.0, 0.0, 1.0]) is None
+
+
+def test_answer_cache_principal():
+    app_injector = Injector()
+    app_config = AppConfigSource(config={"session.answer_cache.enabled": True})
+    app_injector.binder.bind(AppConfigSource, to=app_config)
+    cache = app_injector.get(AnswerCache)
+
+    cache.set("1", "v1", [1.0, 0.0], create_round("what tables are there", "t1, t2"), principal="alice")
+    assert cache.get("1", "v1", [1.0, 0.0], principal="alice") is not None
+    # the answers are not shared between users
+    assert cache.get("1", "v1", [1.0, 0.0], principal="bob") is None
+
+    # invalidating a data source drops its answers for all users
+    cache.set("1", "v1", [1.0, 0.0], create_round("what tables are there", "t1, t2"), principal="bob")
+    cache.invalidate("1")
+    assert cache.get("1", "v1", [1.0, 0.0], principal="alice") is None
+    assert cache.get("1", "v1", [1.0, 0.0], principal="bob") is None
+
+
+class FakeEmbeddingApi:
+    def get_embedding(self, message: str):
+        return [1.0, 0.0]
+
+
+def test_answer_cache_key(tmp_path):
+    app_injector = Injector([LoggingModule, PluginModule, RoleModule, ExecutionServiceModule])
+    app_config = AppConfigSource(
+        config={
+            "llm.api_key": "test_key",
+            "execution_service.kernel_mode": "local",
+            "session.roles": ["planner", "code_interpreter"],
+            "session.answer_cache.enabled": True,
+            "plugin.base_path": os.path.join(os.path.dirname(os.path.abspath(__file__)), "data/plugins"),
+        },
+        app_base_path=str(tmp_path),
+    )
+    app_injector.binder.bind(AppConfigSource, to=app_config)
+    session = app_injector.create_object(Session, {"session_id": "test-session"})
+    session.llm_api = FakeEmbeddingApi()  # type: ignore
+
+    # a session without the data source or the user is not cached
+    assert session._get_answer_cache_key("what tables are there") is None
+    session.update_session_var({"datasource_id": "1"})
+    assert session._get_answer_cache_key("what tables are there") is None
+
+    session.update_session_var({"auth_token": "token-a"})
+    partition, version, embedding, principal = session._get_answer_cache_key("what tables are there")  # type: ignore
+    assert (partition, version, embedding) == ("1", "", [1.0, 0.0])
+    assert principal != "" and "token-a" not in principal
+
+    # the follow-up messages depend on the conversation, they are not cached
+    session.memory.create_round(user_query="what tables are there")
+    assert session._get_answer_cache_key("and the second one?") is None
+
+
+def test_answer_cache_version_change(tmp_path):
+    app_injector = Injector([LoggingModule, PluginModule, RoleModule, ExecutionServiceModule])
+    app_config = AppConfigSource(
+        config={
+            "llm.api_key": "test_key",
+            "execution_service.kernel_mode": "local",
+            "session.roles": ["planner", "code_interpreter"],
+            "session.answer_cache.enabled": True,
+            "plugin.base_path": os.path.join(os.path.dirname(os.path.abspath(__file__)), "data/plugins"),
+        },
+        app_base_path=str(tmp_path),
+    )
+    app_injector.binder.bind(AppConfigSource, to=app_config)
+    session = app_injector.create_object(Session, {"session_id": "test-session"})
+    session.llm_api = FakeEmbeddingApi()  # type: ignore
+    cache = session.answer_cache
+    assert cache is not None
+
+    session.update_session_var({"datasource_id": "1", "auth_token": "token-a", "datasource_version": '"etag-1"'})
+    partition, version, embedding, principal = session._get_answer_cache_key("what tables are there")  # type: ignore
+    assert version == '"etag-1"'
+    cache.set(partition, version, embedding, create_round("what tables are there", "t1, t2"), principal=principal)
+    assert cache.get(partition, version, embedding, principal=principal) is not None
+
+    # the metadata of the data source has changed, the answers cached for the previous version are dropped
+    session.update_session_var({"datasource_version": '"etag-2"'})
+    _, new_version, _, _ = session._get_answer_cache_key("what tables are there")  # type: ignore
+    assert new_version == '"etag-2"'
+    assert cache.get(partition, new_version, embedding, principal=principal) is None
+    assert cache.get(partition, version, embedding, principal=principal) is None
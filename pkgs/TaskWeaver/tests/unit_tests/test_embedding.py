@@ -118,3 +118,46 @@ def test_zhipuai_embedding():
     assert len(embedding1) == 2
     assert len(embedding1[0]) == 1024
     assert len(embedding1[1]) == 1024
+
+
+def test_embedding_cache(tmp_path):
+    from taskweaver.llm import LLMApi
+
+    def create_llm_api():
+        app_injector = Injector()
+        app_config = AppConfigSource(
+            config={
+                "llm.api_type": "openai",
+                "llm.api_key": "test_key",
+                "llm.embedding_api_type": "openai",
+                "llm.embedding_model": "text-embedding-ada-002",
+                "llm.embedding_cache.size": 2,
+                "llm.embedding_cache.persist": True,
+                "llm.embedding_cache.path": str(tmp_path / "embedding_cache.sqlite"),
+            },
+        )
+        app_injector.binder.bind(AppConfigSource, to=app_config)
+        llm_api = app_injector.get(LLMApi)
+
+        calls = []
+
+        def get_embeddings(strings):
+            calls.append(list(strings))
+            return [[float(len(s)), 1.0] for s in strings]
+
+        llm_api.embedding_service.get_embeddings = get_embeddings  # type: ignore
+        return app_injector, llm_api, calls
+
+    app_injector, llm_api, calls = create_llm_api()
+    assert llm_api.get_embedding_list(["a", "bb", "a"]) == [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0]]
+    assert calls == [["a", "bb"]]
+
+    # the cache is shared by the LLMApi instances of the same app
+    assert app_injector.get(LLMApi).get_embedding("bb") == [2.0, 1.0]
+    assert llm_api.get_embedding_list(["ccc", "a"]) == [[3.0, 1.0], [1.0, 1.0]]
+    assert calls == [["a", "bb"], ["ccc"]]
+
+    # evicted from the in-memory LRU, but still in the on-disk store of a new app
+    _, llm_api, calls = create_llm_api()
+    assert llm_api.get_embedding_list(["a", "bb", "ccc"]) == [[1.0, 1.0], [2.0, 1.0], [3.0, 1.0]]
+    assert calls == []
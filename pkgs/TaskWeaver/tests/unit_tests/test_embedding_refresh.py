@@ -0,0 +1,86 @@
+import os
+import shutil
+from typing import List
+
+import pytest
+from injector import Injector
+
+from taskweaver.code_interpreter.plugin_selection import PluginSelector
+from taskweaver.config.config_mgt import AppConfigSource
+from taskweaver.memory.plugin import PluginModule
+from taskweaver.utils import map_concurrently, read_yaml
+
+
+def test_map_concurrently_retries():
+    calls: List[int] = []
+
+    def flaky(x: int) -> int:
+        calls.append(x)
+        if x == 2 and calls.count(2) == 1:
+            raise ValueError("transient")
+        return x * 10
+
+    results = sorted(map_concurrently(flaky, [1, 2, 3], max_workers=2, max_retries=1, retry_backoff=0))
+    assert results == [(0, 10, None), (1, 20, None), (2, 30, None)]
+
+    # without retries the failure is reported, the other items still complete
+    calls.clear()
+    results = sorted(map_concurrently(flaky, [1, 2, 3], max_workers=2), key=lambda r: r[0])
+    assert [(idx, value) for idx, value, _ in results] == [(0, 10), (1, None), (2, 30)]
+    assert isinstance(results[1][2], ValueError)
+
+
+def test_plugin_refresh_in_batches(tmp_path):
+    plugin_dir = str(tmp_path / "plugins")
+    shutil.copytree(
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "data/plugins"),
+        plugin_dir,
+        ignore=shutil.ignore_patterns(".meta", "__pycache__"),
+    )
+    app_injector = Injector([PluginModule])
+    app_config = AppConfigSource(
+        config={
+            "plugin.base_path": plugin_dir,
+            "llm.api_type": "openai",
+            "llm.embedding_api_type": "openai",
+            "llm.embedding_model": "test-embedding",
+            "llm.api_key": "test_key",
+            "llm.embedding_cache.enabled": False,
+            "llm.embedding_batch_size": 2,
+            "llm.embedding_concurrency": 2,
+            "llm.embedding_max_retries": 0,
+        },
+    )
+    app_injector.binder.bind(AppConfigSource, to=app_config)
+    plugin_selector = app_injector.get(PluginSelector)
+
+    batches: List[List[str]] = []
+
+    def get_embeddings(strings: List[str]) -> List[List[float]]:
+        batches.append(strings)
+        if any(s.startswith("paper_summary") for s in strings):
+            raise ConnectionError("service unavailable")
+        return [[float(len(s)), 1.0] for s in strings]
+
+    plugin_selector.llm_api.embedding_service.get_embeddings = get_embeddings  # type: ignore
+
+    with pytest.raises(Exception, match="Failed to embed 2 of 4 strings"):
+        plugin_selector.refresh()
+    assert sorted(len(b) for b in batches) == [2, 2]
+
+    # the plugins of the successful batch are saved, the others are embedded by the next refresh
+    embedded = {p.name for p in plugin_selector.available_plugins if len(p.meta_data.embedding) > 0}
+    assert len(embedded) == 2 and "paper_summary" not in embedded
+    for p in plugin_selector.available_plugins:
+        assert os.path.exists(p.meta_data.path) == (p.name in embedded)
+        if p.name in embedded:
+            assert read_yaml(p.meta_data.path)["embedding_model"] == "test-embedding"
+
+    batches.clear()
+    plugin_selector.llm_api.embedding_service.get_embeddings = (  # type: ignore
+        lambda strings: batches.append(strings) or [[1.0, 0.0] for _ in strings]
+    )
+    plugin_selector.refresh()
+    assert len(batches) == 1 and len(batches[0]) == 2
+    assert all(len(p.meta_data.embedding) > 0 for p in plugin_selector.available_plugins)
+    assert not any(f.endswith(".tmp") for f in os.listdir(os.path.join(plugin_dir, ".meta")))
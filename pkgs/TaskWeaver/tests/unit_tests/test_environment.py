@@ -1,7 +1,9 @@
+import asyncio
 import glob
 import json
 import os
 import shutil
+import time
 from typing import Optional
 
 import pytest
@@ -186,3 +188,141 @@ def test_environment_start_outside_container():
     finally:
         # delete sessions
         shutil.rmtree(sessions)
+
+
+@pytest.mark.skipif(IN_GITHUB_ACTIONS, reason="Test doesn't work in Github Actions.")
+def test_environment_kernel_pool(tmp_path):
+    def wait_for_pool(env: Environment, timeout: float = 60):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if len(env.idle_kernels) == env.kernel_pool_size and env.kernel_pool_starting == 0:
+                return
+            time.sleep(0.1)
+        assert False, "kernel pool is not filled in time"
+
+    env = Environment(
+        "local",
+        env_dir=str(tmp_path),
+        env_mode=EnvMode.Local,
+        kernel_pool_size=1,
+        kernel_max_uses=1,
+    )
+    try:
+        wait_for_pool(env)
+        pooled_kernel_id = env.idle_kernels[0].kernel_id
+
+        # the session leases the pre-started kernel and works in its own cwd
+        session_dir_1 = os.path.join(str(tmp_path), "sessions", "session_1")
+        env.start_session("session_1", session_dir=session_dir_1)
+        assert env.session_dict["session_1"].kernel_id == pooled_kernel_id
+        env.update_session_var("session_1", {"key": "value"})
+        result = env.execute_code("session_1", 'x = 1\nopen("f.txt", "w").write("x")\nx')
+        assert result.is_success
+        assert os.path.isfile(os.path.join(session_dir_1, "cwd", "f.txt"))
+        env.stop_session("session_1")
+
+        # the kernel reached kernel_max_uses, so it is shut down instead of being reused
+        assert pooled_kernel_id not in env.multi_kernel_manager.list_kernel_ids()
+        wait_for_pool(env)
+        assert env.idle_kernels[0].kernel_id != pooled_kernel_id
+
+        # a reset kernel does not leak the namespace or the session variables of the previous session
+        env.kernel_max_uses = 10
+        session_dir_2 = os.path.join(str(tmp_path), "sessions", "session_2")
+        env.start_session("session_2", session_dir=session_dir_2)
+        reused_kernel_id = env.session_dict["session_2"].kernel_id
+        env.update_session_var("session_2", {"key": "value"})
+        assert env.execute_code("session_2", "y = 1").is_success
+        code = 'import os\nos.environ["SESSION_2_TOKEN"] = "secret"\nos.environ["TASKWEAVER_ENV_ID"] = "changed"'
+        assert env.execute_code("session_2", code).is_success
+        # stop refilling so that the released kernel is the only idle one
+        wait_for_pool(env)
+        env.shutdown_kernel_pool()
+        env.kernel_pool_stopped = False
+        env.stop_session("session_2")
+        assert [k.kernel_id for k in env.idle_kernels] == [reused_kernel_id]
+
+        session_dir_3 = os.path.join(str(tmp_path), "sessions", "session_3")
+        env.start_session("session_3", session_dir=session_dir_3)
+        assert env.session_dict["session_3"].kernel_id == reused_kernel_id
+        assert not env.execute_code("session_3", "y").is_success
+        result = env.execute_code("session_3", "%_taskweaver_check_session_var")
+        assert "key" not in str(result.output)
+        code = 'import os\n(os.environ.get("SESSION_2_TOKEN"), os.environ["TASKWEAVER_ENV_ID"])'
+        result = env.execute_code("session_3", code)
+        assert str(result.output) == "(None, 'local')"
+        env.stop_session("session_3")
+    finally:
+        env.shutdown_kernel_pool()
+
+
+@pytest.mark.skipif(IN_GITHUB_ACTIONS, reason="Test doesn't work in Github Actions.")
+def test_environment_persistent_client(tmp_path):
+    env = Environment("local", env_dir=str(tmp_path), env_mode=EnvMode.Local)
+    session_dir = os.path.join(str(tmp_path), "sessions", "session_id")
+    try:
+        env.start_session("session_id", session_dir=session_dir)
+        client = env.session_dict["session_id"].client
+        assert client is not None and client.channels_running
+
+        result = env.execute_code("session_id", "1 + 1")
+        assert result.is_success
+        assert result.output == 2
+        for step in ["pre_check", "connect", "run", "post_check", "total"]:
+            assert step in result.timing
+
+        # the client and its channels are reused across executions
+        assert env.execute_code("session_id", "print('hello')").stdout == ["hello\n"]
+        assert env.session_dict["session_id"].client is client
+    finally:
+        env.stop_session("session_id")
+    assert env.session_dict["session_id"].client is None
+
+
+@pytest.mark.skipif(IN_GITHUB_ACTIONS, reason="Test doesn't work in Github Actions.")
+def test_environment_session_var_dirty_tracking(tmp_path):
+    env = Environment("local", env_dir=str(tmp_path), env_mode=EnvMode.Local)
+    session_dir = os.path.join(str(tmp_path), "sessions", "session_id")
+    try:
+        env.start_session("session_id", session_dir=session_dir)
+        env.update_session_var("session_id", {"a": "1", "b": "2"})
+        assert "update_session_var" in env.execute_code("session_id", "1").timing
+
+        # nothing changed, so nothing is sent to the kernel
+        env.update_session_var("session_id", {"a": "1"})
+        assert "update_session_var" not in env.execute_code("session_id", "1").timing
+
+        # only the changed key is sent and merged with the existing ones
+        env.update_session_var("session_id", {"b": "3"})
+        assert env.session_dict["session_id"].session_var_dirty == {"b"}
+        assert "update_session_var" in env.execute_code("session_id", "1").timing
+        result = env._execute_control_code_on_kernel("session_id", "%_taskweaver_check_session_var")
+        assert result["data"] == {"a": "1", "b": "3"}
+    finally:
+        env.stop_session("session_id")
+
+
+@pytest.mark.skipif(IN_GITHUB_ACTIONS, reason="Test doesn't work in Github Actions.")
+def test_environment_execute_code_async(tmp_path):
+    env = Environment("local", env_dir=str(tmp_path), env_mode=EnvMode.Local)
+    session_dir = os.path.join(str(tmp_path), "sessions", "session_id")
+
+    async def main():
+        env.update_session_var("session_id", {"a": "1"})
+        results = [await env.execute_code_async("session_id", "1 + 1")]
+        # the sync and async clients share the kernel
+        results.append(env.execute_code("session_id", "print('hello')"))
+        results.append(await env.execute_code_async("session_id", "undefined_name"))
+        return results
+
+    try:
+        env.start_session("session_id", session_dir=session_dir)
+        first, second, third = asyncio.run(main())
+        assert first.is_success and first.output == 2
+        assert "update_session_var" in first.timing
+        assert second.stdout == ["hello\n"]
+        assert not third.is_success and "NameError" in third.error
+        assert env.session_dict["session_id"].async_client is not None
+    finally:
+        env.stop_session("session_id")
+    assert env.session_dict["session_id"].async_client is None
@@ -27,3 +27,31 @@ def test_load_examples():
 
     examples = load_examples(example_path, {"Planner", "User", "CodeInterpreter", "Other"})
     assert len(examples) == 1
+
+
+def test_example_cache(tmp_path):
+    import shutil
+
+    from taskweaver.misc.example import ExampleCache
+
+    example_file = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        "data",
+        "examples",
+        "planner_examples",
+        "example-planner.yaml",
+    )
+    cached_file = str(tmp_path / "example-planner.yaml")
+    shutil.copy(example_file, cached_file)
+
+    example_cache = ExampleCache()
+    examples = load_examples(str(tmp_path), example_cache=example_cache)
+    assert len(examples) == 1
+    # the parsed conversation is reused while the file does not change
+    assert load_examples(str(tmp_path), example_cache=example_cache)[0] is examples[0]
+
+    with open(cached_file, "a") as f:
+        f.write("\n# changed\n")
+    reloaded = load_examples(str(tmp_path), example_cache=example_cache)
+    assert len(reloaded) == 1
+    assert reloaded[0] is not examples[0]
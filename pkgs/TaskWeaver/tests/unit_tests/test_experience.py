@@ -50,3 +50,54 @@ def test_experience_retrieval():
 
     assert len(experiences) == 1
     assert experiences[0][0].exp_id == "test-exp-1"
+
+
+def test_experience_index(tmp_path):
+    import shutil
+    from types import SimpleNamespace
+
+    from taskweaver.memory import experience as experience_module
+    from taskweaver.utils import read_yaml
+
+    exp_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data/experience")
+    for file_name in os.listdir(exp_dir):
+        shutil.copy(os.path.join(exp_dir, file_name), tmp_path)
+    embedding = read_yaml(os.path.join(exp_dir, "exp_test-exp-1.yaml"))["embedding"]
+
+    app_injector = Injector([LoggingModule])
+    app_config = AppConfigSource(
+        config={
+            "experience.experience_dir": str(tmp_path),
+            "experience.retrieve_threshold": 0.5,
+        },
+    )
+    app_injector.binder.bind(AppConfigSource, to=app_config)
+    llm_api = SimpleNamespace(
+        embedding_service=SimpleNamespace(config=SimpleNamespace(embedding_model="all-mpnet-base-v2")),
+        get_embedding=lambda _: embedding,
+    )
+    app_injector.binder.bind(experience_module.LLMApi, to=llm_api)  # type: ignore
+
+    experience_manager = app_injector.create_object(ExperienceGenerator)
+    experience_manager.load_experience()
+    assert os.path.exists(tmp_path / "exp_index.npz")
+    assert [exp.exp_id for exp in experience_manager.experience_list] == ["test-exp-1"]
+
+    # a new generator is served from the persisted index without reading the experience files
+    experience_manager = app_injector.create_object(ExperienceGenerator)
+    read_yaml_calls = []
+    original_read_yaml = experience_module.read_yaml
+    experience_module.read_yaml = lambda path: read_yaml_calls.append(path) or original_read_yaml(path)
+    try:
+        experience_manager.load_experience()
+    finally:
+        experience_module.read_yaml = original_read_yaml
+    assert read_yaml_calls == []
+
+    experiences = experience_manager.retrieve_experience("show top 10 data in ./data.csv")
+    assert [(exp.exp_id, round(sim, 3)) for exp, sim in experiences] == [("test-exp-1", 1.0)]
+    assert experiences[0][0].experience_text.startswith("User Query")
+
+    experience_manager.delete_experience("test-exp-1")
+    assert experience_manager.experience_list == []
+    assert experience_manager.retrieve_experience("show top 10 data in ./data.csv") == []
@@ -123,3 +123,31 @@ bad_cases: List[str] = [
 def test_json_parser_bad(bad_case: str):
     with pytest.raises(json_parser.StreamJsonParserError):
         json_parser.parse_json(bad_case)
+
+
+def test_json_parser_stream_chunks():
+    obj = obj_cases[-1]
+    dumped_str = json.dumps(obj, indent=2)
+
+    def collect(chunks: List[str], **kwargs: Any) -> List[json_parser.ParserEvent]:
+        return list(json_parser.parse_json_stream(iter(chunks), **kwargs))
+
+    # a string arrives as one event per chunk, with its full value in the end event
+    events = collect([dumped_str])
+    key_events = [ev for ev in events if ev.prefix == ".test_key.str_array[2]" and ev.event == "string"]
+    assert key_events[-1].value == "test"
+    assert key_events[-1].is_end
+
+    # the final values do not depend on how the input is chunked
+    for chunk_size in [1, 3, 7, 64]:
+        chunks = [dumped_str[i : i + chunk_size] for i in range(0, len(dumped_str), chunk_size)]
+        chunk_events = collect(chunks, ijson_prefix=True)
+        ends = [(ev.prefix, ev.event, ev.value) for ev in chunk_events if ev.is_end and ev.event != "ws"]
+        assert ends == [
+            (ev.prefix, ev.event, ev.value)
+            for ev in collect([dumped_str], ijson_prefix=True)
+            if ev.is_end and ev.event != "ws"
+        ]
+        assert "".join(ev.value_str for ev in chunk_events) == "".join(ev.value_str for ev in events)
+        assert all(ev.event != "ws" for ev in collect(chunks, skip_ws=True))
+    assert ("test_key.test another key.item.test yet  key 2", "string", '\r\nሴ\ffdfd\tfdfv\b"') in ends
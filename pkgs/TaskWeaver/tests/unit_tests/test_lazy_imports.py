@@ -0,0 +1,22 @@
+import subprocess
+import sys
+
+
+def test_app_import_does_not_load_sdks():
+    code = (
+        "import sys\n"
+        "import taskweaver.app.app\n"
+        "print(','.join(m for m in ('openai', 'numpy', 'jupyter_client') if m in sys.modules))\n"
+    )
+    output = subprocess.check_output([sys.executable, "-c", code], text=True)
+    assert output.strip() == ""
+
+
+def test_lazy_service_attributes():
+    from taskweaver.ces import EnvMode
+    from taskweaver.llm import OpenAIService, get_service_class, llm_completion_config_map
+    from taskweaver.llm.openai import OpenAIService as ServiceClass
+
+    assert OpenAIService is ServiceClass
+    assert get_service_class(llm_completion_config_map["azure"]) is ServiceClass
+    assert EnvMode.Local.value == "local"
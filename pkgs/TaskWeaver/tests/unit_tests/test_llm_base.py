@@ -1,4 +1,6 @@
+import asyncio
 import json
+import threading
 
 import pytest
 from injector import Injector
@@ -80,3 +82,135 @@ def test_llm_output_format(
         recv_msg += chunk["content"]
 
     assert recv_msg == chat_response["content"]
+
+
+def test_completion_cache(tmp_path):
+    def create_llm_api():
+        app_injector = Injector()
+        app_config = AppConfigSource(
+            config={
+                "llm.api_type": "openai",
+                "llm.api_key": "test_key",
+                "llm.model": "gpt-4",
+                "llm.embedding_api_type": "openai",
+                "llm.completion_cache.enabled": True,
+                "llm.completion_cache.persist": True,
+                "llm.completion_cache.path": str(tmp_path / "completion_cache.sqlite"),
+                "llm.completion_cache.replay_chunk_size": 4,
+            },
+        )
+        app_injector.binder.bind(AppConfigSource, to=app_config)
+        llm_api = app_injector.get(LLMApi)
+
+        calls = []
+
+        def chat_completion(messages, *args, **kwargs):
+            calls.append(messages[-1]["content"])
+            yield format_chat_message("assistant", "Hello, ")
+            yield format_chat_message("assistant", "world!")
+
+        llm_api.completion_service.chat_completion = chat_completion  # type: ignore
+        return llm_api, calls
+
+    llm_api, calls = create_llm_api()
+    assert llm_api.chat_completion([format_chat_message("user", "Hi")])["content"] == "Hello, world!"
+    # the messages are normalized, and the cached response is streamed back in chunks
+    chunks = list(llm_api.chat_completion_stream([format_chat_message("user", "Hi \r\n")], use_smoother=False))
+    assert [c["content"] for c in chunks] == ["Hell", "o, w", "orld", "!"]
+    assert calls == ["Hi"]
+
+    # the sampling parameters are part of the key
+    llm_api.chat_completion([format_chat_message("user", "Hi")], temperature=0.5)
+    assert calls == ["Hi", "Hi"]
+
+    # a stream closed before the end is not cached
+    stream = llm_api.chat_completion_stream([format_chat_message("user", "Bye")], use_smoother=False)
+    next(stream)
+    stream.close()
+    llm_api.chat_completion([format_chat_message("user", "Bye")])
+    assert calls == ["Hi", "Hi", "Bye", "Bye"]
+
+    # responses survive in the on-disk store of a new app
+    llm_api, calls = create_llm_api()
+    assert llm_api.chat_completion([format_chat_message("user", "Hi")])["content"] == "Hello, world!"
+    assert calls == []
+
+
+def test_chat_completion_stream_async(tmp_path):
+    app_injector = Injector()
+    app_config = AppConfigSource(
+        config={
+            "llm.api_type": "openai",
+            "llm.api_key": "test_key",
+            "llm.model": "gpt-4",
+            "llm.embedding_api_type": "openai",
+            "llm.completion_cache.enabled": True,
+            "llm.completion_cache.path": str(tmp_path / "completion_cache.sqlite"),
+            "llm.completion_cache.replay_chunk_size": 4,
+        },
+    )
+    app_injector.binder.bind(AppConfigSource, to=app_config)
+    llm_api = app_injector.get(LLMApi)
+
+    calls = []
+
+    async def chat_completion_async(messages, *args, **kwargs):
+        calls.append((messages[-1]["content"], threading.get_ident()))
+        yield format_chat_message("assistant", "Hello, ")
+        yield format_chat_message("assistant", "world!")
+
+    llm_api.completion_service.chat_completion_async = chat_completion_async  # type: ignore
+
+    async def complete(content: str):
+        return [
+            c["content"] async for c in llm_api.chat_completion_stream_async([format_chat_message("user", content)])
+        ]
+
+    async def main():
+        first = await complete("Hi")
+        # the response is cached, and replayed in chunks
+        second = await complete("Hi")
+        return threading.get_ident(), first, second
+
+    loop_thread, first, second = asyncio.run(main())
+    assert first == ["Hello, ", "world!"]
+    assert second == ["Hell", "o, w", "orld", "!"]
+    # the native completion runs on the event loop thread
+    assert calls == [("Hi", loop_thread)]
+
+
+def test_chat_completion_async_in_thread():
+    app_injector = Injector()
+    app_config = AppConfigSource(
+        config={
+            "llm.api_type": "openai",
+            "llm.api_key": "test_key",
+            "llm.model": "gpt-4",
+            "llm.embedding_api_type": "openai",
+        },
+    )
+    app_injector.binder.bind(AppConfigSource, to=app_config)
+    llm_api = app_injector.get(LLMApi)
+
+    threads = []
+
+    def chat_completion(messages, *args, **kwargs):
+        threads.append(threading.get_ident())
+        yield format_chat_message("assistant", "Hello")
+
+    llm_api.completion_service.chat_completion = chat_completion  # type: ignore
+
+    async def main():
+        # the tool calls are not streamed natively, so the blocking completion is pulled in a worker thread
+        response = [
+            c["content"]
+            async for c in llm_api.chat_completion_stream_async(
+                [format_chat_message("user", "Hi")],
+                tools=[],
+            )
+        ]
+        return threading.get_ident(), response
+
+    loop_thread, response = asyncio.run(main())
+    assert response == ["Hello"]
+    assert len(threads) == 1 and threads[0] != loop_thread
@@ -75,3 +75,57 @@ def test_memory_get_rounds():
     rounds[0].post_list[0].message = "create a dataframe 1"
     assert rounds[0].post_list[0].message == "create a dataframe 1"
     assert memory.conversation.rounds[0].post_list[0].message == "create a dataframe"
+
+
+def test_memory_get_rounds_incremental(monkeypatch):
+    from taskweaver.memory import Memory, Post
+    from taskweaver.module.prompt_util import PromptUtil
+
+    remove_parts_calls = []
+    original_remove_parts = PromptUtil.remove_parts
+
+    def remove_parts(text, delimiter):
+        remove_parts_calls.append(text)
+        return original_remove_parts(text, delimiter)
+
+    monkeypatch.setattr(PromptUtil, "remove_parts", remove_parts)
+
+    def temporal_post(message: str, temporal: str, send_from="CodeInterpreter", send_to="Planner"):
+        return Post.create(
+            message=message + PromptUtil.wrap_text_with_delimiter(temporal, PromptUtil.DELIMITER_TEMPORAL),
+            send_from=send_from,
+            send_to=send_to,
+        )
+
+    memory = Memory(session_id="session-1")
+    round1 = memory.create_round(user_query="hello")
+    round1.add_post(temporal_post("first ", "1"))
+    round1.add_post(temporal_post("to user ", "2", send_from="Planner", send_to="User"))
+
+    rounds = memory.get_role_rounds(role="CodeInterpreter")
+    assert [p.message for p in rounds[0].post_list] == ["first 1"]
+
+    # a new post in the current round is picked up
+    round1.add_post(temporal_post("second ", "3", send_from="Planner", send_to="CodeInterpreter"))
+    rounds = memory.get_role_rounds(role="CodeInterpreter")
+    assert [p.message for p in rounds[0].post_list] == ["first 1", "second 3"]
+
+    # a new round makes the previous one historical, so its temporal parts are removed
+    round2 = memory.create_round(user_query="hello again")
+    round2.add_post(temporal_post("third ", "4"))
+    rounds = memory.get_role_rounds(role="CodeInterpreter")
+    assert [[p.message for p in r.post_list] for r in rounds] == [["first ", "second "], ["third 4"]]
+
+    # the delimiter-stripped text is computed once per post
+    rounds = memory.get_role_rounds(role="CodeInterpreter")
+    assert len(remove_parts_calls) == 3
+
+    # failed rounds are excluded, making the previous round the last one again
+    round2.change_round_state("failed")
+    rounds = memory.get_role_rounds(role="CodeInterpreter")
+    assert [[p.message for p in r.post_list] for r in rounds] == [["first 1", "second 3"]]
+    assert len(memory.get_role_rounds(role="CodeInterpreter", include_failure_rounds=True)) == 2
+
+    # the returned posts can be changed without affecting the memory
+    rounds[0].post_list[0].message = "changed"
+    assert memory.get_role_rounds(role="CodeInterpreter")[0].post_list[0].message == "first 1"
@@ -194,6 +194,19 @@ def test_compose_prompt():
     assert messages[5]["role"] == "user"
     assert messages[5]["content"] == "User: hello"
 
+    # the system prompt and the finished rounds are served from the cache in the next hop
+    assert planner.prompt_prefix_length == 1
+    assert len(planner.round_prompt_cache.entries) == 1
+    round2.add_post(
+        Post.create(message="hi", send_from="Planner", send_to="User", attachment_list=[]),
+    )
+    next_messages = planner.compose_prompt(rounds=memory.conversation.rounds)
+    assert next_messages[0] is messages[0]
+    assert next_messages[1:5] == messages[1:5]
+    assert next_messages[1] is messages[1]
+    assert next_messages[5] == messages[5]
+    assert len(next_messages) == 7
+
 
 def test_compose_example_for_prompt():
     from taskweaver.memory import Memory, Post, Round
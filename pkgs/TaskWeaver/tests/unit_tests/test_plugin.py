@@ -1,4 +1,5 @@
 import os
+from datetime import timedelta
 
 from injector import Injector
 
@@ -47,6 +48,31 @@ def test_load_plugin_yaml():
     )
 
 
+def test_plugin_registry_reload(tmp_path):
+    import shutil
+
+    plugin_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data/plugins")
+    for name in ["anomaly_detection", "klarna_search"]:
+        shutil.copy(os.path.join(plugin_dir, f"{name}.yaml"), tmp_path / f"{name}.yaml")
+
+    plugin_registry = PluginRegistry(file_glob=str(tmp_path / "*.yaml"))
+    registry = plugin_registry.get_registry()
+    assert len(registry) == 2
+
+    # a reload only parses the files changed since they were loaded
+    with open(tmp_path / "klarna_search.yaml", "a") as f:
+        f.write("\n# changed\n")
+    os.remove(tmp_path / "anomaly_detection.yaml")
+    reloaded = plugin_registry.get_registry(freshness=timedelta(0))
+    assert list(reloaded.keys()) == ["klarna_search"]
+    assert reloaded["klarna_search"] is not registry["klarna_search"]
+
+    shutil.copy(os.path.join(plugin_dir, "anomaly_detection.yaml"), tmp_path / "anomaly_detection.yaml")
+    reloaded_again = plugin_registry.get_registry(freshness=timedelta(0))
+    assert len(reloaded_again) == 2
+    assert reloaded_again["klarna_search"] is reloaded["klarna_search"]
+
+
 def test_plugin_format_prompt():
     app_injector = Injector(
         [PluginModule, LoggingModule],
@@ -112,3 +138,38 @@ def test_plugin_format_prompt():
         "# description: This is a string describing the anomaly detection results.\n"
         "str]:...\n"
     )
+
+
+def test_plugin_http_session(tmp_path):
+    from requests.adapters import HTTPAdapter
+
+    from taskweaver.plugin.context import TestPluginContext
+
+    ctx = TestPluginContext(str(tmp_path))
+    session = ctx.get_http_session(timeout=(1, 2), retries=2)
+
+    # the session is shared by the plugins asking for the same settings
+    assert ctx.get_http_session(timeout=(1, 2), retries=2) is session
+    assert ctx.get_http_session(timeout=(1, 3), retries=2) is not session
+
+    adapter = session.get_adapter("http://localhost")
+    assert adapter.max_retries.total == 2
+    assert "POST" not in adapter.max_retries.allowed_methods
+
+    sent_timeouts = []
+
+    def send(self, request, **kwargs):
+        sent_timeouts.append(kwargs["timeout"])
+        raise ConnectionError("not connected")
+
+    original_send = HTTPAdapter.send
+    HTTPAdapter.send = send  # type: ignore
+    try:
+        for timeout in [None, 10]:
+            try:
+                session.get("http://localhost/metadata", timeout=timeout)
+            except ConnectionError:
+                pass
+    finally:
+        HTTPAdapter.send = original_send  # type: ignore
+    assert sent_timeouts == [(1, 2), 10]
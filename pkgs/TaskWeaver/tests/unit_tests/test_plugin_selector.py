@@ -37,3 +37,43 @@ def test_plugin_selector():
     selected_plugins = plugin_selector.plugin_select(query2, top_k=3)
 
     assert any([p.name == "paper_summary" for p in selected_plugins])
+
+
+def test_plugin_select_top_k():
+    from types import SimpleNamespace
+
+    from taskweaver.memory.plugin import PluginRegistry
+    from taskweaver.utils import generate_md5_hash
+
+    app_injector = Injector([PluginModule])
+    app_config = AppConfigSource(
+        config={
+            "plugin.base_path": os.path.join(os.path.dirname(os.path.abspath(__file__)), "data/plugins"),
+        },
+    )
+    app_injector.binder.bind(AppConfigSource, to=app_config)
+    plugin_registry = app_injector.get(PluginRegistry)
+    plugins = plugin_registry.get_list()
+    assert len(plugins) > 3
+
+    # one-hot embeddings with different scales, so that the ranking only depends on the direction
+    dim = len(plugins)
+    for i, p in enumerate(plugins):
+        embedding = [0.0] * dim
+        embedding[i] = float(i + 1)
+        p.meta_data.embedding = embedding
+        p.meta_data.embedding_model = "fake"
+        p.meta_data.md5hash = generate_md5_hash(p.spec.name + p.spec.description)
+
+    query_embedding = [0.0] * dim
+    query_embedding[2], query_embedding[0], query_embedding[1] = 3.0, 2.0, 1.0
+    llm_api = SimpleNamespace(
+        embedding_service=SimpleNamespace(config=SimpleNamespace(embedding_model="fake")),
+        get_embedding=lambda _: query_embedding,
+    )
+    plugin_selector = PluginSelector(plugin_registry, llm_api)  # type: ignore
+    plugin_selector.load_plugin_embeddings()
+
+    selected_plugins = plugin_selector.plugin_select("query", top_k=3)
+    assert [p.name for p in selected_plugins] == [plugins[2].name, plugins[0].name, plugins[1].name]
+    assert plugin_selector.plugin_select("query", top_k=dim) == plugins
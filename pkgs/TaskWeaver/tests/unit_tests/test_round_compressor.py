@@ -77,3 +77,178 @@ def test_round_compressor():
     )
     assert summary == "None"
     assert len(retained) == 4
+
+
+def wait_for_summary(compressor: RoundCompressor) -> None:
+    thread = compressor.summary_thread
+    if thread is not None:
+        thread.join(5)
+
+
+def test_round_compressor_token_budget():
+    from taskweaver.memory import Post, Round
+
+    app_injector = Injector(
+        [LoggingModule],
+    )
+    app_config = AppConfigSource(
+        config={
+            "llm.api_key": "test_key",
+            "round_compressor.mode": "token_budget",
+            "round_compressor.token_budget": 64,
+        },
+    )
+    app_injector.binder.bind(AppConfigSource, to=app_config)
+    compressor = app_injector.get(RoundCompressor)
+
+    summarized = []
+
+    def summarize(rounds, rounds_formatter, prompt_template):
+        summarized.append(rounds_formatter(rounds))
+        compressor.processed_rounds.update([_round.id for _round in rounds])
+        compressor.previous_summary = "summary"
+        return "summary"
+
+    compressor._summarize = summarize
+
+    rounds = []
+    for i in range(4):
+        _round = Round.create(user_query="hello", id=f"round-{i}")
+        _round.add_post(Post.create(message="hello", send_from="User", send_to="Planner"))
+        rounds.append(_round)
+
+    def formatter(rs):
+        return "x" * 80 * len(rs)
+
+    # each round takes 20 tokens, so all 3 rounds fit into the budget
+    summary, retained = compressor.compress_rounds(rounds[:3], formatter)
+    assert summary == "None"
+    assert len(retained) == 3
+    compressor.summarize_in_background(rounds[:3], formatter)
+    assert compressor.summary_thread is None
+
+    # when round-3 ends, the oldest round no longer fits and is summarized in the background
+    compressor.summarize_in_background(rounds, formatter)
+    wait_for_summary(compressor)
+    assert summarized == ["x" * 80]
+
+    # the next prompt uses the summary in place of the summarized round
+    summary, retained = compressor.compress_rounds(rounds, formatter)
+    assert summary == "summary"
+    assert [r.id for r in retained] == ["round-1", "round-2", "round-3"]
+
+
+def test_round_compressor_keeps_overflow_until_summarized():
+    import threading
+    import time
+
+    from taskweaver.memory import Post, Round
+
+    app_injector = Injector(
+        [LoggingModule],
+    )
+    app_config = AppConfigSource(
+        config={
+            "llm.api_key": "test_key",
+            "round_compressor.mode": "token_budget",
+            "round_compressor.token_budget": 64,
+        },
+    )
+    app_injector.binder.bind(AppConfigSource, to=app_config)
+    compressor = app_injector.get(RoundCompressor)
+
+    summarized = []
+    release = threading.Event()
+
+    def summarize(rounds, rounds_formatter, prompt_template):
+        release.wait(5)
+        summarized.append([_round.id for _round in rounds])
+        compressor.processed_rounds.update([_round.id for _round in rounds])
+        compressor.previous_summary = "summary"
+        return "summary"
+
+    compressor._summarize = summarize
+
+    rounds = []
+    for i in range(5):
+        _round = Round.create(user_query="hello", id=f"round-{i}")
+        _round.add_post(Post.create(message="hello", send_from="User", send_to="Planner"))
+        rounds.append(_round)
+
+    def formatter(rs):
+        return "x" * 80 * len(rs)
+
+    # the overflow rounds stay in the prompt while their summary is not published
+    summary, retained = compressor.compress_rounds(rounds[:4], formatter)
+    assert summary == "None"
+    assert [r.id for r in retained] == ["round-0", "round-1", "round-2", "round-3"]
+
+    # round-0 is being summarized when round-1 overflows as well
+    while len(compressor.summarizing_rounds) == 0:
+        time.sleep(0.01)
+    summary, retained = compressor.compress_rounds(rounds, formatter)
+    assert summary == "None"
+    assert [r.id for r in retained] == ["round-0", "round-1", "round-2", "round-3", "round-4"]
+
+    # round-1 is summarized after round-0 instead of being dropped
+    release.set()
+    wait_for_summary(compressor)
+    assert summarized == [["round-0"], ["round-1"]]
+    assert compressor.summary_thread is None
+
+    summary, retained = compressor.compress_rounds(rounds, formatter)
+    assert summary == "summary"
+    assert [r.id for r in retained] == ["round-2", "round-3", "round-4"]
+
+
+def test_round_compressor_summarizes_at_round_end(tmp_path):
+    import os
+
+    from taskweaver.memory import Post
+    from taskweaver.memory.plugin import PluginModule
+    from taskweaver.module.execution_service import ExecutionServiceModule
+    from taskweaver.role.role import RoleModule
+    from taskweaver.session.session import Session
+
+    app_injector = Injector([LoggingModule, PluginModule, RoleModule, ExecutionServiceModule])
+    app_config = AppConfigSource(
+        config={
+            "llm.api_key": "test_key",
+            "execution_service.kernel_mode": "local",
+            "session.roles": ["planner", "code_interpreter"],
+            "planner.prompt_compression": True,
+            "round_compressor.mode": "token_budget",
+            "round_compressor.token_budget": 1,
+            "plugin.base_path": os.path.join(os.path.dirname(os.path.abspath(__file__)), "data/plugins"),
+        },
+        app_base_path=str(tmp_path),
+    )
+    app_injector.binder.bind(AppConfigSource, to=app_config)
+    session = app_injector.create_object(Session, {"session_id": "test-session"})
+
+    planner = session.planner
+    compressor = planner.round_compressor
+    summarized = []
+
+    def summarize(rounds, rounds_formatter, prompt_template):
+        summarized.append([_round.user_query for _round in rounds])
+        compressor.processed_rounds.update([_round.id for _round in rounds])
+        return "summary"
+
+    compressor._summarize = summarize
+    planner.reply = lambda memory, prompt_log_path=None: Post.create(
+        message="done",
+        send_from="Planner",
+        send_to="User",
+    )
+
+    session._send_text_message("first")
+    wait_for_summary(compressor)
+    assert summarized == []
+
+    # the first round is summarized as soon as the second one has ended, before the third one starts
+    session._send_text_message("second")
+    wait_for_summary(compressor)
+    assert summarized == [["first"]]
+
+    session.stop()
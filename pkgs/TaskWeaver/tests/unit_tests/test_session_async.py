@@ -0,0 +1,106 @@
+import asyncio
+import threading
+from typing import List
+
+from injector import Injector
+
+from taskweaver.config.config_mgt import AppConfigSource
+from taskweaver.logging import LoggingModule
+from taskweaver.memory import Memory, Post
+from taskweaver.memory.plugin import PluginModule
+from taskweaver.module.event_emitter import PostEventType, SessionEventEmitter, SessionEventHandler, TaskWeaverEvent
+from taskweaver.module.execution_service import ExecutionServiceModule
+from taskweaver.role.role import RoleModule
+from taskweaver.session.session import Session
+
+
+class RecordingHandler(SessionEventHandler):
+    def __init__(self):
+        self.threads: List[int] = []
+        self.events: List[TaskWeaverEvent] = []
+
+    def handle(self, event: TaskWeaverEvent):
+        self.threads.append(threading.get_ident())
+        self.events.append(event)
+
+
+class FakeRole:
+    def __init__(self, alias: str):
+        self.alias = alias
+
+    def get_alias(self) -> str:
+        return self.alias
+
+    def prepare_next_round(self, memory: Memory) -> None:
+        pass
+
+
+class FakePlanner(FakeRole):
+    """Reply to the user once all the rounds are running, so the test fails if the rounds are serialized."""
+
+    def __init__(self, event_emitter: SessionEventEmitter, started: List[str], all_started: asyncio.Event):
+        super().__init__("Planner")
+        self.event_emitter = event_emitter
+        self.started = started
+        self.all_started = all_started
+        self.threads: List[int] = []
+
+    async def reply_async(self, memory: Memory, **kwargs) -> Post:
+        self.threads.append(threading.get_ident())
+        user_query = memory.conversation.rounds[-1].user_query
+        self.started.append(user_query)
+        if len(self.started) == 2:
+            self.all_started.set()
+        await asyncio.wait_for(self.all_started.wait(), timeout=10)
+
+        post_proxy = self.event_emitter.create_post_proxy("Planner")
+        post_proxy.update_send_to("User")
+        post_proxy.update_message(f"reply to {user_query}")
+        return post_proxy.end()
+
+
+def test_send_message_async(tmp_path):
+    app_injector = Injector([LoggingModule, PluginModule, RoleModule, ExecutionServiceModule])
+    app_config = AppConfigSource(
+        config={
+            "llm.api_key": "test_key",
+            "execution_service.kernel_mode": "local",
+        },
+        app_base_path=str(tmp_path),
+    )
+    app_injector.binder.bind(AppConfigSource, to=app_config)
+
+    async def main():
+        started: List[str] = []
+        all_started = asyncio.Event()
+        sessions: List[Session] = []
+        planners: List[FakePlanner] = []
+        for session_id in ["session-1", "session-2"]:
+            session = app_injector.create_object(Session, {"session_id": session_id})
+            session._init()
+            planner = FakePlanner(session.event_emitter, started, all_started)
+            # the roles are set up front, so that the round only runs the fake planner
+            session._planner = planner  # type: ignore
+            session._worker_instances = {"CodeInterpreter": FakeRole("CodeInterpreter")}  # type: ignore
+            sessions.append(session)
+            planners.append(planner)
+
+        handler = RecordingHandler()
+        rounds = await asyncio.gather(
+            sessions[0].send_message_async("hello", handler),
+            sessions[1].send_message_async("world", handler),
+        )
+        return threading.get_ident(), handler, planners, rounds
+
+    loop_thread, handler, planners, rounds = asyncio.run(main())
+
+    assert [r.state for r in rounds] == ["finished", "finished"]
+    assert [r.post_list[-1].message for r in rounds] == ["reply to hello", "reply to world"]
+    # the rounds run concurrently on the event loop thread, without worker threads
+    assert [t for p in planners for t in p.threads] == [loop_thread, loop_thread]
+    # the events are delivered on the event loop thread
+    assert set(handler.threads) == {loop_thread}
+    assert sorted(e.msg for e in handler.events if e.t == PostEventType.post_message_update) == [
+        "reply to hello",
+        "reply to world",
+    ]
@@ -0,0 +1,45 @@
+import os
+
+from injector import Injector
+
+from taskweaver.config.config_mgt import AppConfigSource
+from taskweaver.logging import LoggingModule
+from taskweaver.memory.plugin import PluginModule
+from taskweaver.module.execution_service import ExecutionServiceModule
+from taskweaver.role.role import RoleModule
+from taskweaver.session.session import Session
+
+
+def test_session_lazy_init(tmp_path):
+    app_injector = Injector([LoggingModule, PluginModule, RoleModule, ExecutionServiceModule])
+    app_config = AppConfigSource(
+        config={
+            "llm.api_key": "test_key",
+            "execution_service.kernel_mode": "local",
+            "session.roles": ["planner", "code_interpreter"],
+            "plugin.base_path": os.path.join(os.path.dirname(os.path.abspath(__file__)), "data/plugins"),
+        },
+        app_base_path=str(tmp_path),
+    )
+    app_injector.binder.bind(AppConfigSource, to=app_config)
+
+    session = app_injector.create_object(Session, {"session_id": "test-session"})
+
+    # nothing is created until the session is used
+    assert session._session_injector is None
+    assert session._worker_instances is None
+    assert not os.path.exists(session.workspace)
+
+    session.update_session_var({"datasource_id": "1"})
+    assert session.session_var == {"datasource_id": "1"}
+    assert session._worker_instances is None
+
+    # the roles are created on first use, and receive the session variables updated before
+    code_interpreter = session.worker_instances["CodeInterpreter"]
+    assert session.planner.workers["CodeInterpreter"] is code_interpreter
+    assert os.path.exists(session.execution_cwd)
+    assert code_interpreter.executor.pending_session_variables == {"datasource_id": "1"}
+    # the execution client is only created when the code is executed
+    assert code_interpreter.executor._exec_client is None
+
+    session.stop()
@@ -0,0 +1,53 @@
+import time
+
+from taskweaver.app.session_pool import SessionPool
+
+
+class DummySession:
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.warmed_up = False
+        self.stopped = False
+
+    def warm_up(self):
+        self.warmed_up = True
+
+    def stop(self):
+        self.stopped = True
+
+
+def wait_until(predicate, timeout: float = 5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_session_pool():
+    created = []
+
+    def factory():
+        session = DummySession(f"session-{len(created)}")
+        created.append(session)
+        return session
+
+    pool = SessionPool(factory, pool_size=2)  # type: ignore
+    assert pool.acquire() is None
+
+    pool.start()
+    assert wait_until(lambda: pool.size() == 2)
+
+    session = pool.acquire()
+    assert session is not None
+    assert session.warmed_up
+
+    # the pool is replenished in the background
+    assert wait_until(lambda: pool.size() == 2)
+    assert len(created) == 3
+
+    pool.stop()
+    assert pool.size() == 0
+    assert not session.stopped
+    assert all(s.stopped for s in created if s is not session)
@@ -0,0 +1,129 @@
+import os
+import time
+
+from taskweaver.app.session_store import BoundedSessionStore, InMemorySessionStore
+from taskweaver.memory import Memory
+
+
+class DummySession:
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.memory = Memory(session_id=session_id)
+        self.memory.create_round(user_query=f"hello from {session_id}")
+        self.last_active_time = time.time()
+        self.in_progress = False
+        self.stopped = False
+
+    def stop(self):
+        self.stopped = True
+
+
+def test_bounded_session_store_lru(tmp_path):
+    store = BoundedSessionStore(max_sessions=2, snapshot_dir=str(tmp_path))
+    sessions = [DummySession(f"s{i}") for i in range(3)]
+
+    store.set_session("s0", sessions[0])  # type: ignore
+    store.set_session("s1", sessions[1])  # type: ignore
+    time.sleep(0.01)
+    # access s0 so that s1 becomes the least recently used one
+    assert store.get_session("s0") is sessions[0]
+    store.set_session("s2", sessions[2])  # type: ignore
+
+    assert store.list_all_session_ids() == ["s0", "s2"]
+    assert sessions[1].stopped
+    assert not sessions[0].stopped
+
+    snapshot_path = store.get_snapshot_path("s1")
+    assert snapshot_path is not None and os.path.exists(snapshot_path)
+    restored = Memory(session_id="s1").from_yaml("s1", snapshot_path)
+    assert restored.conversation.rounds[0].user_query == "hello from s1"
+    assert store.get_snapshot_path("s0") is None
+
+
+def test_bounded_session_store_idle_timeout():
+    store = BoundedSessionStore(max_sessions=10, idle_timeout=1)
+    idle_session = DummySession("idle")
+    busy_session = DummySession("busy")
+    busy_session.in_progress = True
+
+    store.set_session("idle", idle_session)  # type: ignore
+    store.set_session("busy", busy_session)  # type: ignore
+    idle_session.last_active_time = busy_session.last_active_time = time.time() - 10
+    store.last_access = {k: time.time() - 10 for k in store.last_access}
+
+    assert store.reap_idle_sessions() == ["idle"]
+    assert idle_session.stopped
+    assert store.has_session("busy")
+    assert store.get_snapshot_path("idle") is None
+
+
+def test_in_memory_session_store_evict():
+    store = InMemorySessionStore()
+    session = DummySession("s0")
+    store.set_session("s0", session)  # type: ignore
+    store.evict_session("s0")
+    assert session.stopped
+    assert not store.has_session("s0")
+
+
+def test_bounded_session_store_remove_twice():
+    store = BoundedSessionStore(max_sessions=2)
+    store.set_session("s0", DummySession("s0"))  # type: ignore
+    store.remove_session("s0")
+    # e.g., evicted by the idle reaper between the lookup and the removal of stop_session
+    store.remove_session("s0")
+    assert not store.has_session("s0")
+
+
+def test_bounded_session_store_snapshot_limits(tmp_path):
+    store = BoundedSessionStore(max_sessions=1, snapshot_dir=str(tmp_path), snapshot_max_age=60, max_snapshots=2)
+    for i in range(4):
+        store.set_session(f"s{i}", DummySession(f"s{i}"))  # type: ignore
+        snapshot_path = store.get_snapshot_path(f"s{i - 1}")
+        if snapshot_path is not None:
+            # make the order of the snapshots deterministic
+            os.utime(snapshot_path, (time.time() - 10 + i, time.time() - 10 + i))
+
+    # s0, s1 and s2 were evicted, only the 2 newest snapshots are kept
+    store.prune_snapshots()
+    assert store.get_snapshot_path("s0") is None
+    assert store.get_snapshot_path("s1") is not None
+    assert store.get_snapshot_path("s2") is not None
+
+    # an expired snapshot is not restored
+    old = time.time() - 120
+    os.utime(store.get_snapshot_path("s1"), (old, old))  # type: ignore
+    assert store.get_snapshot_path("s1") is None
+    assert sorted(os.listdir(tmp_path)) == ["s2.yaml"]
+
+    store.remove_snapshot("s2")
+    store.remove_snapshot("s2")
+    assert os.listdir(tmp_path) == []
+
+
+def test_session_manager_deletes_snapshots(tmp_path):
+    from taskweaver.app.session_manager import SessionManager
+
+    class DummyInjector:
+        def create_object(self, cls, kwargs):
+            session = DummySession(kwargs["session_id"])
+            session.restore_memory = lambda path: None  # type: ignore
+            return session
+
+    class DummyConfig:
+        pool_size = 0
+
+    store = BoundedSessionStore(max_sessions=1, snapshot_dir=str(tmp_path))
+    manager = SessionManager(store, DummyInjector(), DummyConfig(), None)  # type: ignore
+
+    store.set_session("s0", DummySession("s0"))  # type: ignore
+    store.set_session("s1", DummySession("s1"))  # type: ignore
+    assert store.get_snapshot_path("s0") is not None
+
+    # a restored session does not keep its snapshot
+    manager.get_session("s0")
+    assert store.get_snapshot_path("s0") is None
+    # s1 is evicted by the restore, stopping it deletes its snapshot
+    assert store.get_snapshot_path("s1") is not None
+    manager.stop_session("s1")
+    assert os.listdir(tmp_path) == []
@@ -1,3 +1,4 @@
+import asyncio
 from random import randint
 from typing import Iterator
 
@@ -144,3 +145,25 @@ def test_post_to_raw_text():
         if_format_send_to=True,
     )
     assert prompt == response_str1
+
+
+def test_parse_llm_async():
+    async def llm_output():
+        # the chunks arrive one by one, as from a streamed LLM response
+        words = response_str1.split(" ")
+        for i in range(0, len(words), 3):
+            await asyncio.sleep(0)
+            yield format_chat_message("assistant", " ".join(words[i : i + 3]) + " ")
+
+    event_emitter = SessionEventEmitter()
+    event_emitter.start_round("test_round")
+
+    post_proxy = event_emitter.create_post_proxy("CodeInterpreter")
+    asyncio.run(translator.raw_text_to_post_async(llm_output=llm_output(), post_proxy=post_proxy))
+    response = post_proxy.end()
+
+    assert response.message == "This is the message"
+    assert response.send_to == "Planner"
+    assert len(response.attachment_list) == 6
+    assert response.attachment_list[1].type == AttachmentType.python
+    assert response.attachment_list[1].content == "print('This is the code')"
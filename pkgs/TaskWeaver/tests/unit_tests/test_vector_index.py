@@ -0,0 +1,68 @@
+import os
+
+import numpy as np
+import pytest
+
+from taskweaver.memory.vector_index import VectorIndex
+
+
+def test_vector_index_exact():
+    index = VectorIndex()
+    index.add(["a", "b", "c"], [[1.0, 0.0], [0.0, 2.0], [1.0, 1.0]], [{"n": 1}, {"n": 2}, {"n": 3}])
+    assert len(index) == 3
+
+    results = index.search([1.0, 0.1])
+    assert [id for id, _ in results] == ["a", "c", "b"]
+    assert abs(results[0][1] - 0.995) < 1e-3
+
+    assert [id for id, _ in index.search([1.0, 0.1], top_k=2)] == ["a", "c"]
+    assert [id for id, _ in index.search([1.0, 0.1], threshold=0.5)] == ["a", "c"]
+
+    # replace and delete
+    index.add(["a"], [[0.0, 1.0]], [{"n": 4}])
+    index.delete(["b"])
+    assert index.ids == ["c", "a"]
+    assert index.metadata == {"c": {"n": 3}, "a": {"n": 4}}
+    assert [id for id, _ in index.search([0.0, 1.0])] == ["a", "c"]
+
+
+def test_vector_index_persistence(tmp_path):
+    index = VectorIndex()
+    index.add(["a", "b"], [[1.0, 0.0], [0.0, 1.0]], [{"text": "x"}, {"text": "y"}])
+    path = str(tmp_path / "index.npz")
+    index.save(path)
+
+    loaded = VectorIndex().load(path)
+    assert loaded.ids == ["a", "b"]
+    assert loaded.metadata == {"a": {"text": "x"}, "b": {"text": "y"}}
+    assert [id for id, _ in loaded.search([0.1, 1.0])] == ["b", "a"]
+    assert os.listdir(tmp_path) == ["index.npz"]
+
+    # a failed save keeps the previous file and leaves no temporary file behind
+    index.metadata["a"] = {"text": object()}
+    with pytest.raises(TypeError):
+        index.save(path)
+    assert os.listdir(tmp_path) == ["index.npz"]
+    assert VectorIndex().load(path).metadata["a"] == {"text": "x"}
+
+
+def test_vector_index_ivf():
+    rng = np.random.default_rng(1)
+    embeddings = rng.normal(size=(2000, 16))
+    ids = [str(i) for i in range(len(embeddings))]
+
+    exact = VectorIndex()
+    exact.add(ids, embeddings.tolist())
+    ivf = VectorIndex(mode="ivf", nprobe=8, ivf_min_size=100)
+    ivf.add(ids, embeddings.tolist())
+
+    query = embeddings[42] + rng.normal(scale=0.01, size=16)
+    assert ivf.search(query, top_k=1)[0][0] == "42"
+    assert exact.search(query, top_k=1)[0][0] == "42"
+    assert ivf.centroids is not None
+
+    # incremental add and delete keep the cluster assignments in sync
+    ivf.add(["new"], [(-embeddings[42]).tolist()])
+    ivf.delete(["42"])
+    assert len(ivf.assignments) == len(ivf)
+    assert ivf.search(-embeddings[42], top_k=1)[0][0] == "new"